@@ -9,13 +9,17 @@ extern "C" {
 
 class FuseWave : public LedAnimation {
 public:
-    FuseWave(pixel_t* ledstrip_buffer, uint32_t length, uint8_t r, uint8_t g, uint8_t b, uint32_t BPM, float beatPercentage);
+    static constexpr uint8_t DEFAULT_CHUNK_SIZE = 5;
+
+    // chunkSize 0 uses DEFAULT_CHUNK_SIZE (the controller sends 0 when a mapping has none)
+    FuseWave(pixel_t* ledstrip_buffer, uint32_t length, uint8_t r, uint8_t g, uint8_t b, uint32_t BPM, float beatPercentage,
+             uint8_t chunkSize = 0);
 
     void start() override;
     bool act_frame() override;
     void stop() override;
 
 private:
-    uint8_t chunkSize = 5; // Number of LEDs to light up at once
+    uint8_t chunkSize; // Number of LEDs to light up at once
 
 };
@@ -47,6 +47,9 @@ public:
     bool active = false;
     bool started = false;
     float frameTime;
+    int64_t startAtUs = 0;  // local esp_timer time to start at, 0 = immediately
+    uint8_t repeats = 1;  // times the task plays the animation, one repeatIntervalUs apart
+    int64_t repeatIntervalUs = 0;  // one beat: a repeated sequence step restarts on every beat
 
 protected:
     pixel_t* LED_STRIP_BUFFER;
@@ -10,7 +10,8 @@ extern "C" {
 }
 
 
-FuseWave::FuseWave(pixel_t* ledstrip_buffer, uint32_t length, uint8_t r, uint8_t g, uint8_t b, uint32_t BPM, float beatPercentage)
+FuseWave::FuseWave(pixel_t* ledstrip_buffer, uint32_t length, uint8_t r, uint8_t g, uint8_t b, uint32_t BPM, float beatPercentage,
+                   uint8_t chunkSize)
             : LedAnimation(ledstrip_buffer, length){
     this->red = r;
     this->green = g;
@@ -18,14 +19,18 @@ FuseWave::FuseWave(pixel_t* ledstrip_buffer, uint32_t length, uint8_t r, uint8_t
  
     this->beatPercentage = beatPercentage  ; 
 
+    this->chunkSize = chunkSize ? chunkSize : DEFAULT_CHUNK_SIZE;
+
     this->beatTime = 60000 / BPM; // Convert BPM to milliseconds per beat
-    this->numFrames =  ledcount / chunkSize; // Calculate number of frames based on chunk size
+    this->numFrames =  ledcount / this->chunkSize; // Calculate number of frames based on chunk size
+    if (this->numFrames == 0)
+        this->numFrames = 1; // chunk longer than the strip: light it all in one frame
     
     this->frameTime = this->beatTime * this->beatPercentage / this->numFrames;
     this->frameTime = std::round(this->frameTime * 100.0) / 100.0; // Round to 2 decimal places
 
 
-    ESP_LOGI("FuseWave", "BPM: %u, Beat Time: %f ms, Frame Time: %f ms", BPM, this->beatTime, this->frameTime);
+    ESP_LOGI("FuseWave", "BPM: %u, Chunk: %u, Beat Time: %f ms, Frame Time: %f ms", BPM, this->chunkSize, this->beatTime, this->frameTime);
    
     }
 
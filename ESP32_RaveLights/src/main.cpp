@@ -2,6 +2,7 @@
 
 extern "C" {
     #include <stdio.h>
+    #include <stdlib.h>   // malloc, free
     #include "freertos/FreeRTOS.h"
     #include "freertos/task.h"
     #include "freertos/semphr.h"
@@ -12,6 +13,7 @@ extern "C" {
     
     #include "esp_log.h"
     #include "esp_err.h"
+    #include "esp_timer.h"
 
     // wifi stuff
     #include <sys/socket.h>   // socket, connect, send, recv
@@ -34,6 +36,8 @@ extern "C" {
 #include "animations/fuse_wave.hpp"
 #include "animations/blink.hpp"
 
+#include <algorithm>
+
 // GPIO Definitions
 #define BUTTON1_GPIO GPIO_NUM_23
 #define BUTTON2_GPIO GPIO_NUM_22
@@ -52,13 +56,25 @@ led_strip_handle_t led_strip = NULL;
 #include "credientials.h"  //create file in same dictory as this file
 #define SERVER_IP "10.0.0.29"
 #define SERVER_PORT 6000
+
+// UDP multicast stream (see RaveControllerApp/udp_transport.py): band frames and beat pulses
+#define UDP_STREAM_ENABLED 1
+#define UDP_MULTICAST_GROUP "239.255.42.99"
+#define UDP_STREAM_PORT 6002
+#define UDP_DATAGRAM_VERSION 1
+#define UDP_DATAGRAM_HEADER_SIZE 15   // "RG", u8 version, u32 seq, u64 sent_us
+
+// Groups this strip belongs to, sent in the hello so the controller can address it,
+// e.g. "\"stage-left\",\"ceiling\"". Leave empty for no groups.
+#define STRIP_TAGS ""
+
 char esp32_mac_str[18] = {0}; 
 
 
 //Handling Input for Lighting Commands
 #define MAX_ANIM_PRIORITY 7
 
-#define MAX_LED_TASKS 5
+#define MAX_LED_TASKS 12   // animation tasks alive at once (2 KB stack each), further triggers are dropped
 typedef enum {
     CMD_FUSE_WAVE,
     CMD_BLINK_LEDS
@@ -66,6 +82,7 @@ typedef enum {
 
 QueueHandle_t inputQueue;
 SemaphoreHandle_t led_strip_mutex = NULL;
+SemaphoreHandle_t animation_task_slots = NULL;  // counts free slots out of MAX_LED_TASKS
 pixel_t LED_STRIP_BUFFER[LED_STRIP_LENGTH] = {};  //init to all 0
 
 
@@ -75,13 +92,59 @@ pixel_t LED_STRIP_BUFFER[LED_STRIP_LENGTH] = {};  //init to all 0
 int BPM = 128;  //default BPM
 
 
+//// WIRE PROTOCOL (see RaveControllerApp/wire_protocol.py)
+// Frame: u16 length | u8 version | u8 type | body   (little endian)
+#define WIRE_PROTOCOL_VERSION 1
+#define WIRE_MSG_ANIMATION 0x01
+#define WIRE_MSG_BAND_FRAME 0x02
+#define WIRE_MSG_BEAT_PULSE 0x03            // u32 beat_index, f32 bpm
+#define WIRE_MSG_SCHEDULED_ANIMATION 0x04   // u64 start_at_us (server clock) + animation body
+#define WIRE_MSG_SEQUENCE 0x05              // u64 start_at_us, u8 count, count x (u32 offset_ms, u8 repeats, animation body)
+#define WIRE_SEQUENCE_HEADER_SIZE 9
+#define WIRE_SEQUENCE_STEP_SIZE (5 + WIRE_ANIMATION_BODY_SIZE)
+#define MAX_SEQUENCE_STEPS 8
+#define WIRE_MSG_PIXEL_FRAME 0x06   // u32 seq, u16 num_leds, rgb[num_leds] rendered by the controller
+#define WIRE_PIXEL_FRAME_HEADER_SIZE 6
+#define STREAM_PIXELS_TIMEOUT_US 200000   // host pixels are dropped if no frame arrived for this long
+#define WIRE_MSG_JSON 0x07   // JSON object without newline: control messages on the binary protocol
+#define WIRE_MAX_FRAME_SIZE 2048   // receive buffer, length prefix included (wire_protocol.MAX_FRAME_SIZE)
+#define WIRE_TRIGGER_ID_SIZE 4   // optional u32 after command bodies, answered with an ack
+#define WIRE_BAND_FRAME_HEADER_SIZE 14  // u32 seq, u32 position_ms, f32 bpm, u8 beat_phase, u8 num_bands
+#define MAX_STREAM_BANDS 32
+#define WIRE_ANIMATION_BODY_SIZE 11   // u8 anim, u8 r, u8 g, u8 b, u16 BPM, f32 beatPercentage, u8 chunkSize
+#define WIRE_ANIM_FUSEWAVE 0
+#define WIRE_ANIM_BLINK 1
+
+bool binary_protocol = false;  // set once the server acks our "bin1" offer
+
+// Server clock minus local esp_timer clock, from the sync handshake
+int64_t server_offset_us = 0;
+bool clock_synced = false;
+#define CLOCK_RESYNC_INTERVAL_US 30000000   // repeat the handshake to follow clock drift
+#define RECV_TIMEOUT_MS 1000                // recv wakes up at least this often to resync
+int server_sock = -1;  // connected controller socket, for replies (sync, acks)
+
+// Latest audio-reactive stream frame (see RaveControllerApp/stream_relay.py)
+uint8_t stream_levels[MAX_STREAM_BANDS] = {};
+uint8_t stream_num_bands = 0;
+float stream_beat_phase = 0;
+int64_t stream_levels_time_us = 0;
+#define STREAM_LEVELS_TIMEOUT_US 500000   // band levels stop rendering if no frame arrived for this long
+
+// Host-rendered pixels (MSG_PIXEL_FRAME), blended over the local animations
+pixel_t stream_pixels[LED_STRIP_LENGTH];
+int64_t stream_pixels_time_us = 0;
+
+
 ////
 
 
 
 // Forward Declarations
 void animation_task(void *pvParameters);
+void ProcessMessage(const char *json_str);
 void tcp_client_task(void *pvParameters);
+void udp_stream_task(void *pvParameters);
 
 static const char *TAG = "ESP32";
 
@@ -134,8 +197,16 @@ static void event_handler(void* arg, esp_event_base_t event_base,
     {
         ip_event_got_ip_t* event = (ip_event_got_ip_t*) event_data;
         ESP_LOGI(TAG, "Got IP:" IPSTR, IP2STR(&event->ip_info.ip));
-        // Safe to start TCP client task now
-        xTaskCreate(tcp_client_task, "tcp_client", 4096, NULL, 5, NULL);
+        // Safe to start TCP client task now. It reconnects by itself and owns static
+        // receive buffers, so a second GOT_IP after a Wi-Fi drop must not start another.
+        static TaskHandle_t tcp_task = NULL;
+        if (tcp_task == NULL)
+            xTaskCreate(tcp_client_task, "tcp_client", 4096, NULL, 5, &tcp_task);
+#if UDP_STREAM_ENABLED
+        static TaskHandle_t udp_task = NULL;  // the socket survives reconnects, start it once
+        if (udp_task == NULL)
+            xTaskCreate(udp_stream_task, "udp_stream", 4096, NULL, 5, &udp_task);
+#endif
     }
 }
 
@@ -175,17 +246,244 @@ void wifi_init_sta(void)
 
 /////// MESSSAGE PARSING FUNCTIONs ////
 
-void ProcessMessage(const char *json_str) {
-    cJSON *root = cJSON_Parse(json_str);
-    if (!root) {
-        ESP_LOGE("JSON", "Failed to parse JSON");
+// Convert a server-clock start time to local time (0 = start immediately)
+int64_t LocalStartTime(int64_t start_at_server_us)
+{
+    if (start_at_server_us <= 0 || !clock_synced)
+        return 0;
+    return start_at_server_us - server_offset_us;
+}
+
+// Run an animation on its own task, which deletes it when done. Takes ownership of animation.
+void SpawnAnimationTask(LedAnimation *animation, const char *name)
+{
+    if (xSemaphoreTake(animation_task_slots, 0) != pdTRUE) {
+        ESP_LOGW(TAG, "%d animations already running, dropping %s", MAX_LED_TASKS, name);
+        delete animation;
+        return;
+    }
+    if (xTaskCreate(animation_task, name, 2048, animation, MAX_ANIM_PRIORITY, NULL) != pdPASS) {
+        ESP_LOGE(TAG, "Failed to create %s", name);
+        delete animation;
+        xSemaphoreGive(animation_task_slots);
+    }
+}
+
+void StartAnimation(uint8_t animation, int r, int g, int b, int bpm, float beatPercentage, uint8_t chunkSize,
+                    int64_t start_at_local_us = 0, uint8_t repeats = 1)
+{
+    if (bpm <= 0) {
+        ESP_LOGE(TAG, "Invalid BPM %d", bpm);
+        return;
+    }
+
+    LedAnimation *led_animation;
+    const char *name;
+    if (animation == WIRE_ANIM_FUSEWAVE)
+    {
+        ESP_LOGI(TAG, "Creating FuseWave: r=%d g=%d b=%d BPM=%d chunk=%u x%u", r, g, b, bpm, chunkSize, repeats);
+        led_animation = new FuseWave(LED_STRIP_BUFFER, LED_STRIP_LENGTH, r, g, b, bpm, beatPercentage, chunkSize);
+        name = "FuseWaveTask";
+    }
+    else if (animation == WIRE_ANIM_BLINK)
+    {
+        ESP_LOGI(TAG, "Creating Blink: r=%d g=%d b=%d BPM=%d x%u", r, g, b, bpm, repeats);
+        led_animation = new Blink(LED_STRIP_BUFFER, LED_STRIP_LENGTH, r, g, b, bpm, beatPercentage);
+        name = "BlinkTask";
+    }
+    else
+    {
+        ESP_LOGW(TAG, "Unknown animation id %u", animation);
+        return;
+    }
+
+    led_animation->startAtUs = start_at_local_us;
+    led_animation->repeats = repeats ? repeats : 1;
+    led_animation->repeatIntervalUs = 60000000LL / bpm;
+    SpawnAnimationTask(led_animation, name);
+}
+
+// Local start time of a sequence: the scheduled time if there is one, otherwise now
+int64_t SequenceBaseTime(int64_t start_at_server_us)
+{
+    int64_t local = LocalStartTime(start_at_server_us);
+    return local > 0 ? local : esp_timer_get_time();
+}
+
+// Start a clock-offset handshake, answered by a "sync" message (see server.answer_sync)
+void SendSyncRequest()
+{
+    char sync_request[64];
+    snprintf(sync_request, sizeof(sync_request), "{\"type\":\"sync\",\"t0\":%lld}\n", esp_timer_get_time());
+    if (server_sock >= 0)
+        send(server_sock, sync_request, strlen(sync_request), 0);
+}
+
+// Tell the controller a tagged trigger has been started (latency instrumentation)
+void SendAck(uint32_t trigger_id)
+{
+    char ack[48];
+    snprintf(ack, sizeof(ack), "{\"type\":\"ack\",\"trg\":%lu}\n", (unsigned long)trigger_id);
+    if (server_sock >= 0)
+        send(server_sock, ack, strlen(ack), 0);
+}
+
+// Handle the optional trailing trigger id of a command body of base_len bytes
+bool AckIfTagged(const uint8_t *body, size_t body_len, size_t base_len)
+{
+    if (body_len == base_len)
+        return true;
+    if (body_len != base_len + WIRE_TRIGGER_ID_SIZE)
+        return false;
+    uint32_t trigger_id;
+    memcpy(&trigger_id, body + base_len, sizeof(trigger_id));
+    SendAck(trigger_id);
+    return true;
+}
+
+// Keep the newest band frame for RenderBandLevels (called at stream rate, no logging)
+void StoreBandLevels(const uint8_t *levels, uint8_t num_bands, float beat_phase)
+{
+    if (xSemaphoreTake(led_strip_mutex, portMAX_DELAY) == pdTRUE) {
+        memcpy(stream_levels, levels, num_bands);
+        stream_num_bands = num_bands;
+        stream_beat_phase = beat_phase;
+        stream_levels_time_us = esp_timer_get_time();
+        xSemaphoreGive(led_strip_mutex);
+    }
+}
+
+void ProcessBinaryMessage(const uint8_t *frame, size_t len)
+{
+    // frame points at the version byte, len excludes the length prefix
+    if (len < 2 || frame[0] != WIRE_PROTOCOL_VERSION) {
+        ESP_LOGE(TAG, "Bad binary frame (len=%u)", (unsigned)len);
         return;
     }
 
+    uint8_t type = frame[1];
+    const uint8_t *body = frame + 2;
+    size_t body_len = len - 2;
+
+    if (type == WIRE_MSG_ANIMATION && body_len >= WIRE_ANIMATION_BODY_SIZE)
+    {
+        uint16_t bpm;
+        float beatPercentage;
+        memcpy(&bpm, body + 4, sizeof(bpm));
+        memcpy(&beatPercentage, body + 6, sizeof(beatPercentage));
+        StartAnimation(body[0], body[1], body[2], body[3], bpm, beatPercentage, body[10]);
+        if (!AckIfTagged(body, body_len, WIRE_ANIMATION_BODY_SIZE))
+            ESP_LOGW(TAG, "Animation body has unexpected length %u", (unsigned)body_len);
+    }
+    else if (type == WIRE_MSG_SCHEDULED_ANIMATION && body_len >= 8 + WIRE_ANIMATION_BODY_SIZE)
+    {
+        int64_t start_at;
+        uint16_t bpm;
+        float beatPercentage;
+        memcpy(&start_at, body, sizeof(start_at));
+        const uint8_t *anim = body + 8;
+        memcpy(&bpm, anim + 4, sizeof(bpm));
+        memcpy(&beatPercentage, anim + 6, sizeof(beatPercentage));
+        StartAnimation(anim[0], anim[1], anim[2], anim[3], bpm, beatPercentage, anim[10], LocalStartTime(start_at));
+        if (!AckIfTagged(body, body_len, 8 + WIRE_ANIMATION_BODY_SIZE))
+            ESP_LOGW(TAG, "Scheduled animation body has unexpected length %u", (unsigned)body_len);
+    }
+    else if (type == WIRE_MSG_SEQUENCE && body_len >= WIRE_SEQUENCE_HEADER_SIZE)
+    {
+        int64_t start_at;
+        memcpy(&start_at, body, sizeof(start_at));
+        uint8_t count = body[8];
+        size_t steps_len = WIRE_SEQUENCE_HEADER_SIZE + (size_t)count * WIRE_SEQUENCE_STEP_SIZE;
+        if (count > MAX_SEQUENCE_STEPS || (body_len != steps_len && body_len != steps_len + WIRE_TRIGGER_ID_SIZE)) {
+            ESP_LOGE(TAG, "Bad sequence (%u steps, len=%u)", count, (unsigned)body_len);
+            return;
+        }
+
+        int64_t base = SequenceBaseTime(start_at);
+        for (uint8_t i = 0; i < count; i++)
+        {
+            const uint8_t *step = body + WIRE_SEQUENCE_HEADER_SIZE + i * WIRE_SEQUENCE_STEP_SIZE;
+            uint32_t offset_ms;
+            uint16_t bpm;
+            float beatPercentage;
+            memcpy(&offset_ms, step, sizeof(offset_ms));
+            uint8_t repeats = step[4];
+            const uint8_t *anim = step + 5;
+            memcpy(&bpm, anim + 4, sizeof(bpm));
+            memcpy(&beatPercentage, anim + 6, sizeof(beatPercentage));
+            StartAnimation(anim[0], anim[1], anim[2], anim[3], bpm, beatPercentage, anim[10],
+                           base + (int64_t)offset_ms * 1000, repeats);
+        }
+        AckIfTagged(body, body_len, steps_len);
+    }
+    else if (type == WIRE_MSG_PIXEL_FRAME && body_len >= WIRE_PIXEL_FRAME_HEADER_SIZE)
+    {
+        // Arrives at render rate: copy only, no logging
+        uint16_t num_leds;
+        memcpy(&num_leds, body + 4, sizeof(num_leds));
+        if (body_len != WIRE_PIXEL_FRAME_HEADER_SIZE + (size_t)num_leds * 3)
+            return;
+        if (num_leds > LED_STRIP_LENGTH)
+            num_leds = LED_STRIP_LENGTH;
+        if (xSemaphoreTake(led_strip_mutex, portMAX_DELAY) == pdTRUE) {
+            memcpy(stream_pixels, body + WIRE_PIXEL_FRAME_HEADER_SIZE, (size_t)num_leds * 3);
+            memset(stream_pixels + num_leds, 0, (LED_STRIP_LENGTH - num_leds) * sizeof(pixel_t));
+            stream_pixels_time_us = esp_timer_get_time();
+            xSemaphoreGive(led_strip_mutex);
+        }
+    }
+    else if (type == WIRE_MSG_BAND_FRAME && body_len >= WIRE_BAND_FRAME_HEADER_SIZE)
+    {
+        // Arrives at stream rate: store only, no logging
+        float bpm;
+        memcpy(&bpm, body + 8, sizeof(bpm));
+        uint8_t num_bands = body[13];
+        if (num_bands > MAX_STREAM_BANDS || body_len != WIRE_BAND_FRAME_HEADER_SIZE + (size_t)num_bands)
+            return;
+        if (bpm > 0)
+            BPM = (int)(bpm + 0.5f);
+        StoreBandLevels(body + WIRE_BAND_FRAME_HEADER_SIZE, num_bands, body[12] / 256.0f);
+    }
+    else if (type == WIRE_MSG_BEAT_PULSE && body_len == 8)
+    {
+        // Arrives once per beat: only the tempo is used
+        float bpm;
+        memcpy(&bpm, body + 4, sizeof(bpm));
+        if (bpm > 0)
+            BPM = (int)(bpm + 0.5f);
+    }
+    else if (type == WIRE_MSG_JSON)
+    {
+        // Sync replies and messages without a binary encoding. Reached from both the TCP
+        // and the UDP task, so the terminated copy is per call rather than a shared buffer.
+        if (body_len >= WIRE_MAX_FRAME_SIZE)
+            return;
+        char *json_str = (char *)malloc(body_len + 1);
+        if (json_str == NULL) {
+            ESP_LOGE(TAG, "No memory for a %u byte JSON message", (unsigned)body_len);
+            return;
+        }
+        memcpy(json_str, body, body_len);
+        json_str[body_len] = 0;
+        ProcessMessage(json_str);
+        free(json_str);
+    }
+    else
+    {
+        ESP_LOGW(TAG, "Unhandled binary message type %u (len=%u)", type, (unsigned)body_len);
+    }
+}
+
+// Start one animation described by a JSON object (a whole message or a sequence step)
+void StartAnimationJson(cJSON *root, int64_t start_at_local)
+{
+    cJSON *repeats_item = cJSON_GetObjectItem(root, "repeats");  // optional, sequence steps only
+    uint8_t repeats = (repeats_item && cJSON_IsNumber(repeats_item) && repeats_item->valueint > 0 && repeats_item->valueint <= 255)
+                      ? (uint8_t)repeats_item->valueint : 1;
+
     cJSON *anim_item = cJSON_GetObjectItem(root, "Animation");
     if (!anim_item || !cJSON_IsString(anim_item)) {
         ESP_LOGE("JSON", "Animation field missing or not a string");
-        cJSON_Delete(root);
         return;
     }
 
@@ -210,18 +508,119 @@ void ProcessMessage(const char *json_str) {
             int b = b_item->valueint;
             int bpm = bpm_item->valueint;
             float beatPercentage = beatPercent_item->valuedouble;
+            cJSON *chunk_item = cJSON_GetObjectItem(root, "chunkSize");  // optional, 0 = default
+            uint8_t chunkSize = (chunk_item && cJSON_IsNumber(chunk_item) && chunk_item->valueint > 0 && chunk_item->valueint <= 255)
+                                ? (uint8_t)chunk_item->valueint : 0;
 
-
-            ESP_LOGI(TAG, "Creating FuseWave: r=%d g=%d b=%d BPM=%d", r, g, b, bpm);
-            FuseWave* fusewave = new FuseWave(LED_STRIP_BUFFER, LED_STRIP_LENGTH, r, g, b, bpm, beatPercentage);
-            xTaskCreate(animation_task, "FuseWaveTask", 2048, fusewave, MAX_ANIM_PRIORITY, NULL);
+            StartAnimation(WIRE_ANIM_FUSEWAVE, r, g, b, bpm, beatPercentage, chunkSize, start_at_local, repeats);
         }
     }
     else if (strcmp(animation_type, "Blink") == 0)      //Blink
     {
-        
+        cJSON *r_item = cJSON_GetObjectItem(root, "r");
+        cJSON *g_item = cJSON_GetObjectItem(root, "g");
+        cJSON *b_item = cJSON_GetObjectItem(root, "b");
+        cJSON *bpm_item = cJSON_GetObjectItem(root, "BPM");
+        cJSON *beatPercent_item = cJSON_GetObjectItem(root, "beatPercentage");
+
+        if (!r_item || !g_item || !b_item || !bpm_item || !beatPercent_item) {
+            ESP_LOGE("JSON", "Missing required parameters for Blink");
+        } else {
+            StartAnimation(WIRE_ANIM_BLINK, r_item->valueint, g_item->valueint, b_item->valueint,
+                           bpm_item->valueint, beatPercent_item->valuedouble, 0, start_at_local, repeats);
+        }
+    }
+    else if (strcmp(animation_type, "Sequence") == 0)   //Sequence of steps from one trigger
+    {
+        cJSON *steps = cJSON_GetObjectItem(root, "steps");
+        if (!steps || !cJSON_IsArray(steps) || cJSON_GetArraySize(steps) > MAX_SEQUENCE_STEPS) {
+            ESP_LOGE("JSON", "Sequence steps missing or too many");
+            return;
+        }
+
+        int64_t base = start_at_local > 0 ? start_at_local : esp_timer_get_time();
+        cJSON *step;
+        cJSON_ArrayForEach(step, steps)
+        {
+            cJSON *offset_item = cJSON_GetObjectItem(step, "offsetMs");
+            int64_t offset_ms = (offset_item && cJSON_IsNumber(offset_item)) ? (int64_t)offset_item->valuedouble : 0;
+            StartAnimationJson(step, base + offset_ms * 1000);
+        }
+    }
+}
+
+void ProcessMessage(const char *json_str) {
+    cJSON *root = cJSON_Parse(json_str);
+    if (!root) {
+        ESP_LOGE("JSON", "Failed to parse JSON");
+        return;
     }
 
+    // Protocol ack from the server, switches the connection to binary frames
+    cJSON *type_item = cJSON_GetObjectItem(root, "type");
+    if (type_item && cJSON_IsString(type_item) && strcmp(type_item->valuestring, "proto") == 0) {
+        cJSON *proto_item = cJSON_GetObjectItem(root, "proto");
+        binary_protocol = proto_item && cJSON_IsString(proto_item) && strcmp(proto_item->valuestring, "bin1") == 0;
+        ESP_LOGI(TAG, "Using %s protocol", binary_protocol ? "binary" : "JSON");
+        cJSON_Delete(root);
+        return;
+    }
+
+    // Clock sync reply: offset = ((t1 - t0) + (t2 - t3)) / 2 is server minus local time
+    if (type_item && cJSON_IsString(type_item) && strcmp(type_item->valuestring, "sync") == 0) {
+        int64_t t3 = esp_timer_get_time();
+        cJSON *t0 = cJSON_GetObjectItem(root, "t0");
+        cJSON *t1 = cJSON_GetObjectItem(root, "t1");
+        cJSON *t2 = cJSON_GetObjectItem(root, "t2");
+        if (t0 && t1 && t2) {
+            int64_t rtt = (t3 - (int64_t)t0->valuedouble) - ((int64_t)t2->valuedouble - (int64_t)t1->valuedouble);
+            server_offset_us = (((int64_t)t1->valuedouble - (int64_t)t0->valuedouble) +
+                                ((int64_t)t2->valuedouble - t3)) / 2;
+            clock_synced = true;
+            ESP_LOGI(TAG, "Clock synced: offset=%lld us rtt=%lld us", server_offset_us, rtt);
+
+            char result[96];
+            snprintf(result, sizeof(result), "{\"type\":\"sync_result\",\"offset_us\":%lld,\"rtt_us\":%lld}\n",
+                     -server_offset_us, rtt);
+            if (server_sock >= 0)
+                send(server_sock, result, strlen(result), 0);
+        }
+        cJSON_Delete(root);
+        return;
+    }
+
+    // Streaming frame on the JSON protocol, same fields as WIRE_MSG_BAND_FRAME
+    if (type_item && cJSON_IsString(type_item) && strcmp(type_item->valuestring, "bands") == 0) {
+        cJSON *bpm_item = cJSON_GetObjectItem(root, "bpm");
+        if (bpm_item && cJSON_IsNumber(bpm_item) && bpm_item->valuedouble > 0)
+            BPM = (int)(bpm_item->valuedouble + 0.5);
+
+        cJSON *levels_item = cJSON_GetObjectItem(root, "levels");
+        cJSON *phase_item = cJSON_GetObjectItem(root, "beat_phase");
+        if (levels_item && cJSON_IsArray(levels_item) && cJSON_GetArraySize(levels_item) <= MAX_STREAM_BANDS) {
+            uint8_t levels[MAX_STREAM_BANDS];
+            uint8_t num_bands = 0;
+            cJSON *level;
+            cJSON_ArrayForEach(level, levels_item)
+                levels[num_bands++] = (uint8_t)std::min(255, std::max(0, level->valueint));
+            float phase = (phase_item && cJSON_IsNumber(phase_item)) ? (float)phase_item->valuedouble : 0;
+            StoreBandLevels(levels, num_bands, phase);
+        }
+        cJSON_Delete(root);
+        return;
+    }
+
+    // Beat-synchronised trigger: start at this server time instead of immediately
+    cJSON *start_item = cJSON_GetObjectItem(root, "startAt");
+    int64_t start_at_local = (start_item && cJSON_IsNumber(start_item)) ? LocalStartTime((int64_t)start_item->valuedouble) : 0;
+
+    StartAnimationJson(root, start_at_local);
+
+    // Latency instrumentation: acknowledge tagged triggers once started
+    cJSON *trg_item = cJSON_GetObjectItem(root, "trg");
+    if (trg_item && cJSON_IsNumber(trg_item))
+        SendAck((uint32_t)trg_item->valuedouble);
+
     cJSON_Delete(root);
 }
 
@@ -256,6 +655,10 @@ void input_task(void *pvParameters)
 void tcp_client_task(void *pvParameters)
 {
     char rx_buffer[256];
+    static char line_buffer[2048];  // JSON mode: bytes up to the next newline (sequences can be long)
+    size_t line_len = 0;
+    static uint8_t frame_buffer[WIRE_MAX_FRAME_SIZE];  // binary mode: bytes of incomplete frames
+    size_t frame_len = 0;
 
     while (1) {
         struct sockaddr_in dest_addr;
@@ -281,29 +684,88 @@ void tcp_client_task(void *pvParameters)
 
         ESP_LOGI(TAG, "Connected!");
 
-        // Send initial hello JSON with MAC address
-        char hello[128];
+        // Send initial hello JSON with MAC address and group tags, offering the binary protocol
+        char hello[192];
         snprintf(hello, sizeof(hello),
-                "{\"id\":\"esp32_%s\",\"status\":\"online\"}\n", esp32_mac_str);
+                "{\"id\":\"esp32_%s\",\"tags\":[" STRIP_TAGS "],\"status\":\"online\",\"proto\":[\"bin1\",\"json\"]}\n", esp32_mac_str);
 
         send(sock, hello, strlen(hello), 0);
 
+        // Clock-offset handshake for beat-synchronised triggers, repeated every CLOCK_RESYNC_INTERVAL_US
+        server_sock = sock;
+        clock_synced = false;
+        SendSyncRequest();
+        int64_t last_sync_us = esp_timer_get_time();
+
+        struct timeval recv_timeout = { .tv_sec = RECV_TIMEOUT_MS / 1000, .tv_usec = (RECV_TIMEOUT_MS % 1000) * 1000 };
+        setsockopt(sock, SOL_SOCKET, SO_RCVTIMEO, &recv_timeout, sizeof(recv_timeout));
+
+        binary_protocol = false;
+        line_len = 0;
+        frame_len = 0;
+
         while (1) 
         {
+            if (esp_timer_get_time() - last_sync_us >= CLOCK_RESYNC_INTERVAL_US) {
+                SendSyncRequest();
+                last_sync_us = esp_timer_get_time();
+            }
+
             int len = recv(sock, rx_buffer, sizeof(rx_buffer) - 1, 0);
-            if (len < 0) {
+            if (len < 0 && (errno == EAGAIN || errno == EWOULDBLOCK)) {
+                continue;  // receive timeout, only there to resync
+            } else if (len < 0) {
                 ESP_LOGE(TAG, "recv failed: errno %d", errno);
                 break;
             } else if (len == 0) {
                 ESP_LOGI(TAG, "Connection closed");
                 break;
             } else {
-                rx_buffer[len] = 0;
-                ESP_LOGI(TAG, "Received: %s", rx_buffer);
-                ProcessMessage(rx_buffer);
+                for (int i = 0; i < len; i++)
+                {
+                    if (binary_protocol)
+                    {
+                        if (frame_len < sizeof(frame_buffer))
+                            frame_buffer[frame_len++] = rx_buffer[i];
+                        continue;
+                    }
+
+                    // JSON mode: one message per line. The proto ack may switch
+                    // to binary mid-buffer, so the rest goes to the frame buffer.
+                    if (rx_buffer[i] == '\n')
+                    {
+                        line_buffer[line_len] = 0;
+                        ESP_LOGD(TAG, "Received: %s", line_buffer);
+                        ProcessMessage(line_buffer);
+                        line_len = 0;
+                    }
+                    else if (line_len < sizeof(line_buffer) - 1)
+                    {
+                        line_buffer[line_len++] = rx_buffer[i];
+                    }
+                }
+
+                // Binary mode: process every complete frame
+                size_t offset = 0;
+                while (frame_len - offset >= 2)
+                {
+                    uint16_t frame_size = frame_buffer[offset] | (frame_buffer[offset + 1] << 8);
+                    if (frame_size + 2 > sizeof(frame_buffer)) {
+                        ESP_LOGE(TAG, "Binary frame too large (%u), dropping buffer", frame_size);
+                        offset = frame_len;
+                        break;
+                    }
+                    if (frame_len - offset < (size_t)frame_size + 2)
+                        break;
+                    ProcessBinaryMessage(frame_buffer + offset + 2, frame_size);
+                    offset += frame_size + 2;
+                }
+                memmove(frame_buffer, frame_buffer + offset, frame_len - offset);
+                frame_len -= offset;
             }
         }
 
+        server_sock = -1;
         if (sock != -1) {
             ESP_LOGI(TAG, "Shutting down socket and restarting...");
             shutdown(sock, 0);
@@ -315,6 +777,73 @@ void tcp_client_task(void *pvParameters)
 }
 
 
+// Receives stream frames multicast by the controller. Frames are never retransmitted:
+// anything older than the newest sequence number seen is dropped.
+void udp_stream_task(void *pvParameters)
+{
+    static uint8_t datagram[WIRE_MAX_FRAME_SIZE + UDP_DATAGRAM_HEADER_SIZE];
+
+    while (1) {
+        int sock = socket(AF_INET, SOCK_DGRAM, IPPROTO_UDP);
+        if (sock < 0) {
+            ESP_LOGE(TAG, "Unable to create UDP socket: errno %d", errno);
+            vTaskDelay(2000 / portTICK_PERIOD_MS);
+            continue;
+        }
+
+        struct sockaddr_in bind_addr = {};
+        bind_addr.sin_family = AF_INET;
+        bind_addr.sin_port = htons(UDP_STREAM_PORT);
+        bind_addr.sin_addr.s_addr = htonl(INADDR_ANY);
+
+        struct ip_mreq membership = {};
+        membership.imr_multiaddr.s_addr = inet_addr(UDP_MULTICAST_GROUP);
+        membership.imr_interface.s_addr = htonl(INADDR_ANY);
+
+        if (bind(sock, (struct sockaddr *)&bind_addr, sizeof(bind_addr)) != 0 ||
+            setsockopt(sock, IPPROTO_IP, IP_ADD_MEMBERSHIP, &membership, sizeof(membership)) != 0) {
+            ESP_LOGE(TAG, "Unable to join %s:%d: errno %d", UDP_MULTICAST_GROUP, UDP_STREAM_PORT, errno);
+            close(sock);
+            vTaskDelay(2000 / portTICK_PERIOD_MS);
+            continue;
+        }
+        ESP_LOGI(TAG, "Listening for stream frames on %s:%d", UDP_MULTICAST_GROUP, UDP_STREAM_PORT);
+
+        bool have_seq = false;
+        uint32_t last_seq = 0;
+        while (1)
+        {
+            int len = recv(sock, datagram, sizeof(datagram), 0);
+            if (len < 0) {
+                ESP_LOGE(TAG, "UDP recv failed: errno %d", errno);
+                break;
+            }
+            if (len < UDP_DATAGRAM_HEADER_SIZE + 2 || datagram[0] != 'R' || datagram[1] != 'G' ||
+                datagram[2] != UDP_DATAGRAM_VERSION)
+                continue;
+
+            uint32_t seq;
+            memcpy(&seq, datagram + 3, sizeof(seq));
+            uint32_t delta = seq - last_seq;
+            if (have_seq && (delta == 0 || delta >= 0x80000000))
+                continue;  // duplicate or out of order
+            have_seq = true;
+            last_seq = seq;
+
+            // One wire frame per datagram
+            const uint8_t *frame = datagram + UDP_DATAGRAM_HEADER_SIZE;
+            uint16_t frame_size = frame[0] | (frame[1] << 8);
+            if ((size_t)frame_size + 2 != (size_t)len - UDP_DATAGRAM_HEADER_SIZE)
+                continue;
+            ProcessBinaryMessage(frame + 2, frame_size);
+        }
+
+        close(sock);
+        vTaskDelay(2000 / portTICK_PERIOD_MS);
+    }
+}
+
+
 void lighting_handler_task(void *pvParameters) {
     LightingCommand cmd;
     while (1) {
@@ -323,13 +852,13 @@ void lighting_handler_task(void *pvParameters) {
                 case CMD_FUSE_WAVE: {
                     ESP_LOGI(TAG, "Creating fusewave");
                     FuseWave* fusewave = new FuseWave(LED_STRIP_BUFFER,LED_STRIP_LENGTH, 255, 255, 255, 152, 0.5);
-                    xTaskCreate(animation_task, "FuseWaveTask", 2048, fusewave, MAX_ANIM_PRIORITY, NULL);
+                    SpawnAnimationTask(fusewave, "FuseWaveTask");
                     break;
                 }
                 case CMD_BLINK_LEDS: {
                     ESP_LOGI(TAG, "Blinking LEDs");
                     Blink* blink = new Blink(LED_STRIP_BUFFER, LED_STRIP_LENGTH, 255, 0, 0, 152, 2);
-                    xTaskCreate(animation_task, "BlinkTask", 2048, blink, MAX_ANIM_PRIORITY, NULL);
+                    SpawnAnimationTask(blink, "BlinkTask");
                     break;
                 }
                 default:
@@ -342,6 +871,35 @@ void lighting_handler_task(void *pvParameters) {
     }
 }
 
+// Audio-reactive level meter: one segment per band, lit in proportion to its level,
+// coloured from red (bass) to blue (treble) and brightest on the beat.
+// Called with led_strip_mutex held.
+void RenderBandLevels()
+{
+    if (stream_num_bands == 0 || esp_timer_get_time() - stream_levels_time_us >= STREAM_LEVELS_TIMEOUT_US)
+        return;
+
+    float pulse = 1.0f - 0.4f * stream_beat_phase;  // decays over each beat
+    for (int i = 0; i < LED_STRIP_LENGTH; i++)
+    {
+        int band = i * stream_num_bands / LED_STRIP_LENGTH;
+        int segment_start = (band * LED_STRIP_LENGTH + stream_num_bands - 1) / stream_num_bands;
+        int segment_end = ((band + 1) * LED_STRIP_LENGTH + stream_num_bands - 1) / stream_num_bands;
+        int lit = (segment_end - segment_start) * stream_levels[band] / 255;
+        if (i - segment_start >= lit)
+            continue;
+
+        float brightness = stream_levels[band] * pulse;
+        float position = stream_num_bands > 1 ? (float)band / (stream_num_bands - 1) : 0;
+        uint8_t r = (uint8_t)(brightness * (1.0f - position));
+        uint8_t b = (uint8_t)(brightness * position);
+        uint8_t g = (uint8_t)(brightness * (position < 0.5f ? position : 1.0f - position));
+        LED_STRIP_BUFFER[i].r = std::max(LED_STRIP_BUFFER[i].r, r);
+        LED_STRIP_BUFFER[i].g = std::max(LED_STRIP_BUFFER[i].g, g);
+        LED_STRIP_BUFFER[i].b = std::max(LED_STRIP_BUFFER[i].b, b);
+    }
+}
+
 // Responsible for refreshing the LED strip 
 void lighting_refresh_task(void *pvParameters) {
     while (1)
@@ -351,6 +909,17 @@ void lighting_refresh_task(void *pvParameters) {
             // Clear LED Strip
             ESP_ERROR_CHECK(led_strip_clear(led_strip));
 
+            // Blend in the streamed band levels and host-rendered pixels while they keep arriving
+            RenderBandLevels();
+
+            if (esp_timer_get_time() - stream_pixels_time_us < STREAM_PIXELS_TIMEOUT_US) {
+                for (int i = 0; i < LED_STRIP_LENGTH; i++) {
+                    LED_STRIP_BUFFER[i].r = std::max(LED_STRIP_BUFFER[i].r, stream_pixels[i].r);
+                    LED_STRIP_BUFFER[i].g = std::max(LED_STRIP_BUFFER[i].g, stream_pixels[i].g);
+                    LED_STRIP_BUFFER[i].b = std::max(LED_STRIP_BUFFER[i].b, stream_pixels[i].b);
+                }
+            }
+
             // Copy LED Buffer into actual strip
             for (int i = 0; i < LED_STRIP_LENGTH; i++) {
                 ESP_ERROR_CHECK(led_strip_set_pixel(led_strip, i, LED_STRIP_BUFFER[i].r, LED_STRIP_BUFFER[i].g, LED_STRIP_BUFFER[i].b));
@@ -371,13 +940,18 @@ void lighting_refresh_task(void *pvParameters) {
 
 void animation_task(void *pvParameters) {
     LedAnimation* animation = static_cast<LedAnimation*>(pvParameters);
-    
-    while(1)
-    {
-        if(!animation->started)
-            animation->start();
+    int64_t first_start_us = animation->startAtUs > 0 ? animation->startAtUs : esp_timer_get_time();
 
-        if(animation->active)
+    for (uint8_t repeat = 0; repeat < animation->repeats; repeat++)
+    {
+        // Scheduled trigger or the next beat of a repeated step: wait for its start time.
+        // A run longer than a beat delays the next repeat rather than overlapping it.
+        int64_t wait_us = first_start_us + repeat * animation->repeatIntervalUs - esp_timer_get_time();
+        if (wait_us > 0)
+            vTaskDelay(pdMS_TO_TICKS(wait_us / 1000));
+        animation->start();
+
+        while (animation->active)
         {
             // Get control of led strip
             if (xSemaphoreTake(led_strip_mutex, portMAX_DELAY) == pdTRUE) {
@@ -385,11 +959,12 @@ void animation_task(void *pvParameters) {
                 xSemaphoreGive(led_strip_mutex);
             } else
                 ESP_LOGW("AnimationTask", "Failed to take LED strip mutex");
-            
         }
-        else
-            vTaskDelete(NULL);
     }
+
+    delete animation;
+    xSemaphoreGive(animation_task_slots);
+    vTaskDelete(NULL);
 }
 
 
@@ -442,6 +1017,8 @@ void setup()
 
 extern "C" void app_main(void) 
 {
+    // Before Wi-Fi comes up, so the first command from the controller can already start animations
+    animation_task_slots = xSemaphoreCreateCounting(MAX_LED_TASKS, MAX_LED_TASKS);
 
    setup();
 
@@ -3,6 +3,14 @@
 
 import server
 import animation_handler
+import stream_relay
+import udp_transport
+import beat_scheduler
+import latency_stats
+import led_renderer
+import pixel_outputs
+import onset_detector
+import wire_protocol
 import socket
 import json
 from pynput import keyboard
@@ -31,6 +39,7 @@ def load_key_mappings():
     """Load key to animation mappings from JSON file."""
     global key_animation_mappings
     key_animation_mappings = animation_handler.parse_json_entries()
+    animation_handler.get_store().start_watching()  # pick up hand edits to the JSON file
 
     return
 
@@ -41,16 +50,17 @@ def load_key_mappings():
 ###########################
 def display_current_mappings():
     """Display current key to animation mappings."""
+    load_key_mappings()  # served from memory, includes edits made since startup
 
-    for key,value in key_animation_mappings.items():
+    for key,schemas in key_animation_mappings.items():
         print("\n")
         print(f"Key: {key}")
-        try:
-            animation_data = json.loads(value)
+        indent = "\t\t" if len(schemas) > 1 else "\t"
+        for step, animation_data in enumerate(schemas, start=1):
+            if len(schemas) > 1:
+                print(f"\tStep {step}:")
             for entry_key, entry_value in animation_data.items():
-                print(f"\t{entry_key}: {entry_value}")
-        except Exception as e:
-            print(f"\tError parsing animation JSON: {e}")
+                print(f"{indent}{entry_key}: {entry_value}")
 
     
     return
@@ -62,9 +72,16 @@ def create_new_mapping():
 
     key = input("Enter key to bind animation to: ")
 
+    append = False
     if key in key_animation_mappings:
-        overwrite = input(f"Key '{key}' is already mapped. Overwrite? (y/n): ")
-        if overwrite.lower() != 'y':
+        choice = input(f"Key '{key}' is already mapped. (o)verwrite, (a)ppend to its sequence, or cancel: ")
+        if choice.lower() == 'a':
+            if len(key_animation_mappings[key]) >= wire_protocol.MAX_SEQUENCE_STEPS:
+                print(f"Key '{key}' already has {wire_protocol.MAX_SEQUENCE_STEPS} steps, "
+                      f"the most one trigger can start. Aborting mapping creation.")
+                return
+            append = True
+        elif choice.lower() != 'o':
             print("Aborting mapping creation.")
             return
 
@@ -74,8 +91,21 @@ def create_new_mapping():
         print("No animation created. Aborting mapping.")
         return
 
-    key_animation_mappings[key] = schema
-    animation_handler.append_schema(key,schema)
+    if append:
+        beats_input = input("Beats the previous animation repeats for before this one starts (0 = play together): ")
+        after_beats = float(beats_input) if beats_input.strip() else 0
+        try:
+            animation_handler.append_schema(key, schema, after_beats)
+        except ValueError as e:
+            print(f"Cannot add this step to '{key}': {e}. Aborting mapping.")
+            return
+    else:
+        target = input("Target strip id or group tag, comma separated (blank = all strips): ").strip()
+        if target:
+            names = [name.strip() for name in target.split(",") if name.strip()]
+            schema["target"] = names[0] if len(names) == 1 else names
+        animation_handler.set_schema(key, schema)
+    key_animation_mappings[key] = animation_handler.get_store().get(key)
 
 
 
@@ -100,6 +130,9 @@ def display_menu():
         print("2. Create New Key Mapping")
         print("3. Manually Set up Server Info")
         print("4. Start Manual Rave Controller")
+        print("5. Start Audio-Reactive Streaming")
+        print("6. Start Host-Rendered Controller")
+        print("7. Start Audio-Triggered Controller")
         print("9. Exit")
 
         user_input = input("Please Enter your Choice ")
@@ -113,8 +146,18 @@ def display_menu():
         elif user_input == "4":
             threading.Thread(target=server.start_server, daemon=True).start()
             run_manual_controller()
+        elif user_input == "5":
+            threading.Thread(target=server.start_server, daemon=True).start()
+            run_streaming_mode()
+        elif user_input == "6":
+            threading.Thread(target=server.start_server, daemon=True).start()
+            run_rendered_controller()
+        elif user_input == "7":
+            threading.Thread(target=server.start_server, daemon=True).start()
+            run_auto_controller()
         elif user_input == "9":
             print("Exiting...")
+            animation_handler.get_store().stop()  # write any pending mapping changes
             break
         else:
             print("Invalid choice. Please try again.")
@@ -125,7 +168,46 @@ def display_menu():
 ##### CONTROLLER #################
 ##################################
 
+def read_rate(prompt, default):
+    """Ask for a rate in Hz, falling back to default on blank, non-numeric or non-positive input."""
+    rate_input = input(prompt).strip()
+    if not rate_input:
+        return default
+    try:
+        rate_hz = float(rate_input)
+    except ValueError:
+        rate_hz = 0
+    if not rate_hz > 0:
+        print(f"Invalid rate '{rate_input}', using {default} Hz")
+        return default
+    return rate_hz
+
+def read_count(prompt, default, maximum=None):
+    """Ask for a positive count (at most maximum), falling back to default on blank or invalid input."""
+    count_input = input(prompt).strip()
+    if not count_input:
+        return default
+    try:
+        count = int(count_input)
+    except ValueError:
+        count = 0
+    if count < 1 or (maximum is not None and count > maximum):
+        print(f"Invalid count '{count_input}', using {default}")
+        return default
+    return count
+
 def run_manual_controller():
+    scheduler = None
+    if input("Sync triggers to the beat? (y/n): ").lower() == 'y':
+        bpm_input = input("BPM (default 128): ")
+        beat_clock = beat_scheduler.BeatClock(bpm=float(bpm_input) if bpm_input.strip() else 128.0)
+        scheduler = beat_scheduler.TriggerScheduler(beat_clock)
+        scheduler.start()
+        print("Tap SPACE on a downbeat to align the beat grid.")
+
+    latency_stats.REQUEST_ACKS = input("Ask strips to acknowledge triggers for latency stats? (y/n): ").lower() == 'y'
+    latency_stats.stats.start_reporting()
+
     print("Controller running. Press mapped keys to trigger animations. Press ESC to exit.")
 
     def on_press(key):
@@ -137,14 +219,21 @@ def run_manual_controller():
                 print("Exiting controller...")
                 return False  # stops the listener
 
-            if key_name in key_animation_mappings:
+            if key_name == 'space' and scheduler is not None:
+                scheduler.beat_clock.tap(downbeat=True)
+                return
+
+            payload = animation_handler.get_payloads().get(key_name)  # cached until a mapping changes
+            if payload is not None:
                 try:
-                    animation_data = json.loads(key_animation_mappings[key_name])
-                    animation_name = animation_data.get("name", "Unknown")
-                    print(f"Triggered animation: {animation_name}")
-                    server.broadcast_message(animation_data)
-                    print("Message Broadcasted: ")
-                    print(animation_data)
+                    if scheduler is not None:
+                        scheduler.schedule(payload)
+                        print(f"Scheduled animation on next beat: {payload.name}")
+                    else:
+                        trigger = latency_stats.stats.start_trigger(payload.name)
+                        latency_stats.stats.mark_serialized(trigger)  # payloads are precompiled
+                        server.broadcast_bytes(payload.data, payload.binary, payload.target, trigger)
+                        print(f"Triggered animation: {payload.name}")
                 except Exception as e:
                     print(f"Error handling animation for key '{key_name}': {e}")
 
@@ -160,6 +249,98 @@ def run_manual_controller():
     with keyboard.Listener(on_press=on_press, on_release=on_release) as listener:
         listener.join()
 
+    if scheduler is not None:
+        scheduler.stop()
+    latency_stats.stats.stop_reporting()
+
+
+
+
+def run_rendered_controller():
+    """Render mapped animations on this machine and stream raw pixels to binary strips."""
+    num_strips = read_count("Number of strips (default 8): ", 8)
+    # Every strip gets its row in one pixel frame, which has to fit the firmware's receive buffer
+    num_leds = read_count(f"LEDs per strip (default 50, at most {wire_protocol.MAX_PIXEL_FRAME_LEDS}): ", 50,
+                          wire_protocol.MAX_PIXEL_FRAME_LEDS)
+    renderer = led_renderer.LedRenderer(num_strips, num_leds)
+    outputs_input = input("Pixel controllers for the first rows, e.g. ddp:192.168.1.50,e131:10.0.0.7 (blank = none): ")
+    outputs = {}
+    for row, spec in enumerate(spec for spec in outputs_input.split(",") if spec.strip()):
+        if row >= renderer.num_strips:
+            print(f"Ignoring '{spec}': only {renderer.num_strips} rows")
+            break
+        try:
+            outputs[row] = pixel_outputs.parse_output(spec, renderer.num_leds)
+        except ValueError as e:
+            print(e)
+    streamer = led_renderer.PixelStreamer(renderer, outputs=outputs)
+    streamer.start()
+
+    print("Rendering on the host. Press mapped keys to trigger animations. Press ESC to exit.")
+
+    def on_press(key):
+        key_name = key.char if hasattr(key, 'char') else str(key).split('.')[-1]
+        if key_name == 'esc':
+            print("Exiting controller...")
+            return False
+
+        schemas = animation_handler.get_store().get(key_name)
+        if not schemas:
+            return
+        rows = streamer.rows_for(animation_handler.mapping_target(key_name, schemas))
+        now = renderer.clock()
+        for offset_ms, schema in animation_handler.sequence_steps(schemas):
+            for start_ms in animation_handler.repeat_offsets(offset_ms, schema):
+                renderer.trigger(schema, start_s=now + start_ms / 1000.0, strips=rows)
+        print(f"Rendered animation: {' + '.join(schema.get('name', 'Unknown') for schema in schemas)}")
+
+    with keyboard.Listener(on_press=on_press) as listener:
+        listener.join()
+
+    streamer.stop()
+
+
+def run_streaming_mode():
+    """Forward the Visualizer's live analysis frames to every strip until Enter is pressed."""
+    rate_hz = read_rate(f"Stream rate in Hz (default {stream_relay.STREAM_RATE_HZ}): ", stream_relay.STREAM_RATE_HZ)
+
+    udp_sender = None
+    if input("Send frames over UDP multicast instead of TCP? (y/n): ").lower() == 'y':
+        udp_sender = udp_transport.UdpFrameSender()
+        print(f"Multicasting to {udp_transport.MULTICAST_GROUP}:{udp_transport.UDP_PORT}")
+
+    relay = stream_relay.StreamRelay(rate_hz=rate_hz, udp_sender=udp_sender)
+    relay.start()
+    input("Streaming. Start playback in the Visualizer. Press Enter to stop.\n")
+    relay.stop()
+
+
+
+
+def run_auto_controller():
+    """Trigger mapped animations from onsets and drops detected in the Visualizer's analysis frames."""
+    frame_rate_hz = read_rate("Visualizer analysis frames per second (default 50, 86 for overlapped analysis): ", 50.0)
+
+    bindings = {}
+    for event in onset_detector.EVENTS:
+        key = input(f"Key whose animation plays on {event} (blank = none): ").strip()
+        if not key:
+            continue
+        if key not in key_animation_mappings:
+            print(f"Key '{key}' has no mapping yet; it fires once one is created.")
+        bindings[event] = key
+
+    latency_stats.REQUEST_ACKS = input("Ask strips to acknowledge triggers for latency stats? (y/n): ").lower() == 'y'
+    latency_stats.stats.start_reporting()
+
+    auto = onset_detector.AutoTrigger(bindings, frame_rate_hz=frame_rate_hz)
+    relay = stream_relay.StreamRelay(on_frame=auto.on_frame, forward=False)
+    relay.start()
+    input("Listening for analysis frames. Start playback or Line In in the Visualizer. Press Enter to stop.\n")
+    relay.stop()
+    latency_stats.stats.stop_reporting()
+    print(f"[AUTO] {json.dumps(auto.stats())}")
+
 
 
 
@@ -3,65 +3,407 @@ This file contains functions that prompt user input for animation parameters.
 Functionss that create individual animations output the JSON which is sent to ESP32 
 
 '''
+import atexit
 import json
+import math
+import os
+import tempfile
+import threading
+from collections import namedtuple
 from pathlib import Path
 
+import wire_protocol
+
 
 ###JSON functions
 #################
 
 FILE_PATH = Path("animation_mappings.json")
+SAVE_DELAY_S = 0.5     # edits within this window are written to disk together
+POLL_INTERVAL_S = 1.0  # how often the file is checked for external edits
+
+# Ready-to-send wire frames for a key: name for logging, data is compact JSON + newline,
+# binary is the wire_protocol frame (None if the animation has no binary encoding),
+# target is the optional "target" of the mapping (tag, client id or list, None = all strips)
+Payload = namedtuple("Payload", ["name", "data", "binary", "target"], defaults=(None,))
+
+MAPPING_ONLY_FIELDS = ("name", "beats", "target")  # controller-side fields, never sent to strips
+
+
+class MappingStore:
+    """
+    Key -> schema list mappings held in memory.
+
+    The file is read once; reads never touch the disk. Changes are written back
+    after SAVE_DELAY_S of quiet through a temp file and os.replace, so the file on
+    disk is always either the old or the new version, never half written. The
+    write works on a snapshot taken under the lock, so reads on key presses never
+    wait for the disk. A
+    watcher thread polls the file's mtime and, when someone edits it by hand,
+    re-reads it and only recompiles the keys that actually changed.
+    """
+
+    def __init__(self, path=FILE_PATH, save_delay_s=SAVE_DELAY_S, poll_interval_s=POLL_INTERVAL_S):
+        self.path = Path(path)
+        self.save_delay_s = save_delay_s
+        self.poll_interval_s = poll_interval_s
+
+        self.mappings = {}   # key -> list of schemas
+        self.payloads = {}   # key -> Payload, kept in step with mappings
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()  # one flush at a time, so snapshots reach the disk in order
+        self._dirty = False
+        self._save_timer = None
+        self._mtime = None   # mtime of the version we last read or wrote
+
+        self._watching = False
+        self._watch_thread = None
+        self._wake = threading.Event()  # set by stop() to end the watcher's sleep early
+
+    ### Disk ###
+
+    def load(self):
+        """Read the file into memory, creating it if it doesn't exist."""
+        with self._lock:
+            if not self.path.exists():
+                self._write({})
+            self._mtime = self.path.stat().st_mtime_ns
+            self._apply(self._read())
+
+    def _read(self):
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _write(self, data):
+        """Atomically replace the file: write a temp file next to it, then rename."""
+        directory = self.path.parent if str(self.path.parent) else Path(".")
+        fd, tmp_path = tempfile.mkstemp(prefix=self.path.name + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def flush(self):
+        """Write pending changes now (also called by the debounce timer)."""
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                # Schema lists are replaced by set(), never edited in place, so a shallow copy is a snapshot
+                snapshot = dict(self.mappings)
+                self._dirty = False
+            try:
+                self._write(snapshot)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True  # retried by the next flush
+                raise
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+        self._save_timer = threading.Timer(self.save_delay_s, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    ### Reads / writes ###
+
+    def get(self, key):
+        with self._lock:
+            return self.mappings.get(key)
+
+    def all(self):
+        """Shallow copy of every mapping, safe to iterate while edits happen."""
+        with self._lock:
+            return dict(self.mappings)
+
+    def set(self, key, schemas):
+        with self._lock:
+            self.mappings[key] = schemas
+            self._compile_key(key)
+            self._schedule_save()
+
+    def remove(self, key):
+        with self._lock:
+            if self.mappings.pop(key, None) is not None:
+                self.payloads.pop(key, None)
+                self._schedule_save()
+
+    def replace_all(self, data):
+        with self._lock:
+            self._apply(data)
+            self._schedule_save()
+
+    ### Payloads ###
+
+    def _compile_key(self, key):
+        """Recompile one key; a malformed mapping is logged and left without a payload."""
+        try:
+            payload = compile_payload(key, self.mappings[key])
+        except Exception as e:  # hand-edited file: wrong types, missing fields, ...
+            print(f"[MAPPINGS] Skipping key '{key}': {type(e).__name__}: {e}")
+            payload = None
+        if payload is None:
+            self.payloads.pop(key, None)
+        else:
+            self.payloads[key] = payload
+
+    def _apply(self, data):
+        """Swap in new mappings, recompiling only keys whose schemas changed."""
+        if not isinstance(data, dict):
+            raise ValueError(f"expected an object of key -> schema list, got {type(data).__name__}")
+        old = self.mappings
+        self.mappings = dict(data)
+        for key in old.keys() - self.mappings.keys():
+            self.payloads.pop(key, None)
+        changed = [key for key, schemas in self.mappings.items() if old.get(key) != schemas]
+        for key in changed:
+            self._compile_key(key)
+        return changed
+
+    ### External edits ###
+
+    def check_for_changes(self):
+        """
+        Reload the file if it changed on disk since we last read or wrote it.
+
+        Returns:
+            list: Keys that were added or changed (removed keys are dropped silently).
+        """
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime == self._mtime:
+            return []
+
+        with self._lock:
+            if self._dirty:
+                return []  # our own pending write wins; it will overwrite the edit
+            try:
+                data = self._read()
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[MAPPINGS] Ignoring unreadable {self.path}: {e}")
+                return []  # editor mid-save; retried on the next poll
+            self._mtime = mtime
+            try:
+                changed = self._apply(data)
+            except ValueError as e:
+                print(f"[MAPPINGS] Ignoring {self.path}: {e}")
+                return []
+
+        if changed:
+            print(f"[MAPPINGS] Reloaded {self.path}, changed keys: {', '.join(changed)}")
+        return changed
+
+    def start_watching(self):
+        if self._watching:
+            return
+        self._watching = True
+        self._wake.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, name="MappingWatcher", daemon=True)
+        self._watch_thread.start()
+
+    def stop(self):
+        """Stop watching and write any pending changes."""
+        self._watching = False
+        self._wake.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join()
+            self._watch_thread = None
+        self.flush()
+
+    def _watch_loop(self):
+        while self._watching:
+            try:
+                self.check_for_changes()
+            except Exception as e:  # keep watching; the next edit may fix it
+                print(f"[MAPPINGS] Error while checking {self.path}: {type(e).__name__}: {e}")
+            self._wake.wait(self.poll_interval_s)
+
+
+_store = None
+
+def get_store():
+    """The shared MappingStore, loaded on first use."""
+    global _store
+    if _store is None:
+        _store = MappingStore()
+        _store.load()
+        atexit.register(_store.stop)  # write edits still waiting for the save delay
+    return _store
 
 def load_json():
-    """Load JSON file into dict, create file if it doesn't exist."""
-    if not FILE_PATH.exists():
-        with open(FILE_PATH, "w") as f:
-            json.dump({}, f, indent=4)
-    with open(FILE_PATH, "r") as f:
-        return json.load(f)
+    """Return all mappings (served from memory)."""
+    return get_store().all()
 
 def save_json(data):
-    """Save dict back to JSON file."""
-    with open(FILE_PATH, "w") as f:
-        json.dump(data, f, indent=4)
+    """Replace all mappings; written to disk shortly after."""
+    get_store().replace_all(data)
 
 def get_schemas_by_key(key: str):
     """Print schemas for given key, or say not found."""
-    data = load_json()
-    if key not in data or not data[key]:
+    schemas = get_store().get(key)
+    if not schemas:
         print(f"No schemas found for key '{key}'")
         return None
-    print(json.dumps(data[key], indent=4))
-    return data[key]
+    print(json.dumps(schemas, indent=4))
+    return schemas
 
 def get_all_schemas():
     """Return dict of all keys and their schema lists."""
     return load_json()
 
-def append_schema(key: str, schema: dict):
+def set_schema(key: str, schema: dict):
     """
-    Replace schema for given key.
+    Replace all schemas for given key with a single one.
     Creates key if it doesn't exist.
     """
-    data = load_json()
-    data[key] = [schema]
-    save_json(data)
+    get_store().set(key, [schema])
     print(f"Schema set for key '{key}'.")
 
+def append_schema(key: str, schema: dict, after_beats: float = 0):
+    """
+    Add a schema to the end of the key's sequence.
+    Creates key if it doesn't exist.
+
+    Args:
+        after_beats (float): Beats the previous step runs for, restarted on every beat,
+            before this one starts (0 = both start together, layered).
+
+    Raises:
+        ValueError: The sequence would not fit one trigger (see validate_sequence).
+    """
+    schemas = list(get_store().get(key) or [])
+    if schemas:
+        previous = dict(schemas[-1])
+        if after_beats:
+            previous["beats"] = after_beats
+        else:
+            previous.pop("beats", None)
+        schemas[-1] = previous
+    schemas.append(schema)
+    validate_sequence(schemas)
+    get_store().set(key, schemas)
+    print(f"Schema added to key '{key}' ({len(schemas)} steps).")
+
 
 def parse_json_entries():
     """
-    Read the JSON and return a dict where each key is a single char (key),
-    and the value is a string containing all the JSON schemas for that key.
+    Return a dict where each key is a single char (key) and the value is
+    the ordered list of schemas that key triggers.
     """
-    data = load_json()
-    entries = {}
-    for key, schemas in data.items():
-        # Combine all schemas for this key into a single pretty-printed string
-        json_str = "\n".join(json.dumps(schema, indent=4) for schema in schemas)
-        entries[key] = json_str
-    return entries
+    return {key: list(schemas) for key, schemas in load_json().items()}
+
+
+def encode_payload(schema: dict) -> bytes:
+    """Encode a schema exactly as it goes on the wire (compact JSON, newline terminated)."""
+    return (json.dumps(schema, separators=(",", ":")) + "\n").encode("utf-8")
+
+def mapping_target(key, schemas):
+    """The mapping's target: set on the first schema and applies to the whole sequence."""
+    target = schemas[0].get("target")
+    if any(schema.get("target", target) != target for schema in schemas[1:]):
+        print(f"Key '{key}' has steps with different targets, using '{target}' for all of them.")
+    return target
+
+def sequence_steps(schemas):
+    """
+    Timed steps of a mapping as (offset_ms, schema) pairs. A schema's optional "beats"
+    is how long it runs (at its own BPM): an animation plays once per start, so the
+    step gets a "repeats" count of ceil(beats) and the strip restarts it on every beat
+    within that time. The next schema starts after it. Without "beats" the schema
+    plays once and the next one is layered on top, starting at the same time.
+    """
+    steps = []
+    offset_ms = 0.0
+    for schema in schemas:
+        beats = schema.get("beats", 0)
+        if not (beats and schema.get("BPM")):
+            steps.append((int(round(offset_ms)), schema))
+            continue
+        repeats = math.ceil(beats)
+        steps.append((int(round(offset_ms)), dict(schema, repeats=repeats) if repeats > 1 else schema))
+        offset_ms += beats * 60000.0 / schema["BPM"]
+    return steps
+
+def repeat_offsets(offset_ms, schema):
+    """Start offsets of every repeat of one step from sequence_steps, a beat apart."""
+    repeats = schema.get("repeats", 1)
+    beat_ms = 60000.0 / schema["BPM"] if repeats > 1 else 0.0
+    return [offset_ms + repeat * beat_ms for repeat in range(repeats)]
+
+def validate_sequence(schemas):
+    """
+    Check that a mapping fits one trigger on the strips.
+
+    Raises:
+        ValueError: More schemas than wire_protocol.MAX_SEQUENCE_STEPS, or a step that
+            repeats more than wire_protocol.MAX_STEP_REPEATS times.
+    """
+    if len(schemas) > wire_protocol.MAX_SEQUENCE_STEPS:
+        raise ValueError(f"{len(schemas)} steps, at most {wire_protocol.MAX_SEQUENCE_STEPS} allowed")
+    for schema in schemas:
+        if math.ceil(schema.get("beats", 0)) > wire_protocol.MAX_STEP_REPEATS:
+            raise ValueError(f"{schema['beats']} beats, at most {wire_protocol.MAX_STEP_REPEATS} allowed")
+
+def build_sequence(schemas):
+    """Combine several schemas into one Sequence message so a trigger is a single send."""
+    steps = []
+    for offset_ms, schema in sequence_steps(schemas):
+        step = {field: value for field, value in schema.items() if field not in MAPPING_ONLY_FIELDS}
+        step["offsetMs"] = offset_ms
+        steps.append(step)
+    name = " + ".join(schema.get("name", "Unknown") for schema in schemas)
+    return {"name": name, "Animation": "Sequence", "steps": steps}
+
+def compile_payload(key, schemas):
+    """
+    Compile one mapping into a ready-to-send Payload, so triggering a key
+    is a dict lookup plus a socket write instead of a JSON round trip.
+    Keys with several steps, or one step repeated for its "beats", compile
+    to a single Sequence message.
+    """
+    if not schemas:
+        return None
+    target = mapping_target(key, schemas)
+    steps = sequence_steps(schemas)
+    if len(steps) == 1 and "repeats" not in steps[0][1]:
+        schema = schemas[0]
+        message = {field: value for field, value in schema.items() if field != "target"}
+        binary = _encode_binary(key, wire_protocol.encode_animation, schema)
+        return Payload(schema.get("name", "Unknown"), encode_payload(message), binary, target)
+
+    try:
+        validate_sequence(schemas)  # append_schema already refuses these, so only hand edits get here
+    except ValueError as e:
+        print(f"Key '{key}' does not fit one trigger ({e}). Skipping.")
+        return None
+    sequence = build_sequence(schemas)
+    binary = _encode_binary(key, wire_protocol.encode_sequence, steps)
+    return Payload(sequence["name"], encode_payload(sequence), binary, target)
+
+def _encode_binary(key, encode, value):
+    """Binary frame for a mapping, or None (JSON only) if it doesn't fit the binary encoding."""
+    try:
+        return encode(value)
+    except wire_protocol.ProtocolError as e:
+        print(f"Key '{key}' is sent as JSON only: {e}")
+        return None
 
+def get_payloads():
+    """Return the compiled payload table; the store keeps it current as mappings change."""
+    return get_store().payloads
 
 
 
@@ -0,0 +1,231 @@
+'''
+asyncio TCP server for the LED strips.
+
+One event loop serves every ESP32 connection. Each client has a bounded outgoing
+queue drained by its own writer coroutine, so a stalled strip only fills its own
+queue and never delays the others. broadcast() may be called from any thread and
+only schedules the enqueue on the loop, so it returns immediately.
+
+Streaming frames (audio-reactive mode) bypass the queue: each client keeps only the
+newest frame in a single slot, written after any queued commands, so a slow link
+never accumulates stale frames.
+
+Queued commands can carry a latency_stats.Trigger; its send time is recorded for
+the client once the bytes have been drained to the socket.
+
+Slow-client policies, applied when a client's queue is full:
+    drop_oldest - discard the oldest queued message to make room
+    coalesce    - discard everything queued, keep only the newest message
+    disconnect  - close the connection
+'''
+import asyncio
+import threading
+from collections import deque
+
+import latency_stats
+import wire_protocol
+
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class ClientConnection:
+    def __init__(self, reader, writer, max_queue, policy):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.protocol = wire_protocol.PROTO_JSON
+        self.clock_offset_us = None  # client clock minus server clock, reported after sync
+        self.rtt_us = None
+        self.client_id = None  # set by the hello message, see client_registry
+        self.tags = set()
+        self.queue = deque()
+        self.max_queue = max_queue
+        self.policy = policy
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.dropped = 0  # messages discarded by the slow-client policy
+        self.latest_stream = None  # newest unsent streaming frame
+        self.stream_replaced = 0   # streaming frames overwritten before they were sent
+
+    def send(self, data, trigger=None):
+        """Queue data from the event loop thread, applying the slow-client policy."""
+        if not self.enqueue(data, trigger):
+            print(f"[SLOW CLIENT] {self.addr} disconnected")
+            self.close()
+
+    def enqueue(self, data, trigger=None):
+        """Queue data for sending. Returns False if the client should be disconnected."""
+        if len(self.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                return False
+            if self.policy == "coalesce":
+                self.dropped += len(self.queue)
+                self.queue.clear()
+            else:
+                self.queue.popleft()
+                self.dropped += 1
+        self.queue.append((data, trigger))
+        self.ready.set()
+        return True
+
+    def set_stream_frame(self, data):
+        """Replace the pending streaming frame with a newer one."""
+        if self.latest_stream is not None:
+            self.stream_replaced += 1
+        self.latest_stream = data
+        self.ready.set()
+
+    async def write_loop(self):
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                sent = []
+                while self.queue:
+                    data, trigger = self.queue.popleft()
+                    self.writer.write(data)
+                    if trigger is not None:
+                        sent.append((trigger, len(data)))
+                if self.latest_stream is not None:
+                    self.writer.write(self.latest_stream)
+                    self.latest_stream = None
+                await self.writer.drain()
+                for trigger, num_bytes in sent:
+                    latency_stats.stats.record_send(self, trigger, num_bytes)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.ready.set()  # wake the writer so it can exit
+            self.writer.close()
+
+
+class AsyncBroadcastServer:
+    def __init__(self, host, port, max_queue=32, slow_client_policy="drop_oldest", on_line=None, on_disconnect=None):
+        """
+        Args:
+            host, port: Address to listen on.
+            max_queue (int): Outgoing messages buffered per client.
+            slow_client_policy (str): One of SLOW_CLIENT_POLICIES.
+            on_line (callable, optional): Called as on_line(client, line) for each line a client sends.
+            on_disconnect (callable, optional): Called as on_disconnect(client) when a client goes away.
+        """
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy '{slow_client_policy}'")
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.slow_client_policy = slow_client_policy
+        self.on_line = on_line
+        self.on_disconnect = on_disconnect
+
+        self.clients = set()
+        self.loop = None
+        self._server = None
+        self._started = threading.Event()
+
+    def run(self):
+        """Run the event loop in the calling thread (blocking)."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle_client, self.host, self.port, reuse_address=True))
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            self.loop.run_until_complete(self._server.wait_closed())
+            self.loop.close()
+
+    def start_in_thread(self):
+        """Run the server on a daemon thread and wait until it is listening."""
+        threading.Thread(target=self.run, name="AsyncBroadcastServer", daemon=True).start()
+        self._started.wait()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._close_all)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def broadcast(self, data, binary_data=None, trigger=None):
+        """
+        Queue bytes for every client. Thread-safe and non-blocking.
+        Clients using the binary protocol get binary_data instead, or data wrapped
+        in a MSG_JSON frame when there is no binary_data.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._enqueue_all, data, binary_data, trigger)
+
+    def send_to(self, clients, data, binary_data=None, trigger=None):
+        """Like broadcast, but only for the given clients (e.g. a ClientRegistry group)."""
+        if self.loop is not None and clients:
+            self.loop.call_soon_threadsafe(self._enqueue_to, clients, data, binary_data, trigger)
+
+    def stream(self, data, binary_data=None):
+        """Offer a streaming frame to every client, coalescing to the newest per client."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stream_all, data, binary_data)
+
+    def stream_each(self, frames):
+        """Offer each (client, data) its own streaming frame, e.g. host-rendered pixels."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stream_each, frames)
+
+    def _stream_each(self, frames):
+        for client, data in frames:
+            if not client.closed:
+                client.set_stream_frame(data)
+
+    def _stream_all(self, data, binary_data):
+        for client in self.clients:
+            if client.protocol == wire_protocol.PROTO_BINARY:
+                binary_data = wire_protocol.encode_for(client.protocol, data, binary_data)
+                client.set_stream_frame(binary_data)
+            else:
+                client.set_stream_frame(data)
+
+    def _enqueue_all(self, data, binary_data, trigger=None):
+        self._enqueue_to(list(self.clients), data, binary_data, trigger)
+
+    def _enqueue_to(self, clients, data, binary_data, trigger=None):
+        for client in clients:
+            if client.closed:
+                continue
+            if client.protocol == wire_protocol.PROTO_BINARY:
+                binary_data = wire_protocol.encode_for(client.protocol, data, binary_data)  # wrapped once
+                client.send(binary_data, trigger)
+            else:
+                client.send(data, trigger)
+
+    def _close_all(self):
+        for client in list(self.clients):
+            client.close()
+
+    async def _handle_client(self, reader, writer):
+        client = ClientConnection(reader, writer, self.max_queue, self.slow_client_policy)
+        print(f"[NEW CONNECTION] {client.addr} connected.")
+        self.clients.add(client)
+        writer_task = asyncio.ensure_future(client.write_loop())
+        try:
+            while not client.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors="replace").strip()
+                if line and self.on_line is not None:
+                    self.on_line(client, line)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            print(f"[DISCONNECTED] {client.addr}")
+            self.clients.discard(client)
+            if self.on_disconnect is not None:
+                self.on_disconnect(client)
+            client.close()
+            await writer_task
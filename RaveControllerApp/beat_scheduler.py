@@ -0,0 +1,145 @@
+'''
+Beat-synchronised trigger dispatch.
+
+Instead of broadcasting the moment a key is pressed, a trigger is queued for the
+next beat (or bar) boundary of a BeatClock. TriggerScheduler releases it LEAD_TIME_MS
+before that boundary, stamped with the boundary as its start time on the server
+clock (wire_protocol.server_time_us). Each strip converts that to its own clock with
+the offset measured in the sync handshake (see server.handle_line), so every strip
+starts the animation in the same frame, on the beat.
+'''
+import heapq
+import itertools
+import threading
+
+import latency_stats
+import server
+import wire_protocol
+
+
+LEAD_TIME_MS = 120   # released this long before the boundary, covers network latency
+BEATS_PER_BAR = 4
+
+
+class BeatClock:
+    """Beat grid on the server clock: a tempo plus the time of one known beat."""
+
+    def __init__(self, bpm=128.0, anchor_us=None):
+        self.bpm = bpm
+        self.anchor_us = wire_protocol.server_time_us() if anchor_us is None else anchor_us
+        self.bar_anchor_us = self.anchor_us  # a downbeat, for bar alignment
+
+    @property
+    def beat_us(self):
+        return 60_000_000.0 / self.bpm
+
+    def set_tempo(self, bpm):
+        if bpm > 0:
+            self.bpm = bpm
+
+    def tap(self, now_us=None, downbeat=False):
+        """Align the grid so a beat (or bar, if downbeat) falls at now_us."""
+        now_us = wire_protocol.server_time_us() if now_us is None else now_us
+        self.anchor_us = now_us
+        if downbeat:
+            self.bar_anchor_us = now_us
+
+    def next_boundary(self, after_us, beats=1):
+        """
+        Server time of the first boundary strictly after after_us.
+
+        Args:
+            after_us (int): Server time in microseconds.
+            beats (int): Boundary spacing in beats (1 = beat, BEATS_PER_BAR = bar).
+        """
+        anchor = self.bar_anchor_us if beats == BEATS_PER_BAR else self.anchor_us
+        spacing = self.beat_us * beats
+        count = (after_us - anchor) // spacing + 1
+        return int(anchor + count * spacing)
+
+
+def stamp_json(data, start_at_us):
+    """Add a startAt field to a compact JSON payload (b'{...}\\n') without re-serialising."""
+    return data[:-2] + b',"startAt":' + str(start_at_us).encode() + b'}\n'
+
+
+def stamp_binary(frame, start_at_us):
+    """Give an animation or sequence frame its start time (see wire_protocol.schedule_frame)."""
+    if frame is None:
+        return None
+    return wire_protocol.schedule_frame(frame, start_at_us)
+
+
+class TriggerScheduler:
+    def __init__(self, beat_clock, lead_time_ms=LEAD_TIME_MS, send=None):
+        """
+        Args:
+            beat_clock (BeatClock): Grid triggers are aligned to.
+            lead_time_ms (float): How long before the boundary a trigger is sent.
+            send (callable, optional): send(json_bytes, binary_bytes, target, trigger); defaults to server.broadcast_bytes.
+        """
+        self.beat_clock = beat_clock
+        self.lead_us = int(lead_time_ms * 1000)
+        self.send = send if send is not None else server.broadcast_bytes
+
+        self._queue = []  # heap of (release_us, order, start_at_us, payload)
+        self._order = itertools.count()
+        self._wakeup = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.released = 0
+        self.late = 0  # triggers released after their release time had passed
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="TriggerScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def schedule(self, payload, beats=1):
+        """
+        Queue an animation_handler.Payload for the next boundary that can still
+        be reached with the configured lead time.
+
+        Returns:
+            int: Target start time on the server clock (microseconds).
+        """
+        now = wire_protocol.server_time_us()
+        start_at = self.beat_clock.next_boundary(now + self.lead_us, beats)
+        release_at = start_at - self.lead_us
+        with self._wakeup:
+            heapq.heappush(self._queue, (release_at, next(self._order), start_at, payload))
+            self._wakeup.notify()
+        return start_at
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if not self._running:
+                    return
+                if not self._queue:
+                    self._wakeup.wait()
+                    continue
+                release_at, _, start_at, payload = self._queue[0]
+                wait_us = release_at - wire_protocol.server_time_us()
+                if wait_us > 0:
+                    self._wakeup.wait(timeout=wait_us / 1_000_000)
+                    continue
+                heapq.heappop(self._queue)
+
+            # Send outside the lock so a slow socket never blocks schedule()
+            if wait_us < -1000:
+                self.late += 1
+            # Latency is measured from release, the wait for the beat is intentional
+            trigger = latency_stats.stats.start_trigger(payload.name)
+            data, binary = stamp_json(payload.data, start_at), stamp_binary(payload.binary, start_at)
+            latency_stats.stats.mark_serialized(trigger)
+            self.send(data, binary, payload.target, trigger)
+            self.released += 1
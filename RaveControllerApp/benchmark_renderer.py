@@ -0,0 +1,102 @@
+'''
+Benchmark for the host-side LED renderer.
+
+Renders frames with a mix of overlapping Blink and FuseWave effects for several
+strip x LED layouts and encodes every strip's row as a MSG_PIXEL_FRAME, i.e. all
+the per-frame work PixelStreamer does before handing bytes to the server. Reports
+the per-frame latency distribution and the sustainable frame rate on one core,
+and fails if any layout cannot keep up with --min-fps at p99.
+
+Usage:
+    python benchmark_renderer.py
+    python benchmark_renderer.py --layouts 40x150,100x300 --effects 8 --output render.json
+'''
+import argparse
+import json
+import time
+
+import numpy as np
+
+import wire_protocol
+from led_renderer import LedRenderer
+
+
+DEFAULT_LAYOUTS = "10x150,40x150,100x150,100x300"
+
+SCHEMAS = [
+    {"Animation": "Blink", "r": 255, "g": 0, "b": 0, "BPM": 128, "beatPercentage": 0.5},
+    {"Animation": "FuseWave", "r": 0, "g": 255, "b": 255, "BPM": 128, "beatPercentage": 2, "chunkSize": 5},
+    {"Animation": "FuseWave", "r": 255, "g": 0, "b": 255, "BPM": 140, "beatPercentage": 1, "chunkSize": 12},
+    {"Animation": "Blink", "r": 0, "g": 0, "b": 255, "BPM": 100, "beatPercentage": 1},
+]
+
+
+def bench_layout(num_strips, num_leds, num_effects, frames):
+    renderer = LedRenderer(num_strips, num_leds)
+    rng = np.random.default_rng(0)
+
+    def retrigger(t):
+        # Keep num_effects alive all the time, each on a random half of the strips
+        while len(renderer.effects) < num_effects:
+            schema = dict(SCHEMAS[len(renderer.effects) % len(SCHEMAS)])
+            schema["BPM"] = max(1, schema["BPM"] // 8)  # long enough to stay active between refills
+            strips = rng.choice(num_strips, size=max(1, num_strips // 2), replace=False)
+            renderer.trigger(schema, start_s=t, strips=strips)
+
+    durations = np.empty(frames)
+    t = 0.0
+    for i in range(frames):
+        t += 1 / 60
+        retrigger(t)
+        start = time.perf_counter_ns()
+        frame = renderer.render(t)
+        for row in range(num_strips):
+            wire_protocol.encode_pixel_frame(i, frame[row])
+        durations[i] = time.perf_counter_ns() - start
+    durations /= 1e6
+
+    lit = int(np.count_nonzero(frame.any(axis=2)))
+    return {
+        "strips": num_strips,
+        "leds_per_strip": num_leds,
+        "total_leds": num_strips * num_leds,
+        "effects": num_effects,
+        "frames": frames,
+        "mean_ms": round(float(durations.mean()), 4),
+        "p50_ms": round(float(np.percentile(durations, 50)), 4),
+        "p99_ms": round(float(np.percentile(durations, 99)), 4),
+        "max_ms": round(float(durations.max()), 4),
+        "fps_at_p99": round(1000 / float(np.percentile(durations, 99)), 1),
+        "lit_leds_last_frame": lit,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the host-side LED renderer.")
+    parser.add_argument("--layouts", default=DEFAULT_LAYOUTS, help="comma separated STRIPSxLEDS layouts")
+    parser.add_argument("--effects", type=int, default=6, help="effects active in every frame")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--min-fps", type=float, default=60)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for layout in args.layouts.split(","):
+        num_strips, num_leds = (int(n) for n in layout.lower().split("x"))
+        result = bench_layout(num_strips, num_leds, args.effects, args.frames)
+        results.append(result)
+        status = "ok" if result["fps_at_p99"] >= args.min_fps else "TOO SLOW"
+        print(f"{num_strips:>4} strips x {num_leds:<4} LEDs ({result['total_leds']:>6} LEDs, {args.effects} effects): "
+              f"p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms -> {result['fps_at_p99']} fps  [{status}]")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if any(result["fps_at_p99"] < args.min_fps for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+'''
+Client identity and group addressing.
+
+Strips introduce themselves in their hello message:
+    {"id": "esp32_AA:BB:...", "tags": ["stage-left", "ceiling"], ...}
+
+ClientRegistry indexes connected clients by id and by tag, so a message for a
+group is only sent to the clients in that group. A target is a tag, a client id,
+or a list of those; None means every client.
+'''
+import threading
+
+
+class ClientRegistry:
+    def __init__(self):
+        self.by_id = {}    # client id -> client
+        self.by_tag = {}   # tag -> set of clients
+        self._lock = threading.Lock()  # threaded server registers from many threads
+
+    def register(self, client, client_id, tags=()):
+        """Record (or update) a client's id and tags from its hello message."""
+        if isinstance(tags, str):
+            tags = [tags]
+        with self._lock:
+            self._remove(client)
+            client.client_id = client_id
+            client.tags = set(tags)
+            if client_id:
+                self.by_id[client_id] = client
+            for tag in client.tags:
+                self.by_tag.setdefault(tag, set()).add(client)
+
+    def unregister(self, client):
+        with self._lock:
+            self._remove(client)
+
+    def _remove(self, client):
+        client_id = getattr(client, "client_id", None)
+        if client_id is not None and self.by_id.get(client_id) is client:
+            del self.by_id[client_id]
+        for tag in getattr(client, "tags", ()):
+            members = self.by_tag.get(tag)
+            if members is not None:
+                members.discard(client)
+                if not members:
+                    del self.by_tag[tag]
+
+    def resolve(self, target):
+        """
+        Clients addressed by target.
+
+        Args:
+            target (str or list): Tags and/or client ids.
+
+        Returns:
+            set: Matching clients (empty if nothing matches).
+        """
+        names = [target] if isinstance(target, str) else target
+        matched = set()
+        with self._lock:
+            for name in names:
+                client = self.by_id.get(name)
+                if client is not None:
+                    matched.add(client)
+                matched.update(self.by_tag.get(name, ()))
+        return matched
+
+    def identified(self):
+        """Every client that has sent a hello with an id."""
+        with self._lock:
+            return list(self.by_id.values())
+
+    def groups(self):
+        """Tag -> client ids, for display."""
+        with self._lock:
+            return {tag: sorted(str(c.client_id) for c in members) for tag, members in self.by_tag.items()}
@@ -0,0 +1,275 @@
+'''
+Latency and throughput instrumentation for the controller -> strip path.
+
+Every trigger gets a Trigger record with timestamps on the server clock
+(wire_protocol.server_time_us):
+    pressed     key press seen by the controller
+    serialized  payload stamped and handed to the server
+    sent        per client, once the bytes were written to its socket
+    ack         per client, when the strip reports it started the animation
+
+From those, per client LatencyHistograms are kept for:
+    serialize   pressed -> serialized   (controller)
+    send        pressed -> sent         (controller + server queueing)
+    ack         pressed -> ack          (end to end)
+    ack_rtt     sent -> ack             (Wi-Fi + firmware)
+
+ACKs are optional: with REQUEST_ACKS set, triggers carry an id ("trg" in JSON,
+wire_protocol.with_trigger_id in binary) and strips answer {"type":"ack","trg":id}.
+
+Results are printed as a periodic [LATENCY] log line and served as JSON on
+http://127.0.0.1:STATS_HTTP_PORT/ while reporting is running.
+'''
+import itertools
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import wire_protocol
+
+
+REQUEST_ACKS = False      # tag triggers with an id and ask strips to acknowledge them
+STATS_LOG_INTERVAL_S = 10
+STATS_HTTP_PORT = 6081
+MAX_PENDING_TRIGGERS = 256  # triggers kept around waiting for ACKs
+
+STAGES = ("serialize", "send", "ack", "ack_rtt")
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of microsecond latencies: linear buckets up to 2**SUB_BITS,
+    then 2**(SUB_BITS - 1) buckets per power of two, so every recorded value is
+    kept to within about 3% with a few hundred counters and O(1) record().
+    """
+
+    SUB_BITS = 6
+    _SUB = 1 << SUB_BITS
+    _HALF = _SUB >> 1
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < self._SUB:
+            return value
+        shift = value.bit_length() - self.SUB_BITS
+        return self._SUB + (shift - 1) * self._HALF + (value >> shift) - self._HALF
+
+    def _bucket_value(self, index):
+        """Representative (midpoint) value of a bucket."""
+        if index < self._SUB:
+            return index
+        shift = (index - self._SUB) // self._HALF + 1
+        low = ((index - self._SUB) % self._HALF + self._HALF) << shift
+        return low + (1 << shift) // 2
+
+    def record(self, value_us):
+        value = max(0, int(value_us))
+        index = self._index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        if self.count == 0:
+            return 0
+        rank = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Counts and percentiles in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count / 1000, 3) if self.count else 0,
+            "p50_ms": round(self.percentile(50) / 1000, 3),
+            "p90_ms": round(self.percentile(90) / 1000, 3),
+            "p99_ms": round(self.percentile(99) / 1000, 3),
+            "max_ms": round(self.max / 1000, 3),
+        }
+
+
+class Trigger:
+    def __init__(self, trigger_id, name):
+        self.id = trigger_id
+        self.name = name
+        self.pressed_us = wire_protocol.server_time_us()
+        self.serialized_us = None
+        self.sent_us = {}  # client name -> time the bytes were written
+
+
+def client_name(client):
+    """Stable name for a client: its hello id, else its address."""
+    client_id = getattr(client, "client_id", None)
+    return client_id if client_id is not None else f"{client.addr[0]}:{client.addr[1]}"
+
+
+class LatencyStats:
+    def __init__(self):
+        self.histograms = {}  # client name -> stage -> LatencyHistogram
+        self.bytes_sent = {}  # client name -> bytes of triggers sent
+        self.triggers = 0
+        self.acks = 0
+        self.unmatched_acks = 0
+
+        self._ids = itertools.count(1)
+        self._pending = OrderedDict()  # trigger id -> Trigger, oldest first
+        self._lock = threading.Lock()  # records come from the server loop and client threads
+
+        self._reporting = False
+        self._report_thread = None
+        self._http = None
+        self._last_reported_triggers = 0
+
+    ### Recording ###
+
+    def start_trigger(self, name):
+        """Call at key press; the returned Trigger travels with the payload."""
+        with self._lock:
+            trigger = Trigger(next(self._ids) & 0xFFFFFFFF, name)
+            self.triggers += 1
+            if REQUEST_ACKS:
+                self._pending[trigger.id] = trigger
+                while len(self._pending) > MAX_PENDING_TRIGGERS:
+                    self._pending.popitem(last=False)
+        return trigger
+
+    def mark_serialized(self, trigger):
+        trigger.serialized_us = wire_protocol.server_time_us()
+        self._record("controller", "serialize", trigger.serialized_us - trigger.pressed_us)
+
+    def record_send(self, client, trigger, num_bytes):
+        """Call once a trigger's bytes were written to a client's socket."""
+        now = wire_protocol.server_time_us()
+        name = client_name(client)
+        trigger.sent_us[name] = now
+        self._record(name, "send", now - trigger.pressed_us, num_bytes)
+
+    def record_ack(self, client, trigger_id, received_us=None):
+        """Handle {"type":"ack","trg":id} from a strip."""
+        now = wire_protocol.server_time_us() if received_us is None else received_us
+        name = client_name(client)
+        with self._lock:
+            trigger = self._pending.get(trigger_id)
+            if trigger is None:
+                self.unmatched_acks += 1
+                return
+            self.acks += 1
+        self._record(name, "ack", now - trigger.pressed_us)
+        sent_us = trigger.sent_us.get(name)
+        if sent_us is not None:
+            self._record(name, "ack_rtt", now - sent_us)
+
+    def _record(self, name, stage, value_us, num_bytes=0):
+        with self._lock:
+            stages = self.histograms.get(name)
+            if stages is None:
+                stages = self.histograms[name] = {stage_name: LatencyHistogram() for stage_name in STAGES}
+            stages[stage].record(value_us)
+            if num_bytes:
+                self.bytes_sent[name] = self.bytes_sent.get(name, 0) + num_bytes
+
+    ### Tagging ###
+
+    @staticmethod
+    def tag(data, binary_data, trigger):
+        """Add the trigger id to both encodings when ACKs are requested."""
+        if trigger is None or not REQUEST_ACKS:
+            return data, binary_data
+        data = data[:-2] + b',"trg":' + str(trigger.id).encode() + b'}\n'
+        if binary_data is not None:
+            binary_data = wire_protocol.with_trigger_id(binary_data, trigger.id)
+        return data, binary_data
+
+    ### Reporting ###
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "triggers": self.triggers,
+                "acks": self.acks,
+                "unmatched_acks": self.unmatched_acks,
+                "clients": {name: dict({stage: hist.summary() for stage, hist in stages.items()},
+                                       bytes_sent=self.bytes_sent.get(name, 0))
+                            for name, stages in self.histograms.items()},
+            }
+
+    def log_line(self):
+        snapshot = self.snapshot()
+        parts = []
+        for name, stages in snapshot["clients"].items():
+            if name == "controller":
+                parts.append(f"serialize p50={stages['serialize']['p50_ms']}ms")
+                continue
+            part = f"{name} send p50={stages['send']['p50_ms']} p99={stages['send']['p99_ms']}ms"
+            if stages["ack"]["count"]:
+                part += f" ack p50={stages['ack']['p50_ms']} p99={stages['ack']['p99_ms']}ms rtt p50={stages['ack_rtt']['p50_ms']}ms"
+            parts.append(part)
+        return f"[LATENCY] triggers={snapshot['triggers']} acks={snapshot['acks']} | " + " | ".join(parts)
+
+    def start_reporting(self, interval_s=STATS_LOG_INTERVAL_S, http_port=STATS_HTTP_PORT):
+        """Print a log line every interval_s (when there were new triggers) and serve JSON stats."""
+        if self._reporting:
+            return
+        self._reporting = True
+        self._wakeup = threading.Event()
+        self._report_thread = threading.Thread(target=self._report_loop, args=(interval_s,),
+                                               name="LatencyReport", daemon=True)
+        self._report_thread.start()
+
+        if http_port:
+            stats = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = json.dumps(stats.snapshot(), indent=2).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # keep the console for the controller
+
+            try:
+                self._http = ThreadingHTTPServer(("127.0.0.1", http_port), Handler)
+                threading.Thread(target=self._http.serve_forever, name="LatencyHTTP", daemon=True).start()
+                print(f"[LATENCY] Stats at http://127.0.0.1:{http_port}/")
+            except OSError as e:
+                print(f"[LATENCY] Stats endpoint unavailable: {e}")
+                self._http = None
+
+    def stop_reporting(self):
+        if not self._reporting:
+            return
+        self._reporting = False
+        self._wakeup.set()
+        self._report_thread.join()
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+        if self.triggers:
+            print(self.log_line())
+
+    def _report_loop(self, interval_s):
+        while not self._wakeup.wait(interval_s):
+            if self.triggers != self._last_reported_triggers:
+                self._last_reported_triggers = self.triggers
+                print(self.log_line())
+
+
+stats = LatencyStats()
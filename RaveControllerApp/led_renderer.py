@@ -0,0 +1,216 @@
+'''
+Host-side LED rendering.
+
+LedRenderer computes whole RGB frames for num_strips x num_leds pixels as one NumPy
+array, so new effects only need Python code instead of a firmware reflash. Effects
+are vectorized across every pixel of every strip: each one builds a
+(strips x leds) mask for the frame time and max-blends its colour into the frame.
+Like the firmware's refresh task, the frame starts black every time.
+
+Blink and FuseWave are ports of the firmware animations (led_animations/src), with
+the same BPM / beatPercentage / chunkSize meaning.
+
+PixelStreamer renders at a fixed rate and sends each strip its row as a
+wire_protocol MSG_PIXEL_FRAME through the server. Only clients on the binary
+protocol get pixel frames. Rows can also be given to pixel_outputs backends
+(DDP, E1.31, Art-Net) to drive third-party controllers; strips get the rest.
+'''
+import threading
+import time
+
+import numpy as np
+
+import server
+import wire_protocol
+
+
+RENDER_FPS = 60
+DEFAULT_CHUNK_SIZE = 5  # FuseWave chunkSize default in the firmware
+
+
+class Effect:
+    """One triggered animation. Subclasses fill mask with the pixels lit at elapsed_s."""
+
+    def __init__(self, color, start_s, strips, num_strips):
+        self.color = np.asarray(color, dtype=np.uint8)
+        self.start_s = start_s
+        self.strip_mask = np.zeros(num_strips, dtype=bool)
+        self.strip_mask[strips if strips is not None else slice(None)] = True
+        self.duration_s = 0.0
+
+    def finished(self, t):
+        return t - self.start_s > self.duration_s
+
+    def render_mask(self, elapsed_s, mask):
+        raise NotImplementedError
+
+
+class Blink(Effect):
+    """Every LED on for beatPercentage of a beat."""
+
+    def __init__(self, schema, start_s, strips, num_strips):
+        super().__init__((schema["r"], schema["g"], schema["b"]), start_s, strips, num_strips)
+        beat_s = 60.0 / schema["BPM"]
+        self.duration_s = beat_s * schema["beatPercentage"]
+
+    def render_mask(self, elapsed_s, mask):
+        mask[:] = self.strip_mask[:, None] & (0 <= elapsed_s < self.duration_s)
+
+
+class FuseWave(Effect):
+    """A chunk of chunkSize LEDs running down the strip over beatPercentage of a beat."""
+
+    def __init__(self, schema, start_s, strips, num_strips, led_chunks):
+        """led_chunks: led index // chunkSize for every LED (LedRenderer.led_chunks)."""
+        super().__init__((schema["r"], schema["g"], schema["b"]), start_s, strips, num_strips)
+        self.chunk_size = max(1, schema.get("chunkSize") or DEFAULT_CHUNK_SIZE)
+        self.led_chunks = led_chunks
+        self.num_frames = max(1, len(led_chunks) // self.chunk_size)
+        beat_s = 60.0 / schema["BPM"]
+        self.frame_s = beat_s * schema["beatPercentage"] / self.num_frames
+        self.duration_s = self.frame_s * (self.num_frames + 1)
+
+    def render_mask(self, elapsed_s, mask):
+        if elapsed_s < 0:
+            mask[:] = False
+            return
+        chunk = int(elapsed_s // self.frame_s) if self.frame_s > 0 else self.num_frames
+        np.logical_and(self.strip_mask[:, None], self.led_chunks == chunk, out=mask)
+
+
+class LedRenderer:
+    def __init__(self, num_strips, num_leds, clock=time.perf_counter):
+        self.num_strips = num_strips
+        self.num_leds = num_leds
+        self.clock = clock
+
+        self.frame = np.zeros((num_strips, num_leds, 3), dtype=np.uint8)
+        self.effects = []
+        self._lock = threading.Lock()  # triggers come from the keyboard thread
+
+        # Scratch buffers reused every frame
+        self._mask = np.empty((num_strips, num_leds), dtype=bool)
+        self._layer = np.empty_like(self.frame)
+        self._chunk_index = {}  # chunk size -> led // chunk size
+
+    def led_chunks(self, chunk_size):
+        index = self._chunk_index.get(chunk_size)
+        if index is None:
+            index = self._chunk_index[chunk_size] = np.arange(self.num_leds) // chunk_size
+        return index
+
+    def trigger(self, schema, start_s=None, strips=None):
+        """
+        Start an animation from a mapping schema.
+
+        Args:
+            schema (dict): Schema as stored in animation_mappings.json.
+            start_s (float, optional): Start time on the renderer clock, defaults to now.
+            strips (array-like, optional): Strip rows to draw on, defaults to all.
+
+        Returns:
+            Effect or None: None if the animation has no host-side renderer.
+        """
+        start_s = self.clock() if start_s is None else start_s
+        animation = schema.get("Animation")
+        if animation == "Blink":
+            effect = Blink(schema, start_s, strips, self.num_strips)
+        elif animation == "FuseWave":
+            chunk_size = max(1, schema.get("chunkSize") or DEFAULT_CHUNK_SIZE)
+            effect = FuseWave(schema, start_s, strips, self.num_strips, self.led_chunks(chunk_size))
+        else:
+            print(f"[RENDER] No host renderer for animation '{animation}'")
+            return None
+        with self._lock:
+            self.effects.append(effect)
+        return effect
+
+    def render(self, t=None):
+        """Render the frame for time t (defaults to now) into self.frame and return it."""
+        t = self.clock() if t is None else t
+        frame = self.frame
+        frame.fill(0)
+
+        with self._lock:
+            self.effects = [effect for effect in self.effects if not effect.finished(t)]
+            effects = list(self.effects)
+
+        for effect in effects:
+            effect.render_mask(t - effect.start_s, self._mask)
+            np.multiply(self._mask[:, :, None], effect.color, out=self._layer, casting="unsafe")
+            np.maximum(frame, self._layer, out=frame)
+        return frame
+
+
+class PixelStreamer:
+    """Renders at a fixed rate and streams each strip its row of the frame."""
+
+    def __init__(self, renderer, fps=RENDER_FPS, outputs=None):
+        """outputs: optional {row: pixel_outputs.PixelOutput}; those rows are not sent to strips."""
+        self.renderer = renderer
+        self.period_s = 1.0 / fps
+        self.outputs = dict(outputs or {})
+        self.strip_rows = [row for row in range(renderer.num_strips) if row not in self.outputs]
+        if self.strip_rows and renderer.num_leds > wire_protocol.MAX_PIXEL_FRAME_LEDS:
+            raise ValueError(f"{renderer.num_leds} LEDs per strip do not fit a pixel frame "
+                             f"(at most {wire_protocol.MAX_PIXEL_FRAME_LEDS})")
+        self.strip_clients = []  # (row, client), refreshed every frame
+
+        self.frames = 0
+        self.late_frames = 0
+        self.render_time_s = 0.0
+
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PixelStreamer", daemon=True)
+        self._thread.start()
+        print(f"[RENDER] Streaming {self.renderer.num_strips} x {self.renderer.num_leds} pixels at {1 / self.period_s:.0f} fps")
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        print(f"[RENDER] frames={self.frames} late={self.late_frames} last_render_ms={self.render_time_s * 1000:.2f}")
+        for row, output in sorted(self.outputs.items()):
+            print(f"[RENDER] row {row} -> {output}: packets={output.packets} errors={output.send_errors}")
+            output.close()
+
+    def rows_for(self, target):
+        """Rows of the strips a mapping target addresses (None = every row)."""
+        if target is None:
+            return None
+        clients = server.registry.resolve(target)
+        return [row for row, client in self.strip_clients if client in clients]
+
+    def assign_strips(self):
+        """Map rows to binary clients, ordered by client id so rows stay stable."""
+        binary = [client for client in server.registry.identified()
+                  if client.protocol == wire_protocol.PROTO_BINARY]
+        binary.sort(key=lambda client: client.client_id)
+        self.strip_clients = list(zip(self.strip_rows, binary))
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while self._running:
+            started = time.perf_counter()
+            self.assign_strips()
+            frame = self.renderer.render()
+            frames = [(client, wire_protocol.encode_pixel_frame(self.frames, frame[row]))
+                      for row, client in self.strip_clients]
+            if frames:
+                server.stream_pixels(frames)
+            for row, output in self.outputs.items():
+                output.send_frame(frame[row])
+            self.frames += 1
+            self.render_time_s = time.perf_counter() - started
+
+            next_tick += self.period_s
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.late_frames += 1
+                next_tick = time.perf_counter()
@@ -0,0 +1,289 @@
+'''
+Load test for the TCP server with simulated ESP32 strips.
+
+For each client count the harness starts the server (server.start_server, in the
+requested SERVER_MODE) in a child process, connects that many fake strips speaking
+the newline-JSON protocol, and has the server broadcast timestamped animation
+messages through server.broadcast_bytes at a fixed rate. It reports:
+    fan-out latency   time until the last healthy strip received each broadcast
+    delivery latency  per strip, per message
+    throughput        messages delivered per second across all strips
+    server CPU        % of one core, and the peak thread count of the server process
+
+Some strips can be made slow (read a little, every so often) or stalled (never
+read after the hello) to see how they affect the healthy ones. Timestamps use
+time.monotonic on both sides, so the harness must run on the same machine.
+CPU and thread sampling reads /proc and is skipped where that is unavailable.
+
+Usage:
+    python load_test_harness.py --clients 50,100,200,400 --mode threaded --slow 5 --stall 1
+    python load_test_harness.py --clients 400 --mode asyncio --output load.json
+'''
+import argparse
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+HOST = "127.0.0.1"
+
+# Same fields the manual controller sends, plus the load test's own seq/sent_us
+ANIMATION = {"name": "load", "Animation": "Blink", "r": 255, "g": 0, "b": 0, "BPM": 128, "beatPercentage": 50}
+
+
+def now_us():
+    return time.monotonic_ns() // 1000
+
+
+### Server side (child process) ###
+
+def serve(args):
+    """Run the real server and broadcast once every expected client has said hello."""
+    import server
+
+    server.PORT = args.port
+    server.SERVER_MODE = args.mode
+    threading.Thread(target=server.start_server, daemon=True).start()
+
+    def connected():
+        if server.async_server is not None:
+            return len(server.async_server.clients)
+        return len(server.clients)
+
+    deadline = time.monotonic() + args.connect_timeout
+    while connected() < args.expect_clients and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.5)  # let hellos settle
+
+    period = 1.0 / args.rate
+    started = time.perf_counter()
+    for seq in range(args.messages):
+        message = dict(ANIMATION, seq=seq, sent_us=now_us())
+        server.broadcast_bytes((json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8"))
+        time.sleep(max(0.0, started + (seq + 1) * period - time.perf_counter()))
+
+    server.broadcast_bytes(b'{"type":"done"}\n')
+    time.sleep(args.drain_seconds)
+    os._exit(0)  # the threaded server has non-daemon client threads
+
+
+### Fake strips ###
+
+class FakeStrip:
+    def __init__(self, index, port, behaviour):
+        self.index = index
+        self.behaviour = behaviour  # "normal", "slow" or "stall"
+        self.sock = socket.create_connection((HOST, port))
+        hello = {"id": f"fake_{index:04d}", "tags": [behaviour], "status": "online", "proto": ["json"]}
+        self.sock.sendall((json.dumps(hello) + "\n").encode("utf-8"))
+        self.sock.setblocking(False)
+        self.buffer = b""
+        self.latencies_us = {}  # seq -> delivery latency
+        self.done = False
+
+    def read(self, max_bytes=65536):
+        try:
+            data = self.sock.recv(max_bytes)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.done = True
+            return
+        if not data:
+            self.done = True
+            return
+        received = now_us()
+        self.buffer += data
+        while b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if msg.get("type") == "done":
+                self.done = True
+            elif "seq" in msg:
+                self.latencies_us[msg["seq"]] = received - msg["sent_us"]
+
+    def close(self):
+        self.sock.close()
+
+
+def read_normal(strips, stop):
+    selector = selectors.DefaultSelector()
+    for strip in strips:
+        selector.register(strip.sock, selectors.EVENT_READ, strip)
+    while not stop.is_set() and not all(strip.done for strip in strips):
+        for key, _ in selector.select(timeout=0.1):
+            key.data.read()
+    selector.close()
+
+
+def read_slow(strips, stop, interval_s, chunk):
+    while not stop.is_set() and not all(strip.done for strip in strips):
+        for strip in strips:
+            strip.read(chunk)
+        time.sleep(interval_s)
+
+
+### Measurement ###
+
+def proc_sample(pid):
+    """(cpu seconds, threads) of a process from /proc, or None."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return (int(fields[11]) + int(fields[12])) / ticks, int(fields[17])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def run_step(args, num_clients, port):
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--mode", args.mode,
+           "--expect-clients", str(num_clients), "--messages", str(args.messages), "--rate", str(args.rate),
+           "--drain-seconds", str(args.drain_seconds)]
+    child = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    strips = []
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection((HOST, port), timeout=0.2).close()  # probe; the server sees a short-lived client
+                break
+            except OSError:
+                if time.monotonic() > deadline or child.poll() is not None:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.1)
+
+        behaviours = ["stall"] * args.stall + ["slow"] * args.slow
+        behaviours += ["normal"] * max(0, num_clients - len(behaviours))
+        strips = [FakeStrip(i, port, behaviour) for i, behaviour in enumerate(behaviours[:num_clients])]
+
+        normal = [s for s in strips if s.behaviour == "normal"]
+        slow = [s for s in strips if s.behaviour == "slow"]
+        stop = threading.Event()
+        readers = [threading.Thread(target=read_normal, args=(normal, stop), daemon=True)]
+        if slow:
+            readers.append(threading.Thread(target=read_slow, args=(slow, stop, args.slow_interval, args.slow_chunk),
+                                            daemon=True))
+        for reader in readers:
+            reader.start()
+
+        # Sample the server while it broadcasts
+        samples = []
+        test_seconds = args.messages / args.rate
+        deadline = time.monotonic() + test_seconds + args.drain_seconds + 15
+        while child.poll() is None and time.monotonic() < deadline:
+            if normal and all(s.done for s in normal):
+                break
+            sample = proc_sample(child.pid)
+            if sample is not None:
+                samples.append((time.monotonic(), *sample))
+            time.sleep(0.2)
+
+        stop.set()
+        for reader in readers:
+            reader.join()
+    finally:
+        child.kill()
+        child.wait()
+        for strip in strips:
+            strip.close()
+
+    return summarize(num_clients, strips, samples, args)
+
+
+def summarize(num_clients, strips, samples, args):
+    normal = [s for s in strips if s.behaviour == "normal"]
+    deliveries = np.array([lat for s in normal for lat in s.latencies_us.values()], dtype=np.float64)
+
+    fanout = []
+    for seq in range(args.messages):
+        per_strip = [s.latencies_us.get(seq) for s in normal]
+        if per_strip and all(lat is not None for lat in per_strip):
+            fanout.append(max(per_strip))
+    fanout = np.array(fanout, dtype=np.float64)
+
+    delivered = sum(len(s.latencies_us) for s in strips)
+    duration_s = args.messages / args.rate
+
+    def pct(values, p):
+        return round(float(np.percentile(values, p)) / 1000, 3) if len(values) else None
+
+    result = {
+        "clients": num_clients,
+        "mode": args.mode,
+        "slow": args.slow,
+        "stall": args.stall,
+        "messages": args.messages,
+        "rate_hz": args.rate,
+        "delivered": delivered,
+        "expected_normal": args.messages * len(normal),
+        "delivered_normal": int(len(deliveries)),
+        "complete_fanouts": int(len(fanout)),
+        "throughput_msgs_per_s": round(delivered / duration_s, 1),
+        "delivery_p50_ms": pct(deliveries, 50),
+        "delivery_p99_ms": pct(deliveries, 99),
+        "fanout_p50_ms": pct(fanout, 50),
+        "fanout_p99_ms": pct(fanout, 99),
+        "fanout_max_ms": round(float(fanout.max()) / 1000, 3) if len(fanout) else None,
+        "server_cpu_percent": None,
+        "server_threads_max": None,
+    }
+    if len(samples) >= 2:
+        (t0, cpu0, _), (t1, cpu1, _) = samples[0], samples[-1]
+        result["server_cpu_percent"] = round(100 * (cpu1 - cpu0) / (t1 - t0), 1) if t1 > t0 else None
+        result["server_threads_max"] = max(threads for _, _, threads in samples)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the strip server with simulated ESP32 clients.")
+    parser.add_argument("--clients", default="50,100,200", help="comma separated client counts to step through")
+    parser.add_argument("--mode", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--messages", type=int, default=200, help="broadcasts per step")
+    parser.add_argument("--rate", type=float, default=20, help="broadcasts per second")
+    parser.add_argument("--slow", type=int, default=0, help="strips that read slowly")
+    parser.add_argument("--stall", type=int, default=0, help="strips that never read")
+    parser.add_argument("--slow-interval", type=float, default=0.25, help="seconds between reads of a slow strip")
+    parser.add_argument("--slow-chunk", type=int, default=256, help="bytes a slow strip reads at a time")
+    parser.add_argument("--port", type=int, default=6200, help="first port; each step uses the next one")
+    parser.add_argument("--drain-seconds", type=float, default=2.0, help="time after the last broadcast")
+    parser.add_argument("--output", help="write all steps as JSON")
+    # Internal: run as the server child process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--expect-clients", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--connect-timeout", type=float, default=30, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    results = []
+    for step, num_clients in enumerate(int(n) for n in args.clients.split(",")):
+        result = run_step(args, num_clients, args.port + step)
+        results.append(result)
+        print(f"clients={num_clients:<5} delivered={result['delivered_normal']}/{result['expected_normal']} "
+              f"fanout p50={result['fanout_p50_ms']}ms p99={result['fanout_p99_ms']}ms max={result['fanout_max_ms']}ms "
+              f"delivery p99={result['delivery_p99_ms']}ms throughput={result['throughput_msgs_per_s']}/s "
+              f"cpu={result['server_cpu_percent']}% threads={result['server_threads_max']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+'''
+Onset and drop detection on the Visualizer's band frames, to trigger mapped
+animations without a key press.
+
+OnsetDetector works on one MSG_BAND_FRAME's levels at a time (the AudioAnalyzer
+band energies, quantised to 0-255), vectorized across bands:
+
+    flux       half-wave rectified level rise per band since the last frame
+    threshold  per band: mean + sensitivity * mean deviation of the recent flux,
+               plus min_flux; both adapt with an EMA over adapt_s
+    onset      flux above threshold, at most once per refractory_s per band
+
+Bands are log spaced from 20 Hz, so onsets in the lowest quarter of the bands
+(below ~115 Hz with 8 bands) are kicks and onsets in the top three eighths
+(above ~1.6 kHz) are snares, claps and hi-hats.
+
+Build-ups and drops come from the section levels: when the bass stays
+breakdown_drop below its long-term level the track is in a breakdown, a rising
+top end or a fast snare roll in it is a build-up, and the first kick whose bass
+is back near the long-term level is the drop.
+
+All state is preallocated; process() only works in place.
+
+AutoTrigger connects a detector to StreamRelay frames and sends the animation
+mapped to each event straight from the receiving thread, with the precompiled
+payloads the manual controller uses. Event-to-wire latency (frame received ->
+broadcast handed to every socket / queue) is kept in a LatencyHistogram, and
+frames that arrive too late after the audio they describe do not fire.
+'''
+import math
+
+import numpy as np
+
+import animation_handler
+import latency_stats
+import server
+import wire_protocol
+
+
+EVENT_KICK = "kick"
+EVENT_SNARE = "snare"      # snare, clap or hi-hat
+EVENT_BUILDUP = "buildup"
+EVENT_DROP = "drop"
+EVENTS = (EVENT_KICK, EVENT_SNARE, EVENT_BUILDUP, EVENT_DROP)
+KICK, SNARE, BUILDUP, DROP = range(len(EVENTS))
+
+SECTION_NORMAL = "normal"
+SECTION_BREAKDOWN = "breakdown"
+SECTION_BUILDUP = "buildup"
+
+MAX_EVENT_LAG_MS = 50  # frames later than this behind the freshest ones do not fire
+
+
+def ema_alpha(time_constant_s, frame_rate_hz):
+    """Per-frame EMA weight for a time constant."""
+    return 1.0 - math.exp(-1.0 / (time_constant_s * frame_rate_hz))
+
+
+class OnsetDetector:
+    def __init__(self, num_bands, frame_rate_hz=50, low_bands=None, high_bands=None,
+                 sensitivity=2.5, min_flux=8.0, refractory_s=0.1, adapt_s=1.0, warmup_s=1.0,
+                 breakdown_drop=30.0, breakdown_s=1.0, buildup_rise=12.0, buildup_rate_hz=5.0,
+                 drop_margin=12.0, kick_mid_ratio=0.7):
+        """
+        Args:
+            num_bands (int): Bands per frame.
+            frame_rate_hz (float): Analysis frames per second (50, or 86 in overlapped mode).
+            low_bands, high_bands (int, optional): Bands counted as kick / snare bands.
+            sensitivity (float): Threshold in mean deviations above the mean flux.
+            min_flux (float): Level rise always needed for an onset, so silence and noise do not trigger.
+            refractory_s (float): Shortest time between two onsets in one band.
+            adapt_s (float): Time constant of the flux statistics.
+            warmup_s (float): No events until the statistics have seen this much audio.
+            breakdown_drop (float): Levels the bass must fall below its long-term level for a breakdown.
+            breakdown_s (float): How long it must stay there.
+            buildup_rise (float): Top-end level rise over the breakdown start that makes it a build-up.
+            buildup_rate_hz (float): Snare onset rate that makes it a build-up (a snare roll).
+            drop_margin (float): A kick with bass within this of the long-term level ends the breakdown.
+            kick_mid_ratio (float): Low-band onsets are kicks only if the low bands rose at least
+                this much relative to the mid bands.
+        """
+        self.num_bands = num_bands
+        self.frame_rate_hz = frame_rate_hz
+        self.low_bands = low_bands or max(1, num_bands // 4)
+        self.high_bands = high_bands or max(1, num_bands * 3 // 8)
+        self.sensitivity = sensitivity
+        self.min_flux = min_flux
+        self.refractory_frames = max(1, int(round(refractory_s * frame_rate_hz)))
+        self.warmup_frames = int(warmup_s * frame_rate_hz)
+        self.breakdown_drop = breakdown_drop
+        self.breakdown_frames = int(breakdown_s * frame_rate_hz)
+        self.buildup_rise = buildup_rise
+        self.buildup_rate_hz = buildup_rate_hz
+        self.drop_margin = drop_margin
+        self.kick_mid_ratio = kick_mid_ratio
+
+        self._adapt = ema_alpha(adapt_s, frame_rate_hz)
+        self._section_fast = ema_alpha(0.5, frame_rate_hz)   # section levels
+        self._section_slow = ema_alpha(8.0, frame_rate_hz)   # long-term reference
+        self._rate_alpha = ema_alpha(1.0, frame_rate_hz)     # snare onset rate
+
+        # Per-band state
+        self.levels = np.zeros(num_bands)
+        self.flux = np.zeros(num_bands)
+        self.flux_mean = np.zeros(num_bands)
+        self.flux_dev = np.zeros(num_bands)
+        self.threshold = np.zeros(num_bands)
+        self.onsets = np.zeros(num_bands, dtype=bool)
+        self._previous = np.zeros(num_bands)
+        self._deviation = np.zeros(num_bands)
+        self._spread = np.zeros(num_bands)
+        self._last_onset = np.full(num_bands, -self.refractory_frames, dtype=np.int64)
+        self._since_onset = np.zeros(num_bands, dtype=np.int64)
+        self._ready = np.zeros(num_bands, dtype=bool)
+        self._low_onsets = self.onsets[:self.low_bands]
+        self._high_onsets = self.onsets[num_bands - self.high_bands:]
+        self._low_weights = np.zeros(num_bands)
+        self._low_weights[:self.low_bands] = 1.0 / self.low_bands
+        self._high_weights = np.zeros(num_bands)
+        self._high_weights[num_bands - self.high_bands:] = 1.0 / self.high_bands
+        self._mid_weights = np.zeros(num_bands)  # between the kick and snare bands: snare bodies, vocals
+        mid_bands = num_bands - self.low_bands - self.high_bands
+        if mid_bands > 0:
+            self._mid_weights[self.low_bands:self.low_bands + mid_bands] = 1.0 / mid_bands
+
+        # Section state
+        self.section = SECTION_NORMAL
+        self.low_level = 0.0
+        self.high_level = 0.0
+        self.low_reference = 0.0
+        self.snare_rate_hz = 0.0
+        self._quiet_frames = 0
+        self._breakdown_high = 0.0
+
+        self.events = np.zeros(len(EVENTS), dtype=bool)  # events of the last frame, indexed like EVENTS
+        self.counts = [0] * len(EVENTS)
+        self.frames = 0
+
+    def process(self, levels):
+        """
+        Add one frame of band levels.
+
+        Args:
+            levels (array-like): num_bands levels on the band-frame 0-255 scale.
+
+        Returns:
+            bool: True if any event fired; which ones are in self.events.
+        """
+        frame = self.frames
+        self.frames += 1
+        np.copyto(self.levels, levels, casting="unsafe")
+        flux = self.flux
+        np.subtract(self.levels, self._previous, out=flux)
+        np.maximum(flux, 0.0, out=flux)
+        np.copyto(self._previous, self.levels)
+
+        # Per-band adaptive threshold and refractory period
+        threshold = self.threshold
+        np.multiply(self.flux_dev, self.sensitivity, out=threshold)
+        threshold += self.flux_mean
+        threshold += self.min_flux
+        np.greater(flux, threshold, out=self.onsets)
+        np.subtract(frame, self._last_onset, out=self._since_onset)
+        np.greater_equal(self._since_onset, self.refractory_frames, out=self._ready)
+        self.onsets &= self._ready
+        np.copyto(self._last_onset, frame, where=self.onsets)
+
+        # Adapt on the flux clipped to the threshold, so single hits barely move it
+        deviation, spread = self._deviation, self._spread
+        np.minimum(flux, threshold, out=deviation)
+        deviation -= self.flux_mean
+        np.abs(deviation, out=spread)
+        spread -= self.flux_dev
+        spread *= self._adapt
+        self.flux_dev += spread
+        deviation *= self._adapt
+        self.flux_mean += deviation
+
+        events = self.events
+        # A kick moves the low bands about as much as the mids (more, unless a snare hits with
+        # it); a snare or tom on its own only leaks a little into them
+        events[KICK] = (self._low_onsets.any()
+                        and np.dot(flux, self._low_weights) >= self.kick_mid_ratio * np.dot(flux, self._mid_weights))
+        events[SNARE] = self._high_onsets.any()
+        events[BUILDUP] = False
+        events[DROP] = False
+        self._update_section(events)
+
+        if frame < self.warmup_frames:
+            events[:] = False
+            return False
+        if not events.any():
+            return False
+        for index in range(len(EVENTS)):
+            if events[index]:
+                self.counts[index] += 1
+        return True
+
+    def _update_section(self, events):
+        low = float(np.dot(self.levels, self._low_weights))
+        high = float(np.dot(self.levels, self._high_weights))
+        self.low_level += self._section_fast * (low - self.low_level)
+        self.high_level += self._section_fast * (high - self.high_level)
+        self.snare_rate_hz += self._rate_alpha * (events[SNARE] * self.frame_rate_hz - self.snare_rate_hz)
+
+        if self.frames <= self.warmup_frames:
+            self.low_reference = self.low_level  # start the long-term level where the track is
+            return
+
+        if self.section == SECTION_NORMAL:
+            self.low_reference += self._section_slow * (self.low_level - self.low_reference)
+            if self.low_level < self.low_reference - self.breakdown_drop:
+                self._quiet_frames += 1
+            else:
+                self._quiet_frames = 0
+            if self._quiet_frames >= self.breakdown_frames:
+                self.section = SECTION_BREAKDOWN
+                self._breakdown_high = self.high_level
+            return
+
+        # Breakdown or build-up: the long-term bass level is held until the drop
+        if events[KICK] and low > self.low_reference - self.drop_margin:
+            events[DROP] = True
+            self.section = SECTION_NORMAL
+            self._quiet_frames = 0
+            return
+        if self.section == SECTION_BREAKDOWN and (self.high_level > self._breakdown_high + self.buildup_rise
+                                                  or self.snare_rate_hz >= self.buildup_rate_hz):
+            events[BUILDUP] = True
+            self.section = SECTION_BUILDUP
+
+    def stats(self):
+        return {"frames": self.frames, "section": self.section,
+                **{event: count for event, count in zip(EVENTS, self.counts)}}
+
+
+class AutoTrigger:
+    """Runs an OnsetDetector on relayed band frames and sends the animation mapped to each event."""
+
+    def __init__(self, bindings, frame_rate_hz=50, payloads=animation_handler.get_payloads,
+                 max_lag_ms=MAX_EVENT_LAG_MS, **detector_options):
+        """
+        Args:
+            bindings (dict): Event name (EVENTS) -> animation_mappings.json key.
+            frame_rate_hz (float): Analysis frames per second the Visualizer publishes.
+            payloads (callable): Returns the key -> Payload table, looked up at every event
+                so mapping edits apply right away.
+            max_lag_ms (float): Frames this much later than the freshest recent ones only update
+                the detector, their events are counted as stale instead of sent.
+            **detector_options: Passed on to OnsetDetector.
+        """
+        if not frame_rate_hz > 0:
+            raise ValueError(f"frame rate must be positive, got {frame_rate_hz}")
+        self.frame_rate_hz = frame_rate_hz
+        self.detector_options = detector_options
+        self.detector = None  # built for the band count of the first frame
+        self.keys = [bindings.get(event) for event in EVENTS]
+        self.payloads = payloads
+        self.max_lag_ms = max_lag_ms
+        self.budget_us = 1_000_000 / frame_rate_hz
+
+        self.event_to_wire = latency_stats.LatencyHistogram()  # frame received -> sent, per event
+        self.detect_us = latency_stats.LatencyHistogram()      # frame received -> detector done
+        self.over_budget = 0
+        self.sent = [0] * len(EVENTS)
+        self.stale = 0
+        self.unmapped = 0
+        self.errors = 0            # frames whose handling raised, logged and skipped
+        self.last_sent_seq = None  # seq of the frame behind the last sent event
+
+        self._lag_baseline_ms = None  # smallest arrival - position offset seen, tracks the freshest frames
+        self._lag_creep_ms = 1.0 / frame_rate_hz  # 1 ms per second, follows clock drift
+        self._last_position_ms = None
+
+    def on_frame(self, fields, datagram, received_us):
+        """StreamRelay callback: one decoded MSG_BAND_FRAME and its raw datagram."""
+        try:
+            self._handle_frame(fields, datagram, received_us)
+        except Exception as e:  # a bad frame or send must not stop the relay's receive thread
+            self.errors += 1
+            if self.errors == 1 or self.errors % 100 == 0:
+                print(f"[AUTO] Error handling frame {fields.get('seq')} ({self.errors} so far): "
+                      f"{type(e).__name__}: {e}")
+
+    def _handle_frame(self, fields, datagram, received_us):
+        num_bands = len(fields["levels"])
+        if self.detector is None or self.detector.num_bands != num_bands:
+            self.detector = OnsetDetector(num_bands, self.frame_rate_hz, **self.detector_options)
+            print(f"[AUTO] Detecting on {num_bands} bands at {self.frame_rate_hz:g} frames/s")
+        levels = np.frombuffer(datagram, dtype=np.uint8, count=num_bands, offset=wire_protocol.BAND_LEVELS_OFFSET)
+        fired = self.detector.process(levels)
+        processed_us = wire_protocol.server_time_us()
+        self.detect_us.record(processed_us - received_us)
+        if processed_us - received_us > self.budget_us:
+            self.over_budget += 1
+        stale = self._is_stale(fields["position_ms"], received_us)
+        if not fired:
+            return
+
+        for index, event in enumerate(EVENTS):
+            if not self.detector.events[index]:
+                continue
+            key = self.keys[index]
+            payload = self.payloads().get(key) if key is not None else None
+            if payload is None:
+                self.unmapped += 1
+                continue
+            if stale:
+                self.stale += 1
+                continue
+            # Send latency counts from the frame, not from detection. Detection time is in detect_us,
+            # not the "serialize" stage, which is the manual controller's key press -> payload time.
+            trigger = latency_stats.stats.start_trigger(payload.name)
+            trigger.pressed_us = received_us
+            server.broadcast_bytes(payload.data, payload.binary, payload.target, trigger)
+            self.event_to_wire.record(wire_protocol.server_time_us() - received_us)
+            self.sent[index] += 1
+            self.last_sent_seq = fields["seq"]
+
+    def _is_stale(self, position_ms, received_us):
+        """True if this frame arrived more than max_lag_ms later than the freshest recent frames."""
+        lag_ms = received_us / 1000.0 - position_ms
+        jumped = (self._last_position_ms is not None
+                  and abs(position_ms - self._last_position_ms) > 1000)  # seek or new track
+        self._last_position_ms = position_ms
+        if self._lag_baseline_ms is None or jumped or lag_ms < self._lag_baseline_ms:
+            self._lag_baseline_ms = lag_ms
+            return False
+        self._lag_baseline_ms += self._lag_creep_ms
+        return lag_ms - self._lag_baseline_ms > self.max_lag_ms
+
+    def stats(self):
+        return {
+            **(self.detector.stats() if self.detector is not None else {}),
+            "sent": {event: count for event, count in zip(EVENTS, self.sent)},
+            "stale": self.stale,
+            "unmapped": self.unmapped,
+            "errors": self.errors,
+            "over_budget": self.over_budget,
+            "detect": self.detect_us.summary(),
+            "event_to_wire": self.event_to_wire.summary(),
+        }
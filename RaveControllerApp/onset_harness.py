@@ -0,0 +1,289 @@
+'''
+Accuracy, cost and latency check for onset_detector.
+
+A synthetic 128 BPM arrangement is generated directly as band-frame levels
+(log band energies on the 0-255 MSG_BAND_FRAME scale, 8 log bands like the
+Visualizer's): a groove with kicks, snares and off-beat hats, a breakdown without
+kick and bass, a build-up with a snare roll and a rising noise riser, and the
+drop. Every hit and section start is known, so the detector's events are scored
+against it:
+
+    kick / snare  precision, recall and delay (hits within --tolerance-ms)
+    build-up      delay from the start of the build-up section
+    drop          delay from the first kick of the drop
+
+The cost of OnsetDetector.process is timed per frame against the frame budget
+(1 / --rate) and traced with tracemalloc on a second pass: no arrays are
+allocated, only the detector's Python number attributes get replaced.
+
+With --wire the same frames are also sent in real time as MSG_BAND_FRAME
+datagrams through a StreamRelay + AutoTrigger to the real server and a fake strip
+on loopback, every event mapped to an animation, to measure frame sent -> strip
+received for each triggered animation.
+
+Usage:
+    python onset_harness.py
+    python onset_harness.py --rate 86 --seed 3 --output onsets.json
+    python onset_harness.py --wire --mode asyncio
+'''
+import argparse
+import json
+import socket
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import animation_handler
+import onset_detector
+import server
+import stream_relay
+import wire_protocol
+
+
+BPM = 128
+BEAT_S = 60.0 / BPM
+BAR_S = 4 * BEAT_S
+SECTIONS = (("groove", 8), ("breakdown", 4), ("buildup", 4), ("drop", 8))  # bars
+NUM_BANDS = 8
+LEVEL_SCALE = 255 / 16.0  # FramePublisher full scale: log1p energy 16 -> 255
+
+# Band shapes (20 Hz ... 22 kHz, log spaced) and log peak energies
+KICK_SHAPE = np.array([1.0, 0.8, 0.3, 0.05, 0, 0, 0, 0])
+SNARE_SHAPE = np.array([0, 0.05, 0.5, 0.6, 0.7, 0.8, 0.6, 0.3])
+HAT_SHAPE = np.array([0, 0, 0, 0, 0, 0.1, 0.6, 1.0])
+PAD_SHAPE = np.array([0.3, 0.5, 0.8, 1.0, 1.0, 0.8, 0.5, 0.3])
+BASS_SHAPE = np.array([1.0, 0.7, 0.1, 0, 0, 0, 0, 0])
+RISER_SHAPE = np.array([0, 0, 0, 0, 0.2, 0.6, 1.0, 0.8])
+
+
+def arrangement():
+    """Hit times (s) per instrument and the section start times."""
+    kicks, snares, hats = [], [], []
+    starts = {}
+    t = 0.0
+    for name, bars in SECTIONS:
+        starts[name] = t
+        for bar in range(bars):
+            bar_start = t + bar * BAR_S
+            if name in ("groove", "drop"):
+                kicks += [bar_start + beat * BEAT_S for beat in range(4)]
+                snares += [bar_start + beat * BEAT_S for beat in (1, 3)]
+                hats += [bar_start + (beat + 0.5) * BEAT_S for beat in range(4)]
+            elif name == "breakdown":
+                hats += [bar_start + (beat + 0.5) * BEAT_S for beat in range(4)]
+            else:  # snare roll: quarters, eighths, then sixteenths
+                step = BEAT_S / min(4, 2 ** bar)
+                snares += list(bar_start + np.arange(0, BAR_S - 1e-9, step))
+        t += bars * BAR_S
+    return np.array(kicks), np.array(snares), np.array(hats), starts, t
+
+
+def synthesize(rate, seed):
+    """(frames x bands) uint8 levels and the ground truth."""
+    kicks, snares, hats, starts, duration = arrangement()
+    times = np.arange(int(duration * rate)) / rate
+    rng = np.random.default_rng(seed)
+    energy = np.zeros((len(times), NUM_BANDS))
+
+    def add_hits(hit_times, shape, log_peak, decay_s):
+        for hit in hit_times:
+            start = int(np.ceil(hit * rate))
+            t = times[start:start + int(decay_s * 8 * rate)] - hit
+            energy[start:start + len(t)] += np.exp(log_peak) * np.exp(-t / decay_s)[:, None] * shape
+
+    add_hits(kicks, KICK_SHAPE, 12.0, 0.08)
+    add_hits(snares, SNARE_SHAPE, 10.5, 0.12)
+    add_hits(hats, HAT_SHAPE, 10.0, 0.04)
+    energy += np.exp(7.0) * PAD_SHAPE
+    bass_on = (times < starts["breakdown"]) | (times >= starts["drop"])
+    energy += np.exp(9.0) * bass_on[:, None] * BASS_SHAPE
+    build = (times >= starts["buildup"]) & (times < starts["drop"])
+    riser = np.clip((times - starts["buildup"]) / (starts["drop"] - starts["buildup"]), 0, 1) * build
+    energy += np.exp(7.0 + 3.0 * riser)[:, None] * RISER_SHAPE * build[:, None]
+
+    energy *= rng.lognormal(0.0, 0.1, size=energy.shape)  # frame-to-frame analysis noise
+    levels = np.clip(np.log1p(energy) * LEVEL_SCALE, 0, 255).astype(np.uint8)
+    truth = {
+        onset_detector.EVENT_KICK: kicks,
+        onset_detector.EVENT_SNARE: np.sort(np.concatenate([snares, hats])),
+        onset_detector.EVENT_BUILDUP: np.array([starts["buildup"]]),
+        onset_detector.EVENT_DROP: np.array([starts["drop"]]),
+    }
+    return levels, truth
+
+
+def score(detected, truth, tolerance_s, frame_s, after_s):
+    """Greedy match of detected to true times: a detection counts from one frame before a hit to tolerance after."""
+    truth = truth[truth >= after_s]
+    matched_delays = []
+    used = np.zeros(len(detected), dtype=bool)
+    for hit in truth:
+        candidates = np.flatnonzero(~used & (detected >= hit - frame_s) & (detected <= hit + tolerance_s))
+        if len(candidates):
+            used[candidates[0]] = True
+            matched_delays.append(detected[candidates[0]] - hit)
+    delays_ms = np.array(matched_delays) * 1000
+    return {
+        "true": len(truth),
+        "detected": len(detected),
+        "recall": round(len(delays_ms) / len(truth), 3) if len(truth) else None,
+        "precision": round(len(delays_ms) / len(detected), 3) if len(detected) else None,
+        "delay_mean_ms": round(float(delays_ms.mean()), 1) if len(delays_ms) else None,
+    }
+
+
+def run_offline(levels, truth, args):
+    detector = onset_detector.OnsetDetector(NUM_BANDS, frame_rate_hz=args.rate)
+    frame_times = np.arange(len(levels)) / args.rate
+    fired = np.zeros((len(levels), len(onset_detector.EVENTS)), dtype=bool)
+    process_us = np.empty(len(levels))
+
+    for i, frame in enumerate(levels):
+        t0 = time.perf_counter_ns()
+        detector.process(frame)
+        process_us[i] = (time.perf_counter_ns() - t0) / 1000
+        fired[i] = detector.events
+
+    # Allocations are traced on a second, untimed pass with a fresh detector
+    traced = onset_detector.OnsetDetector(NUM_BANDS, frame_rate_hz=args.rate)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for frame in levels:
+        traced.process(frame)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = after - before
+
+    result = {"rate_hz": args.rate, "frames": len(levels), "budget_us": round(1e6 / args.rate, 1),
+              "process_p50_us": round(float(np.percentile(process_us, 50)), 2),
+              "process_p99_us": round(float(np.percentile(process_us, 99)), 2),
+              "process_max_us": round(float(process_us.max()), 2),
+              "alloc_peak_bytes": peak - before, "alloc_retained_bytes": retained}
+    warmup_s = detector.warmup_frames / args.rate
+    tolerance_s = args.tolerance_ms / 1000
+    for index, event in enumerate(onset_detector.EVENTS):
+        detected = frame_times[fired[:, index]]
+        if event in (onset_detector.EVENT_KICK, onset_detector.EVENT_SNARE):
+            result[event] = score(detected, truth[event], tolerance_s, 1 / args.rate, warmup_s)
+        else:
+            start = truth[event][0]
+            result[event] = {"count": len(detected),
+                             "delay_ms": round(float((detected[0] - start) * 1000), 1) if len(detected) else None}
+    return result
+
+
+def run_wire(levels, args):
+    """Real-time frames -> StreamRelay -> AutoTrigger -> server -> fake strip on loopback."""
+    server.PORT = args.server_port
+    server.SERVER_MODE = args.mode
+    threading.Thread(target=server.start_server, daemon=True).start()
+    time.sleep(0.5)
+    strip = socket.create_connection(("127.0.0.1", args.server_port))
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        connected = len(server.async_server.clients) if server.async_server is not None else len(server.clients)
+        if connected:
+            break
+        time.sleep(0.05)
+
+    # Every event plays a small Blink; the name says which event sent it
+    payloads = {event: animation_handler.compile_payload(event, [{"name": event, "Animation": "Blink", "r": 255,
+                                                                  "g": 255, "b": 255, "BPM": BPM,
+                                                                  "beatPercentage": 0.25}])
+                for event in onset_detector.EVENTS}
+    auto = onset_detector.AutoTrigger({event: event for event in onset_detector.EVENTS},
+                                      frame_rate_hz=args.rate, payloads=lambda: payloads)
+    frame_sent_us = np.zeros(len(levels), dtype=np.int64)
+    event_frames = []  # seq of the frame behind every sent animation, in send order
+
+    def on_frame(fields, datagram, received_us):
+        sent_before = sum(auto.sent)
+        auto.on_frame(fields, datagram, received_us)
+        event_frames.extend([fields["seq"]] * (sum(auto.sent) - sent_before))
+
+    relay = stream_relay.StreamRelay(port=args.relay_port, on_frame=on_frame, forward=False)
+    relay.start()
+
+    received_us = []
+    stop = threading.Event()
+
+    def read_strip():
+        buffer = b""
+        strip.settimeout(0.2)
+        while not stop.is_set():
+            try:
+                data = strip.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            now = wire_protocol.server_time_us()
+            buffer += data
+            while b"\n" in buffer:
+                _, buffer = buffer.split(b"\n", 1)
+                received_us.append(now)
+
+    reader = threading.Thread(target=read_strip, daemon=True)
+    reader.start()
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    period = 1.0 / args.rate
+    started = time.perf_counter()
+    for seq, frame in enumerate(levels):
+        datagram = wire_protocol.encode_band_frame(seq, seq * period * 1000, BPM, 0.0, frame.tolist())
+        frame_sent_us[seq] = wire_protocol.server_time_us()
+        sender.sendto(datagram, ("127.0.0.1", args.relay_port))
+        time.sleep(max(0.0, started + (seq + 1) * period - time.perf_counter()))
+
+    time.sleep(0.5)
+    stop.set()
+    reader.join()
+    relay.stop()
+    strip.close()
+    sender.close()
+
+    matched = min(len(event_frames), len(received_us))
+    wire_ms = (np.array(received_us[:matched]) - frame_sent_us[event_frames[:matched]]) / 1000
+    stats = auto.stats()
+    return {
+        "mode": args.mode,
+        "animations_sent": len(event_frames),
+        "animations_received": len(received_us),
+        "stale": stats["stale"],
+        "over_budget": stats["over_budget"],
+        "detect": stats["detect"],
+        "event_to_wire": stats["event_to_wire"],
+        "frame_to_strip_p50_ms": round(float(np.percentile(wire_ms, 50)), 3) if matched else None,
+        "frame_to_strip_p99_ms": round(float(np.percentile(wire_ms, 99)), 3) if matched else None,
+        "frame_to_strip_max_ms": round(float(wire_ms.max()), 3) if matched else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score onset_detector on a synthetic arrangement and time it.")
+    parser.add_argument("--rate", type=float, default=50, help="analysis frames per second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance-ms", type=float, default=50, help="how late a detection may be to count")
+    parser.add_argument("--wire", action="store_true", help="also measure frame -> strip through the server")
+    parser.add_argument("--mode", choices=("threaded", "asyncio"), default="threaded", help="server mode for --wire")
+    parser.add_argument("--server-port", type=int, default=6190)
+    parser.add_argument("--relay-port", type=int, default=6191)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    levels, truth = synthesize(args.rate, args.seed)
+    result = run_offline(levels, truth, args)
+    if args.wire:
+        result["wire"] = run_wire(levels, args)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
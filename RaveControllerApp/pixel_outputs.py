@@ -0,0 +1,194 @@
+'''
+Standard pixel-protocol outputs, so host-rendered frames (led_renderer) can drive
+commodity pixel controllers as well as our own strips.
+
+    DdpOutput     DDP (Distributed Display Protocol), UDP 4048
+    E131Output    E1.31 / sACN, UDP 5568, unicast or multicast
+    ArtNetOutput  Art-Net ArtDmx, UDP 6454
+
+Each output is one device with num_leds RGB pixels. A frame is split into as many
+packets as the protocol needs: DDP packets carry up to DDP_MAX_DATA bytes, the DMX
+protocols use one universe per PIXELS_PER_UNIVERSE pixels, never splitting a pixel
+across universes. All packets are built once in __init__; send_frame only copies
+pixel bytes and sequence numbers into them, so there is no per-frame allocation.
+'''
+import socket
+import struct
+import uuid
+
+import numpy as np
+
+
+DDP_PORT = 4048
+E131_PORT = 5568
+ARTNET_PORT = 6454
+
+DDP_MAX_DATA = 1440          # 480 RGB pixels, fits a 1500 byte MTU
+PIXELS_PER_UNIVERSE = 170    # 510 of 512 DMX slots
+
+_DDP_HEADER = struct.Struct(">BBBBIH")   # flags, sequence, data type, destination, offset, length
+DDP_VERSION_1 = 0x40
+DDP_PUSH = 0x01
+DDP_TYPE_RGB8 = 0x0B
+DDP_DEST_DISPLAY = 0x01
+
+
+class PixelOutput:
+    """Base class: a UDP socket and counters. Subclasses build packets and send_frame."""
+
+    def __init__(self, host, port, num_leds):
+        self.address = (host, port)
+        self.num_leds = num_leds
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sequence = 0
+        self.frames = 0
+        self.packets = 0
+        self.send_errors = 0
+
+    def _send(self, packet, address=None):
+        try:
+            self.sock.sendto(packet, address or self.address)
+            self.packets += 1
+        except OSError:
+            self.send_errors += 1  # pixel frames are droppable, the next one replaces it
+
+    @staticmethod
+    def _channels(pixels):
+        """Flat uint8 view of a (num_leds x 3) frame, without copying when contiguous."""
+        return np.ascontiguousarray(pixels, dtype=np.uint8).reshape(-1)
+
+    def send_frame(self, pixels):
+        raise NotImplementedError
+
+    def close(self):
+        self.sock.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.address[0]}:{self.address[1]}, {self.num_leds} LEDs)"
+
+
+class DdpOutput(PixelOutput):
+    """DDP RGB data to the default display; the last packet of a frame has the push flag."""
+
+    def __init__(self, host, num_leds, port=DDP_PORT):
+        super().__init__(host, port, num_leds)
+        total = num_leds * 3
+        self._packets = []  # (packet buffer, data view, channel offset, length)
+        for offset in range(0, total, DDP_MAX_DATA):
+            length = min(DDP_MAX_DATA, total - offset)
+            packet = bytearray(_DDP_HEADER.size + length)
+            last = offset + length >= total
+            _DDP_HEADER.pack_into(packet, 0, DDP_VERSION_1 | (DDP_PUSH if last else 0), 0,
+                                  DDP_TYPE_RGB8, DDP_DEST_DISPLAY, offset, length)
+            self._packets.append((packet, memoryview(packet)[_DDP_HEADER.size:], offset, length))
+
+    def send_frame(self, pixels):
+        channels = self._channels(pixels)
+        self.sequence = self.sequence % 15 + 1  # 1-15, 0 means "not used"
+        for packet, data, offset, length in self._packets:
+            packet[1] = self.sequence
+            data[:] = channels[offset:offset + length]
+            self._send(packet)
+        self.frames += 1
+
+
+class E131Output(PixelOutput):
+    """E1.31 (sACN) data packets, one universe per PIXELS_PER_UNIVERSE pixels."""
+
+    ROOT_VECTOR = 0x00000004
+    FRAMING_VECTOR = 0x00000002
+    DMP_VECTOR = 0x02
+    HEADER_SIZE = 126   # root (38) + framing (77) + DMP (10) + start code (1)
+
+    def __init__(self, host, num_leds, start_universe=1, port=E131_PORT, multicast=False,
+                 source_name="RaveGlow", priority=100):
+        super().__init__(host, port, num_leds)
+        self.cid = uuid.uuid4().bytes
+        self._universes = []  # (packet, data view, channel offset, length, address)
+        total = num_leds * 3
+        for index, offset in enumerate(range(0, total, PIXELS_PER_UNIVERSE * 3)):
+            universe = start_universe + index
+            length = min(PIXELS_PER_UNIVERSE * 3, total - offset)
+            packet = self._build_packet(universe, length, source_name, priority)
+            address = (self.multicast_address(universe), port) if multicast else self.address
+            self._universes.append((packet, memoryview(packet)[self.HEADER_SIZE:], offset, length, address))
+        if multicast:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+    @staticmethod
+    def multicast_address(universe):
+        return f"239.255.{universe >> 8}.{universe & 0xFF}"
+
+    def _build_packet(self, universe, slots, source_name, priority):
+        size = self.HEADER_SIZE + slots
+        packet = bytearray(size)
+        # Root layer
+        struct.pack_into(">HH12sHI16s", packet, 0, 0x0010, 0x0000, b"ASC-E1.17\x00\x00\x00",
+                         0x7000 | (size - 16), self.ROOT_VECTOR, self.cid)
+        # Framing layer (sequence at byte 111 is filled in per frame)
+        struct.pack_into(">HI64sBHBBH", packet, 38, 0x7000 | (size - 38), self.FRAMING_VECTOR,
+                         source_name.encode("utf-8")[:63], priority, 0, 0, 0, universe)
+        # DMP layer, start code 0 then the slots
+        struct.pack_into(">HBBHHHB", packet, 115, 0x7000 | (size - 115), self.DMP_VECTOR, 0xA1,
+                         0x0000, 0x0001, slots + 1, 0x00)
+        return packet
+
+    def send_frame(self, pixels):
+        channels = self._channels(pixels)
+        self.sequence = (self.sequence + 1) & 0xFF
+        for packet, data, offset, length, address in self._universes:
+            packet[111] = self.sequence
+            data[:] = channels[offset:offset + length]
+            self._send(packet, address)
+        self.frames += 1
+
+
+class ArtNetOutput(PixelOutput):
+    """Art-Net ArtDmx packets, one universe (port-address) per PIXELS_PER_UNIVERSE pixels."""
+
+    HEADER_SIZE = 18
+    OP_DMX = 0x5000
+    PROTOCOL_VERSION = 14
+
+    def __init__(self, host, num_leds, start_universe=0, port=ARTNET_PORT, broadcast=False):
+        super().__init__(host, port, num_leds)
+        if broadcast:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._universes = []  # (packet, data view, channel offset, length)
+        total = num_leds * 3
+        for index, offset in enumerate(range(0, total, PIXELS_PER_UNIVERSE * 3)):
+            universe = start_universe + index
+            length = min(PIXELS_PER_UNIVERSE * 3, total - offset)
+            dmx_length = length + (length & 1)  # ArtDmx length must be even
+            packet = bytearray(self.HEADER_SIZE + dmx_length)
+            struct.pack_into("<8sH", packet, 0, b"Art-Net\x00", self.OP_DMX)
+            struct.pack_into(">HBBBBH", packet, 10, self.PROTOCOL_VERSION, 0, 0,
+                             universe & 0xFF, (universe >> 8) & 0x7F, dmx_length)
+            self._universes.append((packet, memoryview(packet)[self.HEADER_SIZE:self.HEADER_SIZE + length],
+                                    offset, length))
+
+    def send_frame(self, pixels):
+        channels = self._channels(pixels)
+        self.sequence = self.sequence % 255 + 1  # 1-255, 0 disables reordering checks
+        for packet, data, offset, length in self._universes:
+            packet[12] = self.sequence
+            data[:] = channels[offset:offset + length]
+            self._send(packet)
+        self.frames += 1
+
+
+OUTPUT_BACKENDS = {"ddp": DdpOutput, "e131": E131Output, "artnet": ArtNetOutput}
+
+
+def parse_output(spec, num_leds):
+    """
+    Build an output from "protocol:host[:port]", e.g. "ddp:192.168.1.50" or "e131:10.0.0.7:5568".
+    """
+    parts = spec.strip().split(":")
+    if len(parts) < 2 or parts[0].lower() not in OUTPUT_BACKENDS:
+        raise ValueError(f"Output must look like <{'|'.join(OUTPUT_BACKENDS)}>:host[:port], got '{spec}'")
+    backend = OUTPUT_BACKENDS[parts[0].lower()]
+    if len(parts) > 2:
+        return backend(parts[1], num_leds, port=int(parts[2]))
+    return backend(parts[1], num_leds)
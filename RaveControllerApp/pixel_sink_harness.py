@@ -0,0 +1,286 @@
+'''
+Local UDP sink for the pixel_outputs backends.
+
+The sink decodes DDP, E1.31 and Art-Net packets the way a pixel controller would,
+reassembles them into frames and checks every frame against a test pattern:
+
+    pixel i of frame n = (n + 3 * i + c) % 256 for colour channel c
+
+so a frame is intact only if every universe / DDP packet arrived, landed at the
+right offset and came from the same frame. The sender drives an output at a fixed
+rate over loopback; the report has complete / incomplete / corrupt frame counts,
+out-of-order sequence numbers, the interval between completed frames, the sender's
+send_frame cost and any memory send_frame kept hold of (tracemalloc, should be 0).
+
+With --listen the sink only receives, to check the real controller (menu option 6)
+with any pattern: it reports frames and timing but skips the pattern check.
+
+Usage:
+    python pixel_sink_harness.py
+    python pixel_sink_harness.py --protocols e131 --leds 1000 --frames 600 --fps 60
+    python pixel_sink_harness.py --listen ddp --port 4048
+'''
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import pixel_outputs
+
+
+HOST = "127.0.0.1"
+SINK_PORTS = {"ddp": 14048, "e131": 15568, "artnet": 16454}  # unprivileged, away from real controllers
+
+
+### Decoders: packet -> (sequence, channel offset, channel bytes, end of frame) ###
+
+def decode_ddp(packet):
+    flags, sequence, _, _, offset, length = pixel_outputs._DDP_HEADER.unpack_from(packet)
+    if flags & 0xC0 != pixel_outputs.DDP_VERSION_1:
+        raise ValueError("not a DDP v1 packet")
+    data = packet[pixel_outputs._DDP_HEADER.size:pixel_outputs._DDP_HEADER.size + length]
+    return sequence, offset, data, bool(flags & pixel_outputs.DDP_PUSH)
+
+
+def decode_e131(packet, start_universe=1):
+    if packet[4:16] != b"ASC-E1.17\x00\x00\x00":
+        raise ValueError("not an E1.31 packet")
+    root_vector, = struct.unpack_from(">I", packet, 18)
+    framing_vector, = struct.unpack_from(">I", packet, 40)
+    if root_vector != pixel_outputs.E131Output.ROOT_VECTOR or framing_vector != pixel_outputs.E131Output.FRAMING_VECTOR:
+        raise ValueError("not an E1.31 data packet")
+    sequence = packet[111]
+    universe, = struct.unpack_from(">H", packet, 113)
+    count, = struct.unpack_from(">H", packet, 123)
+    if packet[125] != 0:
+        raise ValueError("non-zero DMX start code")
+    data = packet[126:126 + count - 1]
+    offset = (universe - start_universe) * pixel_outputs.PIXELS_PER_UNIVERSE * 3
+    return sequence, offset, data, None
+
+
+def decode_artnet(packet, start_universe=0):
+    header, opcode = struct.unpack_from("<8sH", packet)
+    if header != b"Art-Net\x00" or opcode != pixel_outputs.ArtNetOutput.OP_DMX:
+        raise ValueError("not an ArtDmx packet")
+    sequence, _, sub_uni, net, length = struct.unpack_from(">BBBBH", packet, 12)
+    universe = (net << 8) | sub_uni
+    offset = (universe - start_universe) * pixel_outputs.PIXELS_PER_UNIVERSE * 3
+    return sequence, offset, packet[18:18 + length], None
+
+
+DECODERS = {"ddp": decode_ddp, "e131": decode_e131, "artnet": decode_artnet}
+
+
+def expected_frame(frame_no, num_leds):
+    channels = np.arange(num_leds * 3)
+    return ((frame_no + channels) % 256).astype(np.uint8)  # 3 * i + c is just the channel index
+
+
+class PixelSink:
+    """Receives one protocol on a UDP port and reassembles frames by sequence number."""
+
+    def __init__(self, protocol, port, num_leds, check_pattern=True):
+        self.protocol = protocol
+        self.decode = DECODERS[protocol]
+        self.num_leds = num_leds
+        self.total = num_leds * 3
+        self.check_pattern = check_pattern
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(("0.0.0.0" if not check_pattern else HOST, port))
+        self.sock.settimeout(0.2)
+
+        self.packets = 0
+        self.bad_packets = 0
+        self.complete = 0
+        self.incomplete = 0
+        self.corrupt = 0
+        self.out_of_order = 0
+        self.frame_times = []  # arrival of each completed frame
+        self._pending = None   # (sequence, buffer, bytes received)
+        self._last_sequence = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        if self._pending is not None:
+            self.incomplete += 1
+        self.sock.close()
+
+    def _run(self):
+        while self._running:
+            try:
+                packet = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            self.packets += 1
+            try:
+                sequence, offset, data, push = self.decode(packet)
+            except (ValueError, struct.error):
+                self.bad_packets += 1
+                continue
+            self._add(sequence, offset, data, push)
+
+    def _add(self, sequence, offset, data, push):
+        if self._pending is not None and self._pending[0] != sequence:
+            self.incomplete += 1  # a new frame started before the last one was whole
+            self._pending = None
+        if self._pending is None:
+            if self._last_sequence is not None and sequence == self._last_sequence:
+                self.out_of_order += 1  # late packet of a frame that already completed
+                return
+            self._pending = (sequence, np.zeros(self.total, dtype=np.uint8), 0)
+        _, buffer, received = self._pending
+        if offset < 0 or offset >= self.total:
+            self.bad_packets += 1
+            return
+        data = data[:self.total - offset]  # Art-Net pads odd lengths to an even slot count
+        buffer[offset:offset + len(data)] = np.frombuffer(data, dtype=np.uint8)
+        received += len(data)
+        self._pending = (sequence, buffer, received)
+
+        # DDP says when a frame ends (push); the DMX protocols end when every channel arrived
+        done = push if push is not None else received >= self.total
+        if not done:
+            return
+        if received < self.total:
+            self.incomplete += 1
+        else:
+            self._finish(sequence, buffer)
+        self._pending = None
+
+    def _finish(self, sequence, buffer):
+        if self._last_sequence is not None and sequence == self._last_sequence:
+            self.out_of_order += 1
+        self._last_sequence = sequence
+        self.frame_times.append(time.perf_counter())
+        if self.check_pattern and not np.array_equal(buffer, expected_frame(int(buffer[0]), self.num_leds)):
+            self.corrupt += 1
+            return
+        self.complete += 1
+
+    def report(self):
+        intervals = np.diff(self.frame_times) * 1000 if len(self.frame_times) > 1 else np.empty(0)
+
+        def pct(p):
+            return round(float(np.percentile(intervals, p)), 3) if len(intervals) else None
+
+        return {
+            "protocol": self.protocol,
+            "leds": self.num_leds,
+            "packets": self.packets,
+            "bad_packets": self.bad_packets,
+            "frames_complete": self.complete,
+            "frames_incomplete": self.incomplete,
+            "frames_corrupt": self.corrupt,
+            "out_of_order": self.out_of_order,
+            "interval_p50_ms": pct(50),
+            "interval_p99_ms": pct(99),
+            "interval_max_ms": round(float(intervals.max()), 3) if len(intervals) else None,
+            "interval_jitter_ms": round(float(intervals.std()), 3) if len(intervals) else None,
+        }
+
+
+def run_protocol(protocol, args):
+    port = SINK_PORTS[protocol]
+    sink = PixelSink(protocol, port, args.leds)
+    sink.start()
+    output = pixel_outputs.OUTPUT_BACKENDS[protocol](HOST, args.leds, port=port)
+
+    # Frames are prepared up front so only send_frame is timed and traced
+    patterns = [expected_frame(n, args.leds).reshape(args.leds, 3) for n in range(256)]
+    send_ms = np.empty(args.frames)
+    period = 1.0 / args.fps
+    tracemalloc.start()
+    only_outputs = [tracemalloc.Filter(True, pixel_outputs.__file__)]  # the sink thread allocates too
+    started = time.perf_counter()
+    before = tracemalloc.take_snapshot().filter_traces(only_outputs)
+    for n in range(args.frames):
+        t0 = time.perf_counter_ns()
+        output.send_frame(patterns[n % 256])
+        send_ms[n] = (time.perf_counter_ns() - t0) / 1e6
+        time.sleep(max(0.0, started + (n + 1) * period - time.perf_counter()))
+    after = tracemalloc.take_snapshot().filter_traces(only_outputs)
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    tracemalloc.stop()
+
+    time.sleep(0.3)
+    sink.stop()
+    output.close()
+
+    result = sink.report()
+    result.update({
+        "frames_sent": args.frames,
+        "packets_per_frame": output.packets // max(1, output.frames),
+        "send_errors": output.send_errors,
+        "send_p50_ms": round(float(np.percentile(send_ms, 50)), 4),
+        "send_p99_ms": round(float(np.percentile(send_ms, 99)), 4),
+        "output_bytes_retained": retained,
+    })
+    return result
+
+
+def listen(args):
+    protocol = args.listen
+    port = args.port or {"ddp": pixel_outputs.DDP_PORT, "e131": pixel_outputs.E131_PORT,
+                         "artnet": pixel_outputs.ARTNET_PORT}[protocol]
+    sink = PixelSink(protocol, port, args.leds, check_pattern=False)
+    sink.start()
+    print(f"[SINK] Listening for {protocol} on port {port} ({args.leds} LEDs). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(2)
+            print(f"[SINK] {json.dumps(sink.report())}")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode DDP / E1.31 / Art-Net on a local UDP sink and verify frames.")
+    parser.add_argument("--protocols", default="ddp,e131,artnet", help="comma separated protocols to test")
+    parser.add_argument("--leds", type=int, default=600, help="pixels per output")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument("--listen", choices=sorted(DECODERS), help="only receive this protocol and report")
+    parser.add_argument("--port", type=int, help="port for --listen (default: the protocol's port)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    if args.listen:
+        listen(args)
+        return
+
+    results = []
+    for protocol in args.protocols.split(","):
+        result = run_protocol(protocol.strip(), args)
+        results.append(result)
+        ok = (result["frames_complete"] == args.frames and not result["frames_corrupt"]
+              and not result["bad_packets"])
+        print(f"{protocol:<7} {args.leds} LEDs: {result['frames_complete']}/{args.frames} frames intact "
+              f"(incomplete={result['frames_incomplete']} corrupt={result['frames_corrupt']}), "
+              f"{result['packets_per_frame']} packets/frame, interval p50={result['interval_p50_ms']}ms "
+              f"p99={result['interval_p99_ms']}ms, send p99={result['send_p99_ms']}ms  [{'ok' if ok else 'FAIL'}]")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if any(r["frames_corrupt"] or r["frames_complete"] < args.frames for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
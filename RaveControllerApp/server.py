@@ -2,16 +2,100 @@ import socket
 import threading
 import json
 
+import latency_stats
+import wire_protocol
+from async_server import AsyncBroadcastServer, SLOW_CLIENT_POLICIES
+from client_registry import ClientRegistry
+
 HOST = "0.0.0.0"   # listen on all interfaces
 PORT = 6000        # pick any free port
 
 ip_address = None
 
-clients = []  # keep track of connected clients
+clients = []  # keep track of connected clients (ThreadedClient)
+registry = ClientRegistry()  # client id / tag -> clients, filled from hello messages
+
+# "threaded" = one thread per client with blocking sendall (original behaviour)
+# "asyncio"  = single event loop with a bounded write queue per client
+SERVER_MODE = "asyncio"
+MAX_CLIENT_QUEUE = 32
+SLOW_CLIENT_POLICY = "drop_oldest"   # see async_server.SLOW_CLIENT_POLICIES
+
+async_server = None  # AsyncBroadcastServer when running in asyncio mode
+
+BINARY_PROTOCOL_ENABLED = True  # allow clients to negotiate wire_protocol.PROTO_BINARY
+
+
+class ThreadedClient:
+    """A client connection served by its own thread in threaded mode."""
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.protocol = wire_protocol.PROTO_JSON
+        self.clock_offset_us = None  # client clock minus server clock, reported after sync
+        self.rtt_us = None
+        self.client_id = None
+        self.tags = set()
+
+    def send(self, data):
+        self.conn.sendall(data)
+
+
+def handle_line(client, line):
+    """Handle one newline-terminated message received from a client."""
+    received_us = wire_protocol.server_time_us()
+    addr = client.addr
+    try:
+        msg = json.loads(line)
+    except json.JSONDecodeError as e:
+        print(f"[JSON ERROR from {addr}] {e}: {line}")
+        return
+
+    if isinstance(msg, dict) and msg.get("type") == "ack":
+        latency_stats.stats.record_ack(client, msg.get("trg"), received_us)  # frequent, not printed
+        return
+    print(f"[RECEIVED from {addr}] {msg}")
+
+    if not isinstance(msg, dict):
+        return
+    if "id" in msg:
+        registry.register(client, msg["id"], msg.get("tags", ()))
+        print(f"[REGISTERED] {addr} as {client.client_id} tags={sorted(client.tags)}")
+    if "proto" in msg:
+        negotiate_protocol(client, msg["proto"])
+    if msg.get("type") == "sync":
+        answer_sync(client, msg, received_us)
+    elif msg.get("type") == "sync_result":
+        client.clock_offset_us = msg.get("offset_us")
+        client.rtt_us = msg.get("rtt_us")
+
+def answer_sync(client, msg, received_us):
+    """
+    Clock-offset handshake (NTP style). The client sends t0 on its clock, the server
+    answers with t1 (receive) and t2 (send) on the server clock, and the client
+    computes offset = ((t1 - t0) + (t2 - t3)) / 2 on receipt at t3
+    (wire_protocol.clock_offset_us).
+
+    The strip repeats the handshake periodically, so every request is answered.
+    Binary clients get the reply as a MSG_JSON frame, never as a bare line.
+    """
+    reply = {"type": "sync", "t0": msg.get("t0"), "t1": received_us, "t2": wire_protocol.server_time_us()}
+    data = (json.dumps(reply) + "\n").encode('utf-8')
+    client.send(select_encoding(client, data, None))
+
+def negotiate_protocol(client, offered):
+    """Answer a client's protocol offer; binary frames are only sent after the ack."""
+    protocol = wire_protocol.choose_protocol(offered) if BINARY_PROTOCOL_ENABLED else wire_protocol.PROTO_JSON
+    ack = {"type": "proto", "proto": protocol, "version": wire_protocol.PROTOCOL_VERSION}
+    client.send((json.dumps(ack) + "\n").encode('utf-8'))
+    client.protocol = protocol
+    print(f"[PROTOCOL] {client.addr} using {protocol}")
 
 def handle_client(conn, addr):
     print(f"[NEW CONNECTION] {addr} connected.")
-    clients.append(conn)
+    client = ThreadedClient(conn, addr)
+    clients.append(client)
     buffer = ""
     try:
         while True:
@@ -22,15 +106,12 @@ def handle_client(conn, addr):
             while '\n' in buffer:
                 line, buffer = buffer.split('\n', 1)
                 if line.strip():
-                    try:
-                        msg = json.loads(line)
-                        print(f"[RECEIVED from {addr}] {msg}")
-                    except json.JSONDecodeError as e:
-                        print(f"[JSON ERROR from {addr}] {e}: {line}")
+                    handle_line(client, line)
     except ConnectionResetError:
         print(f"[DISCONNECTED] {addr}")
     finally:
-        clients.remove(conn)
+        clients.remove(client)
+        registry.unregister(client)
         conn.close()
 
 def manually_setup_server():
@@ -51,6 +132,16 @@ def manually_setup_server():
         PORT = 6000
     print(f"Using port: {PORT}")
 
+    global SERVER_MODE, SLOW_CLIENT_POLICY
+    mode_input = input(f"Server mode, threaded or asyncio (default {SERVER_MODE}): ").strip()
+    if mode_input in ("threaded", "asyncio"):
+        SERVER_MODE = mode_input
+    if SERVER_MODE == "asyncio":
+        policy_input = input(f"Slow client policy {SLOW_CLIENT_POLICIES} (default {SLOW_CLIENT_POLICY}): ").strip()
+        if policy_input in SLOW_CLIENT_POLICIES:
+            SLOW_CLIENT_POLICY = policy_input
+    print(f"Using {SERVER_MODE} server")
+
 
 def start_server():
 
@@ -58,6 +149,10 @@ def start_server():
     global ip_address
     ip_address = socket.gethostbyname(hostname)
 
+    if SERVER_MODE == "asyncio":
+        start_async_server()
+        return
+
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind((HOST, PORT))
@@ -73,16 +168,103 @@ def start_server():
         print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 1}")
         
 
+def start_async_server():
+    """Serve all clients from one asyncio event loop (blocks the calling thread)."""
+    global async_server
+    async_server = AsyncBroadcastServer(HOST, PORT, max_queue=MAX_CLIENT_QUEUE,
+                                        slow_client_policy=SLOW_CLIENT_POLICY,
+                                        on_line=handle_line, on_disconnect=registry.unregister)
+    print(f"[LISTENING] Async server is running on {ip_address}:{PORT}")
+    async_server.run()
+
+
 def broadcast_message(msg_dict):
     """Send JSON to all connected clients, each message terminated with newline"""
     data = (json.dumps(msg_dict) + "\n").encode('utf-8')
-    for c in clients:
+    binary_data = None
+    if "Animation" in msg_dict:
         try:
-            c.sendall(data)
+            binary_data = wire_protocol.encode_animation(msg_dict)
+        except wire_protocol.ProtocolError as e:
+            print(f"[PROTOCOL] Sending as JSON only: {e}")  # binary clients get it wrapped in MSG_JSON
+    broadcast_bytes(data, binary_data)
+
+
+def stream_frame(data, binary_data=None):
+    """
+    Send an audio-reactive streaming frame to all clients.
+    In asyncio mode each client only keeps the newest unsent frame; the threaded
+    server has no per-client queue, so frames are sent directly.
+    """
+    if async_server is not None:
+        async_server.stream(data, binary_data)
+    else:
+        broadcast_bytes(data, binary_data)
+
+
+def stream_pixels(frames):
+    """
+    Send host-rendered pixels, a list of (client, MSG_PIXEL_FRAME) pairs.
+    Like stream_frame, asyncio mode only keeps the newest frame per client.
+    """
+    if async_server is not None:
+        async_server.stream_each(frames)
+        return
+
+    for c, data in frames:
+        try:
+            c.send(data)
         except:
             pass  # ignore disconnected clients
 
 
+def select_encoding(client, data, binary_data):
+    """Bytes for this client: binary_data, data wrapped in MSG_JSON, or the JSON line."""
+    return wire_protocol.encode_for(client.protocol, data, binary_data)
+
+
+def broadcast_bytes(data, binary_data=None, target=None, trigger=None):
+    """
+    Send an already-encoded message to all connected clients.
+    binary_data is the wire_protocol frame for the same message, sent instead of
+    data to clients that negotiated the binary protocol; without it they get data
+    wrapped in a MSG_JSON frame.
+    target (a tag, client id, or list of them) limits it to those clients.
+    trigger (latency_stats.Trigger) records per-client send times for this message.
+    """
+    if target is not None:
+        send_to(registry.resolve(target), data, binary_data, trigger)
+        return
+
+    data, binary_data = latency_stats.stats.tag(data, binary_data, trigger)
+    if async_server is not None:
+        async_server.broadcast(data, binary_data, trigger)  # non-blocking, queued per client
+        return
+
+    send_threaded(list(clients), data, binary_data, trigger)
+
+
+def send_to(targets, data, binary_data=None, trigger=None):
+    """Send an already-encoded message to the given clients only."""
+    data, binary_data = latency_stats.stats.tag(data, binary_data, trigger)
+    if async_server is not None:
+        async_server.send_to(targets, data, binary_data, trigger)
+        return
+
+    send_threaded(targets, data, binary_data, trigger)
+
+
+def send_threaded(targets, data, binary_data, trigger):
+    for c in targets:
+        encoded = select_encoding(c, data, binary_data)
+        try:
+            c.send(encoded)
+        except:
+            continue  # ignore disconnected clients
+        if trigger is not None:
+            latency_stats.stats.record_send(c, trigger, len(encoded))
+
+
 if __name__ == "__main__":
     threading.Thread(target=start_server, daemon=True).start()
     print("[SERVER STARTED]")
@@ -0,0 +1,135 @@
+'''
+Audio-reactive streaming mode.
+
+The Visualizer publishes band-energy/beat frames (wire_protocol MSG_BAND_FRAME) as
+UDP datagrams to STREAM_PORT on this machine. StreamRelay keeps only the newest
+frame it has received and forwards it through server.stream_frame at a fixed rate,
+so every strip gets the latest analysis and nothing stale is ever queued.
+
+With a udp_sender (udp_transport.UdpFrameSender) the frames go out as one
+multicast datagram instead of through the TCP server, and a beat pulse is sent
+as soon as a frame shows the beat phase wrapping.
+
+on_frame(fields, datagram, received_us) is called from the receiving thread for
+every valid frame, before any rate limiting (onset_detector.AutoTrigger uses it).
+With forward=False frames are only handed to on_frame, not sent to strips.
+'''
+import json
+import socket
+import threading
+import time
+
+import server
+import wire_protocol
+
+
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 6001
+STREAM_RATE_HZ = 60
+
+
+class StreamRelay:
+    def __init__(self, host=STREAM_HOST, port=STREAM_PORT, rate_hz=STREAM_RATE_HZ, udp_sender=None,
+                 on_frame=None, forward=True):
+        self.host = host
+        self.port = port
+        if not rate_hz > 0:
+            raise ValueError(f"stream rate must be positive, got {rate_hz}")
+        self.period_s = 1.0 / rate_hz
+        self.udp_sender = udp_sender
+        self.on_frame = on_frame
+        self.forward = forward
+
+        self.prev_beat_phase = 0.0
+        self.beat_index = 0
+
+        self.latest = None        # (seq, binary frame, json line) of the newest frame
+        self.sent_seq = None
+
+        # Counters
+        self.received = 0
+        self.forwarded = 0
+        self.invalid = 0
+        self.beats = 0
+
+        self._running = False
+        self._threads = []
+        self._sock = None
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self.host, self.port))
+        self._sock.settimeout(0.5)
+        self._running = True
+        self._threads = [threading.Thread(target=self._receive_loop, name="StreamReceive", daemon=True)]
+        if self.forward:
+            self._threads.append(threading.Thread(target=self._send_loop, name="StreamSend", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        print(f"[STREAM] Listening for analysis frames on {self.host}:{self.port}")
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._sock.close()
+        print(f"[STREAM] received={self.received} forwarded={self.forwarded} beats={self.beats} invalid={self.invalid}")
+
+    def _receive_loop(self):
+        while self._running:
+            try:
+                datagram = self._sock.recv(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            received_us = wire_protocol.server_time_us()
+            try:
+                decoded = wire_protocol.decode_frame(datagram)
+            except wire_protocol.ProtocolError:
+                decoded = None
+            if decoded is None or decoded[0] != wire_protocol.MSG_BAND_FRAME:
+                self.invalid += 1
+                continue
+
+            fields = decoded[1]
+            if self.on_frame is not None:
+                self.on_frame(fields, datagram, received_us)
+            if not self.forward:
+                self.received += 1
+                continue
+            if self.udp_sender is not None:
+                self._check_beat(fields)
+
+            json_line = (json.dumps(wire_protocol.band_frame_to_json(fields), separators=(",", ":")) + "\n").encode("utf-8")
+            self.latest = (fields["seq"], datagram, json_line)  # single assignment, no lock needed
+            self.received += 1
+
+    def _check_beat(self, fields):
+        """Send a beat pulse right away when the beat phase wraps around."""
+        phase = fields["beat_phase"]
+        if fields["bpm"] > 0 and phase < self.prev_beat_phase - 0.5:
+            self.beat_index += 1
+            self.udp_sender.send(wire_protocol.encode_beat_pulse(self.beat_index, fields["bpm"]))
+            self.beats += 1
+        self.prev_beat_phase = phase
+
+    def _send_loop(self):
+        next_tick = time.perf_counter()
+        while self._running:
+            latest = self.latest
+            if latest is not None and latest[0] != self.sent_seq:
+                seq, binary_frame, json_line = latest
+                if self.udp_sender is not None:
+                    self.udp_sender.send(binary_frame)
+                else:
+                    server.stream_frame(json_line, binary_frame)
+                self.sent_seq = seq
+                self.forwarded += 1
+
+            next_tick += self.period_s
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
@@ -0,0 +1,143 @@
+'''
+Tests for OnsetDetector's events and AutoTrigger's frame handling around it.
+
+    python -m pytest test_auto_trigger.py
+'''
+import pytest
+
+import animation_handler
+import latency_stats
+import onset_detector
+import wire_protocol
+
+
+RATE = 50
+BASE = [40] * 8  # steady levels, no flux
+
+
+def levels(low=40, mid=40, high=40):
+    """Band levels for 8 bands: 2 kick bands, 3 mids, 3 snare bands."""
+    return [low] * 2 + [mid] * 3 + [high] * 3
+
+
+def fired(detector, frames):
+    """Feed frames, return the event names each one fired."""
+    result = []
+    for frame in frames:
+        detector.process(frame)
+        result.append({event for event, on in zip(onset_detector.EVENTS, detector.events) if on})
+    return result
+
+
+def warmed_up(**options):
+    detector = onset_detector.OnsetDetector(8, RATE, **options)
+    fired(detector, [BASE] * detector.warmup_frames)
+    return detector
+
+
+def test_kick_and_snare_are_told_apart():
+    detector = warmed_up()
+    assert fired(detector, [levels(low=200, mid=60)] + [BASE] * 20)[0] == {"kick"}
+    assert fired(detector, [levels(high=200), BASE])[0] == {"snare"}
+
+
+def test_snare_leaking_into_the_low_bands_is_not_a_kick():
+    detector = warmed_up()
+    # Low bands rise past their threshold, but much less than the snare body in the mids
+    assert fired(detector, [levels(low=70, mid=160, high=200)])[0] == {"snare"}
+
+
+def test_refractory_period_holds_back_a_second_onset():
+    detector = warmed_up()
+    kick = levels(low=200, mid=60)
+    gap = detector.refractory_frames
+
+    events = fired(detector, [kick, BASE, kick] + [BASE] * gap + [kick])
+
+    assert events[0] == {"kick"}
+    assert events[2] == set()      # within refractory_s of the first kick
+    assert events[-1] == {"kick"}  # after it
+    assert detector.counts[onset_detector.KICK] == 2
+
+
+def test_nothing_fires_during_warmup():
+    detector = onset_detector.OnsetDetector(8, RATE)
+    kick = levels(low=200, mid=60)
+    frames = ([kick] + [BASE] * 9) * (detector.warmup_frames // 10)
+
+    assert not any(detector.process(frame) for frame in frames)
+    assert detector.counts == [0] * len(onset_detector.EVENTS)
+    assert fired(detector, [kick])[0] == {"kick"}
+
+
+def test_breakdown_buildup_and_drop():
+    detector = onset_detector.OnsetDetector(8, RATE)
+    beat = RATE // 2  # 120 BPM
+
+    def groove(seconds, low, high):
+        frames = []
+        for i in range(int(seconds * RATE)):
+            hit = i % beat == 0
+            frames.append(levels(low=low + 60 * hit, mid=60 + 10 * hit, high=high))
+        return frames
+
+    fired(detector, groove(10, low=160, high=60))
+    assert detector.section == onset_detector.SECTION_NORMAL
+
+    events = fired(detector, groove(4, low=30, high=60))  # bass out
+    assert detector.section == onset_detector.SECTION_BREAKDOWN
+    assert not any("buildup" in e or "drop" in e for e in events)
+
+    events = fired(detector, groove(2, low=30, high=120))  # top end rises
+    assert detector.section == onset_detector.SECTION_BUILDUP
+    assert sum("buildup" in e for e in events) == 1
+
+    events = fired(detector, groove(2, low=160, high=60))  # bass back in
+    assert events[0] == {"kick", "drop"}
+    assert sum("drop" in e for e in events) == 1
+    assert detector.section == onset_detector.SECTION_NORMAL
+
+
+def band_frame(seq, levels):
+    frame = wire_protocol.encode_band_frame(seq, seq * 20, 128.0, 0.0, levels)
+    msg_type, fields, _ = wire_protocol.decode_frame(frame)
+    return fields, frame
+
+
+def test_rejects_non_positive_frame_rate():
+    for rate in (0, -50):
+        with pytest.raises(ValueError):
+            onset_detector.AutoTrigger({}, frame_rate_hz=rate, payloads=dict)
+
+
+def test_errors_are_counted_and_frames_keep_flowing():
+    def broken_payloads():
+        raise RuntimeError("mapping store unavailable")
+
+    auto = onset_detector.AutoTrigger({event: "k" for event in onset_detector.EVENTS}, payloads=broken_payloads)
+    now_us = wire_protocol.server_time_us()
+    for seq in range(200):
+        fields, frame = band_frame(seq, [255 if seq % 10 == 0 else 0] * 8)
+        auto.on_frame(fields, frame, now_us + seq * 20_000)
+    stats = auto.stats()
+    assert stats["frames"] == 200
+    assert stats["errors"] > 0
+    assert sum(stats["sent"].values()) == 0
+
+
+def test_auto_triggers_stay_out_of_the_controller_serialize_stage(monkeypatch):
+    stats = latency_stats.LatencyStats()
+    monkeypatch.setattr(latency_stats, "stats", stats)
+    sent = []
+    monkeypatch.setattr(onset_detector.server, "broadcast_bytes", lambda *args: sent.append(args))
+    payload = animation_handler.Payload("kick", b"{}\n", None)
+
+    auto = onset_detector.AutoTrigger({"kick": "k"}, payloads=lambda: {"k": payload})
+    now_us = wire_protocol.server_time_us()
+    for seq in range(100):
+        fields, frame = band_frame(seq, levels(low=200, mid=60) if seq % 25 == 0 else BASE)
+        auto.on_frame(fields, frame, now_us + seq * 20_000)
+
+    assert auto.sent[onset_detector.KICK] > 0
+    assert len(sent) == auto.sent[onset_detector.KICK]
+    assert "controller" not in stats.snapshot()["clients"]
@@ -0,0 +1,127 @@
+'''
+Tests for the clock-sync handshake and scheduled frames.
+
+    python -m pytest test_clock_sync.py
+'''
+import json
+
+import pytest
+
+import server
+import wire_protocol
+
+
+class FakeClient:
+    """Records what the server sends, in place of a socket."""
+
+    def __init__(self):
+        self.addr = ("test", 0)
+        self.protocol = wire_protocol.PROTO_JSON
+        self.clock_offset_us = None
+        self.rtt_us = None
+        self.client_id = None
+        self.tags = set()
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+def test_offset_symmetric_delay():
+    # Client clock 5 s behind the server, 2 ms each way, 1 ms on the server
+    offset_true = 5_000_000
+    t0 = 1_000_000
+    t1 = t0 + offset_true + 2000
+    t2 = t1 + 1000
+    t3 = t2 - offset_true + 2000
+    offset, rtt = wire_protocol.clock_offset_us(t0, t1, t2, t3)
+    assert offset == offset_true
+    assert rtt == 4000
+
+
+def test_offset_asymmetric_delay_error_is_half_the_difference():
+    t0 = 0
+    t1 = 3000       # 3 ms up, clocks equal
+    t2 = 3000
+    t3 = 4000       # 1 ms down
+    offset, rtt = wire_protocol.clock_offset_us(t0, t1, t2, t3)
+    assert rtt == 4000
+    assert offset == (3000 - 1000) // 2
+
+
+def test_offset_client_ahead_is_negative():
+    offset, _ = wire_protocol.clock_offset_us(t0=9_000_000, t1=1_000_500, t2=1_000_600, t3=9_001_100)
+    assert offset == -8_000_000
+
+
+def test_sync_reply_on_json_protocol_is_a_line():
+    client = FakeClient()
+    server.handle_line(client, json.dumps({"type": "sync", "t0": 123}))
+    assert len(client.sent) == 1
+    assert client.sent[0].endswith(b"\n")
+    reply = json.loads(client.sent[0])
+    assert reply["type"] == "sync" and reply["t0"] == 123
+    assert reply["t2"] >= reply["t1"]
+
+
+def test_sync_reply_after_binary_ack_is_a_frame():
+    client = FakeClient()
+    hello = {"id": "esp32_test", "proto": [wire_protocol.PROTO_BINARY, wire_protocol.PROTO_JSON]}
+    server.handle_line(client, json.dumps(hello))
+    server.handle_line(client, json.dumps({"type": "sync", "t0": 77}))
+    server.registry.unregister(client)
+
+    ack, sync = client.sent
+    assert json.loads(ack)["proto"] == wire_protocol.PROTO_BINARY
+    messages = wire_protocol.FrameDecoder().feed(sync)
+    assert len(messages) == 1
+    msg_type, fields = messages[0]
+    assert msg_type == wire_protocol.MSG_JSON
+    assert fields["type"] == "sync" and fields["t0"] == 77
+
+
+def test_json_only_message_is_wrapped_for_binary_clients():
+    client = FakeClient()
+    client.protocol = wire_protocol.PROTO_BINARY
+    data = b'{"type":"bands","bpm":128.0}\n'
+    server.send_threaded([client], data, None, None)
+    msg_type, fields = wire_protocol.FrameDecoder().feed(client.sent[0])[0]
+    assert msg_type == wire_protocol.MSG_JSON
+    assert fields == {"type": "bands", "bpm": 128.0}
+
+
+ANIMATION = {"Animation": "FuseWave", "r": 255, "g": 10, "b": 0, "BPM": 128, "beatPercentage": 0.5}
+
+
+def test_schedule_animation_frame():
+    frame = wire_protocol.encode_animation(ANIMATION)
+    scheduled = wire_protocol.schedule_frame(frame, 123_456_789)
+    msg_type, fields, consumed = wire_protocol.decode_frame(scheduled)
+    assert msg_type == wire_protocol.MSG_SCHEDULED_ANIMATION
+    assert consumed == len(scheduled)
+    assert fields["startAt"] == 123_456_789
+    assert fields["Animation"] == "FuseWave" and fields["r"] == 255 and fields["BPM"] == 128
+
+
+def test_schedule_sequence_frame_keeps_steps():
+    steps = [(0, ANIMATION), (250, dict(ANIMATION, Animation="Blink", r=0))]
+    frame = wire_protocol.encode_sequence(steps)
+    scheduled = wire_protocol.schedule_frame(frame, 2**40)
+    assert len(scheduled) == len(frame)
+    msg_type, fields, _ = wire_protocol.decode_frame(scheduled)
+    assert msg_type == wire_protocol.MSG_SEQUENCE
+    assert fields["startAt"] == 2**40
+    assert [step["offsetMs"] for step in fields["steps"]] == [0, 250]
+    assert wire_protocol.decode_frame(frame)[1]["startAt"] == 0  # original untouched
+
+
+def test_schedule_tagged_frame_keeps_trigger_id():
+    frame = wire_protocol.with_trigger_id(wire_protocol.encode_animation(ANIMATION), 42)
+    fields = wire_protocol.decode_frame(wire_protocol.schedule_frame(frame, 1000))[1]
+    assert fields["trg"] == 42 and fields["startAt"] == 1000
+
+
+def test_schedule_rejects_other_messages():
+    frame = wire_protocol.encode_beat_pulse(1, 128.0)
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.schedule_frame(frame, 1000)
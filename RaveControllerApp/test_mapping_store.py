@@ -0,0 +1,88 @@
+'''
+Tests for MappingStore reloading hand-edited mapping files.
+
+    python -m pytest test_mapping_store.py
+'''
+import json
+import os
+import threading
+import time
+
+import animation_handler
+
+
+BLINK = {"name": "blue", "Animation": "Blink", "r": 0, "g": 0, "b": 255, "BPM": 128, "beatPercentage": 2.0}
+
+
+def make_store(tmp_path, mappings):
+    path = tmp_path / "animation_mappings.json"
+    path.write_text(json.dumps(mappings))
+    store = animation_handler.MappingStore(path, poll_interval_s=0.01)
+    store.load()
+    return store
+
+
+def edit(store, mappings):
+    store.path.write_text(json.dumps(mappings))
+    os.utime(store.path, ns=(0, store._mtime + 1_000_000))  # mtime must change even on coarse clocks
+
+
+def test_bad_key_is_skipped_and_others_compile(tmp_path):
+    store = make_store(tmp_path, {"a": [BLINK], "b": "not a list", "c": [42]})
+    assert set(store.payloads) == {"a"}
+
+
+def test_bad_edit_keeps_watching(tmp_path):
+    store = make_store(tmp_path, {"a": [BLINK]})
+    edit(store, ["not", "a", "mapping"])
+    assert store.check_for_changes() == []
+    assert set(store.payloads) == {"a"}
+
+    edit(store, {"a": [BLINK], "b": [dict(BLINK, name="other")], "c": {"Animation": "Blink"}})
+    assert store.check_for_changes() == ["b", "c"]
+    assert set(store.payloads) == {"a", "b"}
+
+
+def test_watcher_survives_errors(tmp_path, monkeypatch):
+    store = make_store(tmp_path, {"a": [BLINK]})
+    calls = []
+
+    def failing_check():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(store, "check_for_changes", failing_check)
+    store.start_watching()
+    deadline = time.monotonic() + 5
+    while len(calls) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    store.stop()
+    assert len(calls) >= 3
+
+
+def test_reads_do_not_wait_for_the_disk(tmp_path, monkeypatch):
+    store = make_store(tmp_path, {"a": [BLINK]})
+    writing, release = threading.Event(), threading.Event()
+    write = store._write
+
+    def slow_write(data):
+        writing.set()
+        release.wait(5)
+        write(data)
+
+    monkeypatch.setattr(store, "_write", slow_write)
+    store.set("b", [BLINK])
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert writing.wait(5)
+
+    # The flush is parked inside the write: reads and edits still go through
+    started = time.monotonic()
+    assert store.get("a") == [BLINK]
+    store.set("c", [BLINK])
+    assert time.monotonic() - started < 1
+
+    release.set()
+    flusher.join()
+    store.flush()
+    assert set(json.loads(store.path.read_text())) == {"a", "b", "c"}
@@ -0,0 +1,233 @@
+'''
+Encode/decode round trips for every wire_protocol message type.
+
+    python -m pytest test_wire_protocol.py
+'''
+import numpy as np
+import pytest
+
+import animation_handler
+import wire_protocol
+
+
+FUSEWAVE = {"Animation": "FuseWave", "r": 255, "g": 128, "b": 0, "BPM": 140, "beatPercentage": 0.5, "chunkSize": 5}
+BLINK = {"Animation": "Blink", "r": 0, "g": 0, "b": 255, "BPM": 128, "beatPercentage": 2.0}
+
+
+def decode_one(frame):
+    msg_type, fields, consumed = wire_protocol.decode_frame(frame)
+    assert consumed == len(frame)
+    return msg_type, fields
+
+
+def assert_animation(fields, schema):
+    for field in ("Animation", "r", "g", "b", "BPM", "beatPercentage"):
+        assert fields[field] == schema[field]
+    assert fields["chunkSize"] == schema.get("chunkSize", 0)
+
+
+@pytest.mark.parametrize("schema", [FUSEWAVE, BLINK])
+def test_animation(schema):
+    msg_type, fields = decode_one(wire_protocol.encode_animation(schema))
+    assert msg_type == wire_protocol.MSG_ANIMATION
+    assert_animation(fields, schema)
+    assert "trg" not in fields
+
+
+def test_animation_without_binary_encoding():
+    assert wire_protocol.encode_animation({"Animation": "Strobe"}) is None
+
+
+def test_band_frame():
+    frame = wire_protocol.encode_band_frame(7, 12_345, 128.5, 0.25, [0, 17, 255])
+    msg_type, fields = decode_one(frame)
+    assert msg_type == wire_protocol.MSG_BAND_FRAME
+    assert fields == {"seq": 7, "position_ms": 12_345, "bpm": 128.5, "beat_phase": 0.25, "levels": [0, 17, 255]}
+    assert list(frame[wire_protocol.BAND_LEVELS_OFFSET:]) == [0, 17, 255]
+
+
+def test_band_frame_phase_one_saturates():
+    _, fields = decode_one(wire_protocol.encode_band_frame(0, 0, 120.0, 1.0, []))
+    assert fields["beat_phase"] == 255 / 256.0
+    assert fields["levels"] == []
+
+
+def test_beat_pulse():
+    msg_type, fields = decode_one(wire_protocol.encode_beat_pulse(2**32 + 3, 174.0))
+    assert msg_type == wire_protocol.MSG_BEAT_PULSE
+    assert fields == {"beat_index": 3, "bpm": 174.0}
+
+
+def test_scheduled_animation():
+    frame = wire_protocol.encode_scheduled_animation(wire_protocol.encode_animation(BLINK), 2**50 + 1)
+    msg_type, fields = decode_one(frame)
+    assert msg_type == wire_protocol.MSG_SCHEDULED_ANIMATION
+    assert fields["startAt"] == 2**50 + 1
+    assert_animation(fields, BLINK)
+
+
+def test_sequence():
+    steps = [(0, FUSEWAVE), (469, BLINK), (938, FUSEWAVE)]
+    msg_type, fields = decode_one(wire_protocol.encode_sequence(steps, start_at_us=99))
+    assert msg_type == wire_protocol.MSG_SEQUENCE
+    assert fields["startAt"] == 99
+    assert [step["offsetMs"] for step in fields["steps"]] == [0, 469, 938]
+    assert [step["repeats"] for step in fields["steps"]] == [1, 1, 1]
+    for step, (_, schema) in zip(fields["steps"], steps):
+        assert_animation(step, schema)
+
+
+def test_sequence_too_long():
+    steps = [(0, BLINK)] * (wire_protocol.MAX_SEQUENCE_STEPS + 1)
+    assert wire_protocol.encode_sequence(steps) is None
+
+
+def test_pixel_frame():
+    pixels = np.arange(30, dtype=np.uint8).reshape(10, 3)
+    msg_type, fields = decode_one(wire_protocol.encode_pixel_frame(5, pixels))
+    assert msg_type == wire_protocol.MSG_PIXEL_FRAME
+    assert fields["seq"] == 5 and fields["num_leds"] == 10
+    assert fields["pixels"] == pixels.tobytes()
+
+
+def test_pixel_frame_size_limit():
+    pixels = np.zeros((wire_protocol.MAX_PIXEL_FRAME_LEDS, 3), dtype=np.uint8)
+    assert len(wire_protocol.encode_pixel_frame(0, pixels)) <= wire_protocol.MAX_FRAME_SIZE
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.encode_pixel_frame(0, np.zeros((wire_protocol.MAX_PIXEL_FRAME_LEDS + 1, 3), dtype=np.uint8))
+
+
+def test_json():
+    msg_type, fields = decode_one(wire_protocol.encode_json(b'{"type":"sync","t0":1}\n'))
+    assert msg_type == wire_protocol.MSG_JSON
+    assert fields == {"type": "sync", "t0": 1}
+
+
+@pytest.mark.parametrize("encode, base_type", [
+    (lambda: wire_protocol.encode_animation(FUSEWAVE), wire_protocol.MSG_ANIMATION),
+    (lambda: wire_protocol.encode_scheduled_animation(wire_protocol.encode_animation(FUSEWAVE), 10),
+     wire_protocol.MSG_SCHEDULED_ANIMATION),
+    (lambda: wire_protocol.encode_sequence([(0, FUSEWAVE), (100, BLINK)]), wire_protocol.MSG_SEQUENCE),
+])
+def test_with_trigger_id(encode, base_type):
+    frame = encode()
+    tagged = wire_protocol.with_trigger_id(frame, 2**32 + 41)
+    assert len(tagged) == len(frame) + 4
+    msg_type, fields = decode_one(tagged)
+    assert msg_type == base_type
+    assert fields["trg"] == 41
+    assert "trg" not in decode_one(frame)[1]
+
+
+def test_frame_decoder_split_reads():
+    frames = [
+        wire_protocol.encode_animation(FUSEWAVE),
+        wire_protocol.encode_band_frame(1, 20, 128.0, 0.5, [1, 2, 3, 4]),
+        wire_protocol.with_trigger_id(wire_protocol.encode_sequence([(0, BLINK), (50, FUSEWAVE)]), 9),
+        wire_protocol.encode_beat_pulse(4, 128.0),
+        wire_protocol.encode_json(b'{"type":"ack","trg":9}\n'),
+    ]
+    stream = b"".join(frames)
+    for chunk_size in (1, 2, 3, 7, len(stream)):
+        decoder = wire_protocol.FrameDecoder()
+        messages = []
+        for start in range(0, len(stream), chunk_size):
+            messages += decoder.feed(stream[start:start + chunk_size])
+        assert [msg_type for msg_type, _ in messages] == [frame[3] for frame in frames]
+        assert messages[2][1]["trg"] == 9
+        assert decoder.buffer == bytearray()
+
+
+def test_frame_decoder_keeps_partial_frame():
+    frame = wire_protocol.encode_beat_pulse(1, 120.0)
+    decoder = wire_protocol.FrameDecoder()
+    assert decoder.feed(frame[:1]) == []
+    assert decoder.feed(frame[1:-1]) == []
+    assert len(decoder.feed(frame[-1:])) == 1
+
+
+def test_decode_rejects_bad_frames():
+    frame = bytearray(wire_protocol.encode_beat_pulse(1, 120.0))
+    frame[2] = wire_protocol.PROTOCOL_VERSION + 1
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.decode_frame(frame)
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.decode_frame(wire_protocol.encode_frame(0x7F, b""))
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.decode_frame(wire_protocol.encode_frame(wire_protocol.MSG_BAND_FRAME, b"\0" * 13 + b"\x05"))
+
+
+@pytest.mark.parametrize("field, value", [("r", 300), ("g", -1), ("BPM", 0), ("BPM", 70_000),
+                                          ("chunkSize", 256), ("b", "blue")])
+def test_out_of_range_animation_is_rejected(field, value):
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.encode_animation(dict(FUSEWAVE, **{field: value}))
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.encode_sequence([(0, BLINK), (0, dict(FUSEWAVE, **{field: value}))])
+
+
+def test_missing_field_is_rejected():
+    schema = dict(BLINK)
+    del schema["g"]
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.encode_animation(schema)
+
+
+def test_out_of_range_mapping_falls_back_to_json():
+    payload = animation_handler.compile_payload("x", [dict(FUSEWAVE, name="hot", r=300)])
+    assert payload.binary is None
+    assert b'"r":300' in payload.data
+
+    payload = animation_handler.compile_payload("y", [dict(BLINK, beats=1), dict(FUSEWAVE, BPM=0)])
+    assert payload.binary is None
+    assert b'"Sequence"' in payload.data
+
+
+def test_beats_repeat_the_step_on_every_beat():
+    # FuseWave for 4 beats at 120 BPM (500 ms per beat), then Blink
+    schemas = [dict(FUSEWAVE, BPM=120, beats=4), BLINK]
+    steps = animation_handler.sequence_steps(schemas)
+    assert [offset for offset, _ in steps] == [0, 2000]
+    assert [schema.get("repeats", 1) for _, schema in steps] == [4, 1]
+    assert animation_handler.repeat_offsets(*steps[0]) == [0, 500, 1000, 1500]
+
+    payload = animation_handler.compile_payload("k", schemas)
+    _, fields = decode_one(payload.binary)
+    assert [(step["offsetMs"], step["repeats"]) for step in fields["steps"]] == [(0, 4), (2000, 1)]
+    assert b'"repeats":4' in payload.data
+
+
+def test_fractional_beats_and_layering():
+    steps = animation_handler.sequence_steps([dict(BLINK, BPM=120, beats=1.5), FUSEWAVE, BLINK])
+    assert [offset for offset, _ in steps] == [0, 750, 750]
+    assert steps[0][1]["repeats"] == 2
+
+    # A single schema with beats is a sequence of one repeated step
+    payload = animation_handler.compile_payload("k", [dict(BLINK, beats=2)])
+    msg_type, fields = decode_one(payload.binary)
+    assert msg_type == wire_protocol.MSG_SEQUENCE
+    assert fields["steps"][0]["repeats"] == 2
+
+
+def test_long_repeats_fit_one_step():
+    payload = animation_handler.compile_payload("k", [dict(FUSEWAVE, beats=64), BLINK])
+    _, fields = decode_one(payload.binary)
+    assert [step["repeats"] for step in fields["steps"]] == [64, 1]
+
+
+def test_over_limit_sequence_is_rejected():
+    with pytest.raises(ValueError):
+        animation_handler.validate_sequence([BLINK] * (wire_protocol.MAX_SEQUENCE_STEPS + 1))
+    with pytest.raises(ValueError):
+        animation_handler.validate_sequence([dict(BLINK, beats=wire_protocol.MAX_STEP_REPEATS + 1)])
+    with pytest.raises(wire_protocol.ProtocolError):
+        wire_protocol.encode_sequence([(0, dict(BLINK, repeats=0))])
+    # Hand-edited mappings that do not fit are skipped when compiled
+    assert animation_handler.compile_payload("k", [BLINK] * (wire_protocol.MAX_SEQUENCE_STEPS + 1)) is None
+
+
+def test_choose_protocol():
+    assert wire_protocol.choose_protocol(["bin1", "json"]) == wire_protocol.PROTO_BINARY
+    assert wire_protocol.choose_protocol("bin1") == wire_protocol.PROTO_BINARY
+    assert wire_protocol.choose_protocol(["json"]) == wire_protocol.PROTO_JSON
+    assert wire_protocol.choose_protocol(None) == wire_protocol.PROTO_JSON
@@ -0,0 +1,94 @@
+'''
+Loopback harness for the UDP multicast transport.
+
+Simulates many strips on this machine: every receiver joins the multicast group on
+the same port (SO_REUSEPORT), so each gets its own copy of every datagram, exactly
+as separate ESP32s would. Optional random loss is applied per receiver.
+
+Usage:
+    python udp_loopback_harness.py --receivers 50 --frames 2000 --rate 100 --loss 0.02
+'''
+import argparse
+import random
+import selectors
+import threading
+import time
+
+import wire_protocol
+from udp_transport import UdpFrameSender, UdpFrameReceiver, MULTICAST_GROUP
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many UDP strip receivers on loopback.")
+    parser.add_argument("--receivers", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="frames per second")
+    parser.add_argument("--bands", type=int, default=8)
+    parser.add_argument("--loss", type=float, default=0.0, help="simulated drop probability per receiver")
+    parser.add_argument("--port", type=int, default=6102)
+    parser.add_argument("--group", default=MULTICAST_GROUP)
+    parser.add_argument("--interface", default="127.0.0.1")
+    args = parser.parse_args()
+
+    receivers = [UdpFrameReceiver(args.group, args.port, interface=args.interface) for _ in range(args.receivers)]
+    sender = UdpFrameSender(args.group, args.port, interface=args.interface)
+
+    selector = selectors.DefaultSelector()
+    for receiver in receivers:
+        receiver.sock.setblocking(False)
+        selector.register(receiver.sock, selectors.EVENT_READ, receiver)
+
+    decode_errors = [0]
+    done = threading.Event()
+
+    def receive_loop():
+        while not done.is_set():
+            for key, _ in selector.select(timeout=0.1):
+                receiver = key.data
+                while True:
+                    try:
+                        datagram = receiver.sock.recv(65535)
+                    except BlockingIOError:
+                        break
+                    if args.loss and random.random() < args.loss:
+                        continue
+                    payload = receiver.handle(datagram)
+                    if payload is not None and wire_protocol.decode_frame(payload) is None:
+                        decode_errors[0] += 1
+
+    thread = threading.Thread(target=receive_loop, daemon=True)
+    thread.start()
+
+    period = 1.0 / args.rate
+    levels = list(range(args.bands))
+    started = time.perf_counter()
+    for i in range(args.frames):
+        sender.send(wire_protocol.encode_band_frame(i, i * period * 1000, 128.0, (i % 50) / 50, levels))
+        next_time = started + (i + 1) * period
+        time.sleep(max(0.0, next_time - time.perf_counter()))
+    time.sleep(0.5)
+    done.set()
+    thread.join()
+
+    latencies = [lat for r in receivers for lat in r.latencies_us]
+    received = sum(r.received for r in receivers)
+    print(f"receivers={args.receivers} frames_sent={sender.sent} send_errors={sender.send_errors}")
+    print(f"delivered={received}/{args.frames * args.receivers} "
+          f"lost={sum(r.lost for r in receivers)} stale={sum(r.stale for r in receivers)} "
+          f"decode_errors={decode_errors[0]}")
+    print(f"latency_us p50={percentile(latencies, 50)} p99={percentile(latencies, 99)} max={max(latencies, default=0)}")
+
+    for receiver in receivers:
+        receiver.close()
+    sender.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+'''
+UDP multicast/broadcast transport for frames that can be dropped.
+
+Streaming band frames and beat pulses go out once to a multicast group (or the
+subnet broadcast address) instead of one TCP sendall per strip, and are never
+retransmitted, so a lossy link only loses frames rather than delaying later ones.
+Control messages such as animation presets stay on the TCP server. On the strips,
+udp_stream_task in the firmware joins the group and decodes the payload frames.
+
+Datagram layout (little endian):
+    2s   magic      b"RG"
+    u8   version    DATAGRAM_VERSION
+    u32  seq        per-sender sequence number, receivers drop anything older
+    u64  sent_us    sender clock (wire_protocol.server_time_us)
+    ...  payload    one wire_protocol frame
+'''
+import socket
+import struct
+
+from wire_protocol import server_time_us as now_us
+
+
+MULTICAST_GROUP = "239.255.42.99"
+UDP_PORT = 6002
+DATAGRAM_VERSION = 1
+
+_MAGIC = b"RG"
+_DATAGRAM_HEADER = struct.Struct("<2sBIQ")
+
+
+class UdpFrameSender:
+    def __init__(self, group=MULTICAST_GROUP, port=UDP_PORT, use_broadcast=False, ttl=1, interface="0.0.0.0"):
+        """
+        Args:
+            group (str): Multicast group, or broadcast address when use_broadcast is set.
+            port (int): Destination port.
+            use_broadcast (bool): Send to a broadcast address instead of a multicast group.
+            ttl (int): Multicast TTL; 1 keeps packets on the local network.
+            interface (str): Local interface address for outgoing multicast.
+        """
+        self.address = (group, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        if use_broadcast:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        else:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.sock.setblocking(False)
+
+        self.seq = 0
+        self.sent = 0
+        self.send_errors = 0
+
+    def send(self, frame):
+        """Send one wire_protocol frame to every receiver with a single datagram."""
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        datagram = _DATAGRAM_HEADER.pack(_MAGIC, DATAGRAM_VERSION, self.seq, now_us()) + frame
+        try:
+            self.sock.sendto(datagram, self.address)
+            self.sent += 1
+        except OSError:
+            self.send_errors += 1  # dropping is fine for this transport
+
+    def close(self):
+        self.sock.close()
+
+
+def parse_datagram(datagram):
+    """
+    Split a datagram into its header fields and payload.
+
+    Returns:
+        tuple: (seq, sent_us, payload), or None if it is not one of ours.
+    """
+    if len(datagram) < _DATAGRAM_HEADER.size:
+        return None
+    magic, version, seq, sent_us = _DATAGRAM_HEADER.unpack_from(datagram)
+    if magic != _MAGIC or version != DATAGRAM_VERSION:
+        return None
+    return seq, sent_us, datagram[_DATAGRAM_HEADER.size:]
+
+
+class UdpFrameReceiver:
+    """Receiving side, as a strip would run it. Used by the loopback harness."""
+
+    def __init__(self, group=MULTICAST_GROUP, port=UDP_PORT, use_broadcast=False, interface="0.0.0.0"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind(("", port))
+        if not use_broadcast:
+            membership = socket.inet_aton(group) + socket.inet_aton(interface)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+        self.last_seq = None
+        self.received = 0
+        self.lost = 0         # gaps in the sequence
+        self.stale = 0        # duplicates or out-of-order datagrams, dropped
+        self.latencies_us = []
+
+    def handle(self, datagram, received_us=None):
+        """
+        Account for one datagram.
+
+        Returns:
+            bytes or None: The payload if it is newer than anything seen so far.
+        """
+        parsed = parse_datagram(datagram)
+        if parsed is None:
+            return None
+        seq, sent_us, payload = parsed
+
+        if self.last_seq is not None:
+            delta = (seq - self.last_seq) & 0xFFFFFFFF
+            if delta == 0 or delta >= 0x80000000:
+                self.stale += 1
+                return None
+            self.lost += delta - 1
+        self.last_seq = seq
+        self.received += 1
+        self.latencies_us.append((now_us() if received_us is None else received_us) - sent_us)
+        return payload
+
+    def receive(self, timeout=None):
+        """Block for one datagram and return its payload (None on timeout or stale)."""
+        self.sock.settimeout(timeout)
+        try:
+            datagram = self.sock.recv(65535)
+        except socket.timeout:
+            return None
+        return self.handle(datagram)
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,422 @@
+'''
+Compact binary framing for controller -> strip messages.
+
+Newline-delimited JSON stays the default. A client that lists PROTO_BINARY in the
+"proto" field of its hello message is answered with a JSON proto ack, and from then
+on receives binary frames instead of JSON lines.
+
+Frame layout (little endian):
+    u16  length   number of bytes after this field (version + type + body)
+    u8   version  PROTOCOL_VERSION
+    u8   type     MSG_* constant
+    ...  body     fixed layout per message type
+
+MSG_ANIMATION body:
+    u8 animation (ANIMATION_IDS), u8 r, u8 g, u8 b, u16 BPM, f32 beatPercentage, u8 chunkSize
+
+MSG_BAND_FRAME body (audio-reactive streaming):
+    u32 seq, u32 position_ms, f32 bpm, u8 beat_phase (0-255 = 0-1), u8 num_bands, u8 levels[num_bands]
+
+MSG_BEAT_PULSE body:
+    u32 beat_index, f32 bpm
+
+MSG_SCHEDULED_ANIMATION body:
+    u64 start_at_us (server clock, see server_time_us), then the MSG_ANIMATION body
+
+MSG_SEQUENCE body (several animations from one trigger):
+    u64 start_at_us (0 = on receipt), u8 step count, then per step:
+    u32 offset_ms from the sequence start, u8 repeats (the strip plays the step this
+    many times, one beat at the step's BPM apart), MSG_ANIMATION body
+
+MSG_PIXEL_FRAME body (host-rendered pixels for one strip):
+    u32 seq, u16 num_leds, u8 rgb[num_leds * 3]
+
+MSG_JSON body (any JSON message sent to a client on the binary protocol):
+    one UTF-8 JSON object, without the newline. Control messages such as the sync
+    reply and messages without a binary encoding travel this way, so a binary
+    client never has to tell JSON lines and frames apart.
+
+Animation, scheduled animation and sequence bodies may end with an extra
+u32 trigger id (see with_trigger_id); the strip then answers with a JSON
+{"type":"ack","trg":id} once it has started the animation.
+'''
+import json
+import struct
+import time
+
+
+PROTOCOL_VERSION = 1
+
+PROTO_JSON = "json"
+PROTO_BINARY = "bin1"
+
+MSG_ANIMATION = 0x01
+MSG_BAND_FRAME = 0x02
+MSG_BEAT_PULSE = 0x03
+MSG_SCHEDULED_ANIMATION = 0x04
+MSG_SEQUENCE = 0x05
+MSG_PIXEL_FRAME = 0x06
+MSG_JSON = 0x07
+
+MAX_FRAME_SIZE = 2048  # receive buffer of the strip firmware, length prefix included
+
+MAX_SEQUENCE_STEPS = 8  # each step is an animation task on the strip
+MAX_STEP_REPEATS = 255
+
+ANIMATION_IDS = {"FuseWave": 0, "Blink": 1}
+ANIMATION_NAMES = {value: key for key, value in ANIMATION_IDS.items()}
+
+_LENGTH = struct.Struct("<H")
+_HEADER = struct.Struct("<HBB")
+_ANIMATION = struct.Struct("<BBBBHfB")
+_BAND_FRAME = struct.Struct("<IIfBB")
+_BEAT_PULSE = struct.Struct("<If")
+_START_AT = struct.Struct("<Q")
+_SEQUENCE = struct.Struct("<QB")
+_STEP = struct.Struct("<IB")
+_TRIGGER_ID = struct.Struct("<I")
+_PIXEL_FRAME = struct.Struct("<IH")
+
+BAND_LEVELS_OFFSET = _HEADER.size + _BAND_FRAME.size  # levels in an encoded MSG_BAND_FRAME
+MAX_PIXEL_FRAME_LEDS = (MAX_FRAME_SIZE - _HEADER.size - _PIXEL_FRAME.size) // 3  # per strip, 679
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def server_time_us():
+    """The controller's clock in microseconds, used for every timestamp on the wire."""
+    return int(time.perf_counter() * 1_000_000)
+
+
+def clock_offset_us(t0, t1, t2, t3):
+    """
+    Result of the sync handshake as the strip computes it (see server.answer_sync).
+
+    Args:
+        t0 (int): Client time the request was sent.
+        t1 (int): Server time the request was received.
+        t2 (int): Server time the reply was sent.
+        t3 (int): Client time the reply was received.
+
+    Returns:
+        tuple: (offset_us, rtt_us), offset being server minus client time.
+    """
+    offset = ((t1 - t0) + (t2 - t3)) // 2
+    rtt = (t3 - t0) - (t2 - t1)
+    return offset, rtt
+
+
+def encode_frame(msg_type, body):
+    """Wrap an encoded body in the length/version/type header."""
+    return _HEADER.pack(len(body) + 2, PROTOCOL_VERSION, msg_type) + body
+
+
+def encode_json(data):
+    """Wrap a newline-terminated JSON message (bytes) as a MSG_JSON frame."""
+    return encode_frame(MSG_JSON, data.rstrip(b"\n"))
+
+
+def encode_for(protocol, data, binary_data=None):
+    """
+    Pick the bytes to send to a client on the given protocol.
+
+    Binary clients get binary_data, or data wrapped in MSG_JSON when the message
+    has no binary encoding; JSON clients always get data.
+    """
+    if protocol != PROTO_BINARY:
+        return data
+    if binary_data is not None:
+        return binary_data
+    return encode_json(data)
+
+
+# animation field -> (lowest, highest) value its binary encoding can hold
+ANIMATION_FIELD_RANGES = {"r": (0, 255), "g": (0, 255), "b": (0, 255), "BPM": (1, 0xFFFF), "chunkSize": (0, 255),
+                          "repeats": (1, MAX_STEP_REPEATS)}
+
+
+def _animation_field(schema, field, default=None):
+    value = schema.get(field, default)
+    if value is None:
+        raise ProtocolError(f"animation is missing {field}")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ProtocolError(f"animation {field} is not a number: {value!r}")
+    low, high = ANIMATION_FIELD_RANGES[field]
+    if not low <= value <= high:
+        raise ProtocolError(f"animation {field}={value} is outside {low}-{high}")
+    return value
+
+
+def _animation_body(schema):
+    animation_id = ANIMATION_IDS.get(schema.get("Animation"))
+    if animation_id is None:
+        return None
+    try:
+        beat_percentage = float(schema.get("beatPercentage"))
+    except (TypeError, ValueError):
+        raise ProtocolError(f"animation beatPercentage is not a number: {schema.get('beatPercentage')!r}")
+    return _ANIMATION.pack(animation_id, _animation_field(schema, "r"), _animation_field(schema, "g"),
+                           _animation_field(schema, "b"), _animation_field(schema, "BPM"),
+                           beat_percentage, _animation_field(schema, "chunkSize", 0))
+
+
+def encode_animation(schema):
+    """
+    Encode an animation schema dict (as built by animation_handler) as a binary frame.
+
+    Returns:
+        bytes or None: None if the animation type has no binary encoding.
+
+    Raises:
+        ProtocolError: A field is missing or does not fit its binary field
+            (see ANIMATION_FIELD_RANGES).
+    """
+    body = _animation_body(schema)
+    if body is None:
+        return None
+    return encode_frame(MSG_ANIMATION, body)
+
+
+def encode_sequence(steps, start_at_us=0):
+    """
+    Encode several animations as one frame.
+
+    Args:
+        steps (list): (offset_ms, schema) pairs, offsets relative to the sequence start.
+            A schema's optional "repeats" (default 1) plays it that many times, a beat apart.
+        start_at_us (int): Server time to start at, 0 to start on receipt.
+
+    Returns:
+        bytes or None: None if a step has no binary encoding or there are too many steps.
+
+    Raises:
+        ProtocolError: A step does not fit the binary encoding, as in encode_animation.
+    """
+    if len(steps) > MAX_SEQUENCE_STEPS:
+        return None
+    body = bytearray(_SEQUENCE.pack(start_at_us, len(steps)))
+    for offset_ms, schema in steps:
+        animation = _animation_body(schema)
+        if animation is None:
+            return None
+        body += _STEP.pack(int(offset_ms), _animation_field(schema, "repeats", 1)) + animation
+    return encode_frame(MSG_SEQUENCE, bytes(body))
+
+
+def encode_band_frame(seq, position_ms, bpm, beat_phase, levels):
+    """
+    Encode one streaming frame. levels are band levels already quantised to 0-255.
+    """
+    body = _BAND_FRAME.pack(seq & 0xFFFFFFFF, int(position_ms) & 0xFFFFFFFF, float(bpm),
+                            min(255, int(beat_phase * 256)), len(levels)) + bytes(levels)
+    return encode_frame(MSG_BAND_FRAME, body)
+
+
+def encode_scheduled_animation(animation_frame, start_at_us):
+    """Wrap an encoded MSG_ANIMATION frame with the server time it should start at."""
+    body = _START_AT.pack(start_at_us) + animation_frame[_HEADER.size:]
+    return encode_frame(MSG_SCHEDULED_ANIMATION, body)
+
+
+def schedule_frame(frame, start_at_us):
+    """Return a copy of a MSG_ANIMATION or MSG_SEQUENCE frame that starts at start_at_us."""
+    msg_type = frame[_HEADER.size - 1]
+    if msg_type == MSG_SEQUENCE:
+        scheduled = bytearray(frame)
+        _START_AT.pack_into(scheduled, _HEADER.size, start_at_us)
+        return bytes(scheduled)
+    if msg_type == MSG_ANIMATION:
+        return encode_scheduled_animation(frame, start_at_us)
+    raise ProtocolError(f"message type {msg_type} cannot be scheduled")
+
+
+def encode_pixel_frame(seq, pixels):
+    """
+    Encode one strip's pixels, a (num_leds x 3) uint8 array, as a raw RGB frame.
+
+    Raises:
+        ProtocolError: More than MAX_PIXEL_FRAME_LEDS pixels, the frame would not fit
+            the strip's receive buffer.
+    """
+    if len(pixels) > MAX_PIXEL_FRAME_LEDS:
+        raise ProtocolError(f"{len(pixels)} LEDs do not fit a pixel frame (at most {MAX_PIXEL_FRAME_LEDS})")
+    body = _PIXEL_FRAME.pack(seq & 0xFFFFFFFF, len(pixels)) + pixels.tobytes()
+    return encode_frame(MSG_PIXEL_FRAME, body)
+
+
+def with_trigger_id(frame, trigger_id):
+    """Append a trigger id to a command frame so the strip acknowledges it."""
+    tagged = bytearray(frame) + _TRIGGER_ID.pack(trigger_id & 0xFFFFFFFF)
+    _LENGTH.pack_into(tagged, 0, len(tagged) - _LENGTH.size)
+    return bytes(tagged)
+
+
+def _split_trigger_id(body, size, fields):
+    """Strip an optional trailing trigger id from a body of the given base size."""
+    if len(body) == size + _TRIGGER_ID.size:
+        (fields["trg"],) = _TRIGGER_ID.unpack_from(body, size)
+        return body[:size]
+    return body
+
+
+def encode_beat_pulse(beat_index, bpm):
+    return encode_frame(MSG_BEAT_PULSE, _BEAT_PULSE.pack(beat_index & 0xFFFFFFFF, float(bpm)))
+
+
+def band_frame_to_json(fields):
+    """JSON line carrying a decoded band frame, for clients on the JSON protocol."""
+    return {"type": "bands", "seq": fields["seq"], "position_ms": fields["position_ms"],
+            "bpm": round(fields["bpm"], 2), "beat_phase": round(fields["beat_phase"], 3),
+            "levels": fields["levels"]}
+
+
+def _decode_animation(body):
+    extra = {}
+    body = _split_trigger_id(body, _ANIMATION.size, extra)
+    if len(body) != _ANIMATION.size:
+        raise ProtocolError(f"bad animation body length {len(body)}")
+    names = ("Animation", "r", "g", "b", "BPM", "beatPercentage", "chunkSize")
+    fields = dict(zip(names, _ANIMATION.unpack_from(body)))
+    fields["Animation"] = ANIMATION_NAMES.get(fields["Animation"], fields["Animation"])
+    fields.update(extra)
+    return fields
+
+
+def _decode_band_frame(body):
+    if len(body) < _BAND_FRAME.size:
+        raise ProtocolError(f"bad band frame body length {len(body)}")
+    seq, position_ms, bpm, phase, num_bands = _BAND_FRAME.unpack_from(body)
+    levels = body[_BAND_FRAME.size:]
+    if len(levels) != num_bands:
+        raise ProtocolError(f"band frame declares {num_bands} bands but carries {len(levels)}")
+    return {"seq": seq, "position_ms": position_ms, "bpm": bpm,
+            "beat_phase": phase / 256.0, "levels": list(levels)}
+
+
+def _decode_scheduled_animation(body):
+    extra = {}
+    body = _split_trigger_id(body, _START_AT.size + _ANIMATION.size, extra)
+    if len(body) != _START_AT.size + _ANIMATION.size:
+        raise ProtocolError(f"bad scheduled animation body length {len(body)}")
+    fields = _decode_animation(body[_START_AT.size:])
+    (fields["startAt"],) = _START_AT.unpack_from(body)
+    fields.update(extra)
+    return fields
+
+
+def _decode_sequence(body):
+    if len(body) < _SEQUENCE.size:
+        raise ProtocolError(f"bad sequence body length {len(body)}")
+    start_at, count = _SEQUENCE.unpack_from(body)
+    step_size = _STEP.size + _ANIMATION.size
+    extra = {}
+    body = _split_trigger_id(body, _SEQUENCE.size + count * step_size, extra)
+    if len(body) != _SEQUENCE.size + count * step_size:
+        raise ProtocolError(f"sequence declares {count} steps but has {len(body)} bytes")
+    steps = []
+    for offset in range(_SEQUENCE.size, len(body), step_size):
+        fields = _decode_animation(body[offset + _STEP.size:offset + step_size])
+        fields["offsetMs"], fields["repeats"] = _STEP.unpack_from(body, offset)
+        steps.append(fields)
+    return dict({"startAt": start_at, "steps": steps}, **extra)
+
+
+def _decode_pixel_frame(body):
+    if len(body) < _PIXEL_FRAME.size:
+        raise ProtocolError(f"bad pixel frame body length {len(body)}")
+    seq, num_leds = _PIXEL_FRAME.unpack_from(body)
+    pixels = body[_PIXEL_FRAME.size:]
+    if len(pixels) != num_leds * 3:
+        raise ProtocolError(f"pixel frame declares {num_leds} LEDs but carries {len(pixels)} bytes")
+    return {"seq": seq, "num_leds": num_leds, "pixels": pixels}
+
+
+def _decode_beat_pulse(body):
+    if len(body) != _BEAT_PULSE.size:
+        raise ProtocolError(f"bad beat pulse body length {len(body)}")
+    beat_index, bpm = _BEAT_PULSE.unpack(body)
+    return {"beat_index": beat_index, "bpm": bpm}
+
+
+def _decode_json(body):
+    try:
+        fields = json.loads(body)
+    except ValueError as e:
+        raise ProtocolError(f"bad JSON body: {e}")
+    if not isinstance(fields, dict):
+        raise ProtocolError("JSON body is not an object")
+    return fields
+
+
+# message type -> body decoder returning a fields dict
+MESSAGE_DECODERS = {
+    MSG_ANIMATION: _decode_animation,
+    MSG_BAND_FRAME: _decode_band_frame,
+    MSG_BEAT_PULSE: _decode_beat_pulse,
+    MSG_SCHEDULED_ANIMATION: _decode_scheduled_animation,
+    MSG_SEQUENCE: _decode_sequence,
+    MSG_PIXEL_FRAME: _decode_pixel_frame,
+    MSG_JSON: _decode_json,
+}
+
+
+def decode_frame(data, offset=0):
+    """
+    Decode one frame starting at data[offset].
+
+    Returns:
+        tuple: (msg_type, fields dict, bytes consumed), or None if data holds
+        less than a full frame.
+    """
+    if len(data) - offset < _LENGTH.size:
+        return None
+    (length,) = _LENGTH.unpack_from(data, offset)
+    end = offset + _LENGTH.size + length
+    if len(data) < end:
+        return None
+    if length < 2:
+        raise ProtocolError(f"frame too short ({length} bytes)")
+
+    _, version, msg_type = _HEADER.unpack_from(data, offset)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    if msg_type not in MESSAGE_DECODERS:
+        raise ProtocolError(f"unknown message type {msg_type}")
+
+    body = bytes(data[offset + _HEADER.size:end])
+    return msg_type, MESSAGE_DECODERS[msg_type](body), end - offset
+
+
+class FrameDecoder:
+    """Incremental decoder for a byte stream of frames."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes, returning the list of (msg_type, fields) completed."""
+        self.buffer += data
+        messages = []
+        offset = 0
+        while True:
+            decoded = decode_frame(self.buffer, offset)
+            if decoded is None:
+                break
+            msg_type, fields, consumed = decoded
+            messages.append((msg_type, fields))
+            offset += consumed
+        del self.buffer[:offset]
+        return messages
+
+
+def choose_protocol(offered):
+    """Pick the protocol for a client from the "proto" value of its hello."""
+    if isinstance(offered, str):
+        offered = [offered]
+    if offered and PROTO_BINARY in offered:
+        return PROTO_BINARY
+    return PROTO_JSON
@@ -0,0 +1,247 @@
+'''
+Audio analysis pipeline running off the Tk main loop.
+
+AnalysisWorker runs on its own thread at a fixed frame period: it grabs the latest
+sample window, computes band energies, EMA smoothing and tempo, and publishes a
+timestamped AnalysisFrame into a FrameRingBuffer. The UI only ever reads the newest
+frame, so a slow draw never delays analysis and a slow analysis step never blocks Tk.
+
+In overlapped mode (hop_samples set) the worker wakes once per hop, pushes the
+samples that arrived since the last wake-up into a SlidingBandPlan and publishes a
+frame per completed hop, e.g. a 4096 sample window every 256 samples: ~172
+frames/s at 44.1 kHz with ~11 Hz bins for the low bands, instead of one 20 ms
+window (~50 Hz bins) per period. It is an accuracy mode, not a cheaper one: a hop
+costs a little less than a 20 ms window, but there are ~3.4 times as many of them,
+so it takes roughly 2.5-3.5x the CPU of the 20 ms path (benchmark_analysis.py).
+Kick onsets come through sooner than on the 20 ms path (measure_capture_latency.py
+--hop 256). The mode can be switched while running with set_overlapped.
+
+The ring buffer has a single producer and a single consumer. Frames live in
+preallocated slots; the producer only advances `published` after a slot is fully
+written, and the consumer re-checks the slot sequence after copying, so no lock is
+needed (plain attribute writes are atomic under the GIL).
+'''
+import threading
+import time
+
+import numpy as np
+
+
+class AnalysisFrame:
+    """One analysis result. Slots are reused, so consumers copy them with copy_from."""
+
+    def __init__(self, num_bands):
+        self.seq = 0
+        self.timestamp = 0.0      # time.perf_counter() when the frame was produced
+        self.position_ms = 0.0    # playback position the samples were taken from
+        self.bands = np.zeros(num_bands)
+        self.bpm = 0.0
+        self.beat_phase = 0.0
+        self.is_beat = False
+
+    def copy_from(self, other):
+        self.seq = other.seq
+        self.timestamp = other.timestamp
+        self.position_ms = other.position_ms
+        self.bands[:] = other.bands
+        self.bpm = other.bpm
+        self.beat_phase = other.beat_phase
+        self.is_beat = other.is_beat
+
+
+class FrameRingBuffer:
+    def __init__(self, num_bands, capacity=8):
+        self.capacity = capacity
+        self.slots = [AnalysisFrame(num_bands) for _ in range(capacity)]
+        self.published = 0       # frames published so far (producer side)
+        self.consumed_seq = 0    # last frame seq read (consumer side)
+        self.dropped = 0         # frames published but never read
+
+    def acquire(self):
+        """Producer: slot to write the next frame into."""
+        slot = self.slots[self.published % self.capacity]
+        slot.seq = -1  # mark as being written
+        return slot
+
+    def publish(self, slot):
+        """Producer: make the acquired slot visible to the consumer."""
+        slot.seq = self.published + 1
+        self.published += 1
+
+    def read_latest(self, out):
+        """
+        Consumer: copy the newest frame into out.
+
+        Returns:
+            bool: False if nothing new was published since the last read.
+        """
+        while True:
+            seq = self.published
+            if seq == self.consumed_seq:
+                return False
+            slot = self.slots[(seq - 1) % self.capacity]
+            out.copy_from(slot)
+            if slot.seq == seq:
+                break  # slot was not overwritten while copying
+
+        self.dropped += seq - self.consumed_seq - 1
+        self.consumed_seq = seq
+        return True
+
+
+class AnalysisWorker:
+    def __init__(self, audio_player, audio_analyzer, tempo_tracker, num_bands, period_ms=20, publisher=None,
+                 hop_samples=None, window_samples=4096):
+        """
+        Args:
+            audio_player: Sample source (AudioPlayerStream or AudioCaptureStream).
+            audio_analyzer (AudioAnalyzer): Band energy computation.
+            tempo_tracker (StreamingTempoTracker): Fed one frame per analysis update; its frame
+                rate is set from the source's sample rate and the analysis mode.
+            num_bands (int): Bands per frame.
+            period_ms (float): How often the worker wakes up when not overlapped.
+            publisher (FramePublisher, optional): Streams frames to the lights.
+            hop_samples (int, optional): Overlapped mode: wake up every hop_samples samples and
+                analyse a window_samples window per hop (SlidingBandPlan). None analyses one
+                audiowindow_duration_ms window per period.
+            window_samples (int): Window length in overlapped mode.
+        """
+        self.audio_player = audio_player
+        self.audio_analyzer = audio_analyzer
+        self.tempo_tracker = tempo_tracker
+        self.publisher = publisher  # optional FramePublisher, streams frames to the lights
+        self.period_s = period_ms / 1000.0
+        self.hop_samples = hop_samples
+        self.window_samples = window_samples
+        self._next_index = None  # overlapped mode: first sample not yet pushed
+        self._requested_hop_samples = hop_samples  # set_overlapped, applied on the worker thread
+
+        # Settings written by the UI thread, read once per frame
+        self.low_pass_cutoff = 15000
+        self.ema_alpha = 0.75
+
+        self.frames = FrameRingBuffer(num_bands)
+        self.ema_buffer = [0 for _ in range(num_bands)]
+
+        # Frame-drop accounting
+        self.late_frames = 0        # deadlines missed because analysis took too long
+        self.analysis_time_s = 0.0  # duration of the last analysis step
+
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="AnalysisWorker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_overlapped(self, hop_samples):
+        """
+        Switch analysis mode from any thread; the worker applies it on its next wake-up.
+
+        Args:
+            hop_samples (int or None): Hop for overlapped mode, None for one window per period.
+        """
+        self._requested_hop_samples = hop_samples
+
+    def wake_period_s(self):
+        """Time between wake-ups: one hop in overlapped mode, period_ms otherwise."""
+        if self.hop_samples:
+            return self.hop_samples / self.audio_player.sample_rate
+        return self.period_s
+
+    def _run(self):
+        next_deadline = time.perf_counter()
+        while self._running:
+            started = time.perf_counter()
+            self.analyze_once()
+            self.analysis_time_s = time.perf_counter() - started
+
+            period_s = self.wake_period_s()
+            next_deadline += period_s
+            delay = next_deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Behind schedule: count the skipped periods and resync
+                missed = int(-delay // period_s) + 1
+                self.late_frames += missed
+                next_deadline += missed * period_s
+
+    def analyze_once(self):
+        """Analyse the current playback window and publish one frame (or one per hop when overlapped)."""
+        if self._requested_hop_samples != self.hop_samples:
+            self.hop_samples = self._requested_hop_samples
+            self._next_index = None
+
+        # The tempo tracker counts in frames: follow the source's rate (a loaded track or line-in)
+        if self.hop_samples:
+            self.tempo_tracker.set_frame_rate(self.audio_player.sample_rate / self.hop_samples)
+            self.analyze_hops()
+            return
+        self.tempo_tracker.set_frame_rate(1000.0 / self.audio_player.audiowindow_duration_ms)
+
+        samples = self.audio_player.get_latest_samples_window()
+        if samples is None or len(samples) == 0:
+            return
+
+        # A precomputed timeline (analyze_track.py) replaces the FFT while its cutoff matches the slider
+        bands = None
+        timeline = self.audio_player.timeline
+        if timeline is not None and timeline.low_pass_cutoff == self.low_pass_cutoff:
+            bands = timeline.frame_at(self.audio_player.current_position)
+        if bands is None:
+            bands = self.audio_analyzer.get_fft_band_energies(samples, self.audio_player.sample_rate,
+                                                              self.low_pass_cutoff)
+        self.publish_frame(bands, self.audio_player.current_position)
+
+    def analyze_hops(self):
+        """Overlapped mode: push the samples that arrived since the last call and publish one frame per hop."""
+        if not self.audio_player.is_loaded():
+            return
+        sample_rate = self.audio_player.sample_rate
+        plan = self.audio_analyzer.get_sliding_plan(sample_rate, self.low_pass_cutoff,
+                                                    self.window_samples, self.hop_samples)
+        samples, end_index = self.audio_player.get_samples_since(self._next_index, plan.max_new_samples)
+        self._next_index = end_index
+        hops = plan.push(samples)
+
+        # Frame i ends hops - 1 - i hops before the newest complete hop
+        samples_per_ms = sample_rate / 1000.0
+        last_end = end_index - plan.pending
+        for i in range(hops):
+            self.publish_frame(plan.energies[i], (last_end - (hops - 1 - i) * plan.hop) / samples_per_ms)
+
+    def publish_frame(self, bands, position_ms):
+        """Smooth, track tempo and publish one frame of band energies."""
+        self.ema_buffer = self.audio_analyzer.EMA(bands, self.ema_buffer, self.ema_alpha)
+        bpm, beat_phase = self.tempo_tracker.update(bands)
+
+        slot = self.frames.acquire()
+        slot.timestamp = time.perf_counter()
+        slot.position_ms = position_ms
+        slot.bands[:] = self.ema_buffer
+        slot.bpm = bpm
+        slot.beat_phase = beat_phase
+        slot.is_beat = self.tempo_tracker.is_beat
+        self.frames.publish(slot)
+
+        if self.publisher is not None:
+            self.publisher.publish(slot)
+
+    def stats(self):
+        """Counters for spotting when analysis or the UI falls behind."""
+        return {
+            "produced": self.frames.published,
+            "dropped_by_consumer": self.frames.dropped,
+            "late_frames": self.late_frames,
+            "last_analysis_ms": self.analysis_time_s * 1000,
+        }
@@ -0,0 +1,49 @@
+'''
+Offline analysis of a whole track for pre-show prep.
+
+Computes the (frames x bands) energy matrix in one batched STFT pass and writes it
+to an .npz file together with the settings needed to play it back in sync. Saved
+next to the track (the default output), the visualizer picks it up when the track
+is loaded and the analysis worker reads band energies from it instead of running
+an FFT per frame.
+
+Usage:
+    python analyze_track.py mp3files/set.mp3 --bands 8 --cutoff 15000
+    python analyze_track.py mp3files/set.mp3 set_energies.npz
+'''
+import argparse
+import os
+
+from audio_analysis import AudioAnalyzer
+from energy_timeline import EnergyTimeline, timeline_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute band energies for a track.")
+    parser.add_argument("input", help="audio file to analyse")
+    parser.add_argument("output", nargs="?", help="output .npz path (default: next to the track)")
+    parser.add_argument("--bands", type=int, default=8, help="number of logarithmic bands")
+    parser.add_argument("--cutoff", type=float, default=15000, help="low-pass cutoff in Hz")
+    parser.add_argument("--hop-ms", type=float, default=20, help="window/hop length in ms")
+    args = parser.parse_args()
+
+    # Imported here: audio_playback opens the mixer on import, which must see the SDL settings from __main__
+    from pydub import AudioSegment
+    from audio_playback import AudioPlayerStream
+
+    # Same decode (mono float32 mix) as playback, so the frames line up with what is heard
+    player = AudioPlayerStream()
+    player.decode_segment(AudioSegment.from_file(args.input))
+
+    analyzer = AudioAnalyzer(numbands=args.bands)
+    energies = analyzer.compute_band_energy_matrix(player.samples, player.sample_rate, args.cutoff, hop_ms=args.hop_ms)
+
+    output = args.output or timeline_path(args.input)
+    EnergyTimeline(energies, args.hop_ms, player.sample_rate, args.cutoff).save(output)
+    print(f"Wrote {energies.shape[0]} frames x {energies.shape[1]} bands to {output}")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    main()
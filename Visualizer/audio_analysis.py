@@ -1,6 +1,285 @@
 
 import numpy as np
-import librosa
+
+
+def bin_band_index(freqs, bands, low_pass_cutoff):
+    """
+    Band of every FFT bin; bins outside every band (or above the cutoff) get the
+    extra overflow slot len(bands).
+    """
+    num_bands = len(bands)
+    lows = np.array([low for low, _ in bands])
+    highs = np.array([high for _, high in bands])
+    band_index = np.searchsorted(highs, freqs, side="right")
+    outside = (band_index >= num_bands)
+    outside |= freqs < lows[np.minimum(band_index, num_bands - 1)]
+    if low_pass_cutoff is not None:
+        outside |= freqs > low_pass_cutoff
+    band_index[outside] = num_bands
+    return band_index
+
+
+def band_sum_matrix(band_index, num_bands):
+    """(bins x bands) 0/1 matrix, so magnitudes @ matrix gives per-band sums."""
+    matrix = np.zeros((len(band_index), num_bands + 1))
+    matrix[np.arange(len(band_index)), band_index] = 1.0
+    return matrix[:, :num_bands].copy()
+
+
+class BandEnergyPlan:
+    """
+    Precomputed state for turning one window of samples into band energies.
+
+    Holds the Hanning window, the rfft bin frequencies and a bin -> band index
+    for a fixed (window length, sample rate, low-pass cutoff, bands), so each
+    call is one windowed rfft plus a single bincount.
+    """
+
+    def __init__(self, window_length, sample_rate, low_pass_cutoff, bands):
+        self.window_length = window_length
+        self.sample_rate = sample_rate
+        self.low_pass_cutoff = low_pass_cutoff
+        self.num_bands = len(bands)
+
+        self.window = np.hanning(window_length).astype(np.float32)
+        self._windowed = np.empty(window_length, dtype=np.float32)
+
+        # Positive frequencies only (drop Nyquist, as the full FFT path did)
+        half_n = window_length // 2
+        self.freqs = np.fft.rfftfreq(window_length, d=1/sample_rate)[:half_n]
+        self._magnitudes = np.empty(half_n, dtype=np.float64)
+
+        band_index = bin_band_index(self.freqs, bands, low_pass_cutoff)
+        self.band_index = band_index
+
+        counts = np.bincount(band_index, minlength=self.num_bands + 1)[:self.num_bands]
+        self._inv_counts = np.divide(1.0, counts, out=np.zeros(self.num_bands), where=counts > 0)
+        self._band_matrix = None
+
+    def matches(self, window_length, sample_rate, low_pass_cutoff):
+        return (self.window_length == window_length
+                and self.sample_rate == sample_rate
+                and self.low_pass_cutoff == low_pass_cutoff)
+
+    def band_energies(self, samples):
+        """Mean log-magnitude per band for one window of samples."""
+        np.multiply(samples, self.window, out=self._windowed)
+        spectrum = np.fft.rfft(self._windowed)
+        magnitudes = self._magnitudes
+        np.abs(spectrum[:len(magnitudes)], out=magnitudes)
+        np.log1p(magnitudes, out=magnitudes)
+
+        sums = np.bincount(self.band_index, weights=magnitudes, minlength=self.num_bands + 1)
+        return sums[:self.num_bands] * self._inv_counts
+
+    def band_matrix(self):
+        """(bins x bands) averaging matrix, so spectra @ band_matrix gives per-band means."""
+        if self._band_matrix is None:
+            self._band_matrix = band_sum_matrix(self.band_index, self.num_bands) * self._inv_counts
+        return self._band_matrix
+
+    def band_energies_batch(self, frames):
+        """Band energies for a (frames x window_length) block of windows at once."""
+        spectra = np.fft.rfft(frames * self.window, axis=1)[:, :len(self.freqs)]
+        magnitudes = np.log1p(np.abs(spectra))
+        return magnitudes @ self.band_matrix()
+
+
+class SlidingBandPlan:
+    """
+    Overlapped band energies: a window_length window advanced every hop samples.
+
+    Only the low bands need the long window's frequency resolution, and there are
+    few bins below split_hz, so those bins are kept up to date with a sliding DFT:
+    each hop adds the samples that entered the window and removes the ones that left
+    it with one (hop x bins) vector-matrix product and a phase rotation, instead of a
+    full window_length FFT. The bins are recomputed exactly every resync_hops hops so
+    rounding errors cannot build up.
+
+    Bands above split_hz are wide enough for a short_length FFT of the samples ending
+    at each hop.
+
+    Both spectra share one row, so the Hann window (applied in the frequency domain,
+    X[k] - 0.5 (X[k-1] + X[k+1])), the magnitudes, log1p and the band means are a
+    handful of array operations per hop. Samples are scaled by
+    0.5 * reference_length / short_length on the way into the buffer (the long bins by
+    short_length / window_length on top), so band levels stay comparable with
+    BandEnergyPlan on 20 ms windows (for tonal content).
+
+    All buffers are allocated here. Every hop costs the same ten or so numpy calls
+    however many hops a push completes, so the CPU cost grows with the hop rate
+    (see benchmark_analysis.bench_sliding_bands).
+    """
+
+    MIN_SHORT_BINS = 4  # bands narrower than this many short-FFT bins use the long window
+    COMPACT_WINDOWS = 8  # sample buffer length in windows, beyond the one being analysed
+
+    def __init__(self, sample_rate, low_pass_cutoff, bands, window_length=4096, hop=256,
+                 short_length=512, reference_length=None, max_hops=64, resync_hops=1024):
+        if short_length > window_length:
+            raise ValueError("short_length must not exceed window_length")
+        if hop > short_length:
+            raise ValueError("hop must not exceed short_length")
+        self.sample_rate = sample_rate
+        self.low_pass_cutoff = low_pass_cutoff
+        self.window_length = window_length
+        self.hop = hop
+        self.short_length = short_length
+        self.num_bands = len(bands)
+        self.max_hops = max_hops
+        self.resync_hops = resync_hops
+        reference_length = reference_length or int(sample_rate * 0.02)
+        self._input_scale = 0.5 * reference_length / short_length
+
+        # Long-window bins for every band too narrow for the short FFT
+        short_bin_hz = sample_rate / short_length
+        self.split_hz = 0.0
+        for low, high in bands:
+            if high - low >= self.MIN_SHORT_BINS * short_bin_hz:
+                break
+            self.split_hz = high
+
+        long_freqs = np.fft.rfftfreq(window_length, d=1/sample_rate)
+        self.num_long = int(np.count_nonzero(long_freqs < self.split_hz))
+        long_index = bin_band_index(long_freqs[:self.num_long + 1], bands, low_pass_cutoff)
+        long_index[0] = self.num_bands   # DC: its Hann neighbour X[-1] is not tracked
+        long_index[-1] = self.num_bands  # only tracked as the Hann neighbour of the last bin
+
+        half = short_length // 2
+        short_freqs = np.fft.rfftfreq(short_length, d=1/sample_rate)
+        short_index = bin_band_index(short_freqs, bands, low_pass_cutoff)
+        short_index[short_freqs < self.split_hz] = self.num_bands
+        short_index[[0, half]] = self.num_bands  # no Hann neighbour beyond DC and Nyquist
+        in_band = np.flatnonzero(short_index < self.num_bands)
+        short_bins = int(in_band[-1]) + 1 if len(in_band) else 1
+
+        # Columns of the spectrum row: long bins 0..num_long, then short bins 0..half.
+        # Bands use columns 1..width-1, the last one being the highest short bin in a
+        # band; the other columns in that range (the two whose Hann neighbours lie in
+        # the other spectrum) get a zero row in _band_means.
+        short_column = self.num_long + 1
+        self.width = short_column + short_bins
+        band_index = np.concatenate([long_index, short_index[:short_bins]])[1:]
+        band_sums = band_sum_matrix(band_index, self.num_bands)
+        counts = band_sums.sum(axis=0)
+        self._band_means = band_sums * np.divide(1.0, counts, out=np.zeros(self.num_bands), where=counts > 0)
+
+        # Sliding DFT of bins 0..num_long (one extra for the Hann neighbour), relative to the
+        # window start s: X(s + H) = D X(s) + D sum_m (entering - leaving)[m] W^(k m), with
+        # W = e^(-2 pi i / N) and the rotation D = W^(-k H). Scaled by short_length / N.
+        bins = np.arange(self.num_long + 1)
+        scale = short_length / window_length
+        self._rotation = np.exp(2j * np.pi * bins * hop / window_length)
+        hop_dft = np.exp(-2j * np.pi * np.outer(np.arange(hop), bins) / window_length) * (self._rotation * scale)
+        # Real matrix with interleaved re/im rows, so real input needs no complex conversion
+        # (matrix @ vector with a contiguous matrix is the fastest product for these shapes)
+        self._hop_dft = np.ascontiguousarray(hop_dft.view(np.float64).reshape(hop, -1).T)
+        self._full_dft = np.exp(-2j * np.pi * np.outer(np.arange(window_length), bins) / window_length) * scale
+        self.hops_since_resync = 0
+
+        # Per-hop scratch. The long bins of _spectrum are the sliding DFT state itself;
+        # the short FFT overwrites the rest every hop.
+        self._spectrum = np.zeros(short_column + half + 1, dtype=np.complex128)
+        self._long = self._spectrum[:short_column]
+        self._short = self._spectrum[short_column:]
+        self._centre = self._spectrum[1:self.width]  # columns 1..width-1 and their Hann neighbours
+        self._left = self._spectrum[:self.width - 1]
+        self._right = self._spectrum[2:self.width + 1]
+        self._diff = np.empty(hop)
+        self._update = np.empty(short_column, dtype=np.complex128)
+        self._update_real = self._update.view(np.float64)
+        self._hann = np.zeros(self.width - 1, dtype=np.complex128)
+        self._mags = np.zeros(self.width - 1)
+        self.energies = np.zeros((max_hops, self.num_bands))
+
+        # Samples: _buffer[_start:_fill] is the current window followed by not-yet-hopped
+        # input. The window start advances a hop at a time and is only moved back to the
+        # front once it passes _compact_at, i.e. once every COMPACT_WINDOWS windows.
+        self._compact_at = window_length * self.COMPACT_WINDOWS
+        self._buffer = np.zeros(self._compact_at + window_length + (max_hops + 1) * hop)
+        self._start = 0
+        self._fill = window_length  # starts on a window of silence
+        self.max_new_samples = max_hops * hop
+        self.gaps = 0
+
+    def matches(self, sample_rate, low_pass_cutoff, window_length, hop):
+        return (self.sample_rate == sample_rate and self.low_pass_cutoff == low_pass_cutoff
+                and self.window_length == window_length and self.hop == hop)
+
+    @property
+    def pending(self):
+        """Samples pushed that do not make up a full hop yet."""
+        return self._fill - self._start - self.window_length
+
+    def push(self, samples):
+        """
+        Add new samples and compute band energies for every hop they complete.
+
+        Args:
+            samples (np.ndarray): Consecutive 1D samples following the previous push.
+
+        Returns:
+            int: Number of hops completed; their band energies are energies[:hops], oldest first.
+        """
+        n = len(samples)
+        if self.pending + n > self.max_new_samples:
+            # Fell more than max_hops behind: restart from the newest window
+            self.gaps += 1
+            keep = min(n, self.window_length)
+            self._buffer[:self.window_length - keep] = 0
+            np.multiply(samples[n - keep:], self._input_scale,
+                        out=self._buffer[self.window_length - keep:self.window_length])
+            self._start = 0
+            self._fill = self.window_length
+            self._resync()
+            return 0
+
+        np.multiply(samples, self._input_scale, out=self._buffer[self._fill:self._fill + n])
+        self._fill += n
+        hops = self.pending // self.hop
+        for i in range(hops):
+            self._advance(self.energies[i])
+        return hops
+
+    def _advance(self, energies):
+        """Slide the window by one hop and write its band energies into energies."""
+        N, H, s = self.window_length, self.hop, self._start
+        buffer = self._buffer
+
+        # Long bins: X <- D X + hop_dft @ (entering - leaving)
+        np.subtract(buffer[s + N:s + N + H], buffer[s:s + H], out=self._diff)
+        np.dot(self._hop_dft, self._diff, out=self._update_real)
+        self._long *= self._rotation
+        self._long += self._update
+        # Short bins: the short_length samples ending at the new hop
+        np.fft.rfft(buffer[s + N + H - self.short_length:s + N + H], out=self._short)
+
+        # Hann magnitudes, then mean log magnitude per band
+        hann = self._hann
+        np.add(self._left, self._right, out=hann)
+        hann *= -0.5
+        hann += self._centre
+        np.abs(hann, out=self._mags)
+        np.log1p(self._mags, out=self._mags)
+        np.matmul(self._mags, self._band_means, out=energies)
+
+        self._start = s + H
+        if self._start > self._compact_at:
+            # Move the window and leftover back to the front
+            length = self._fill - self._start
+            buffer[:length] = buffer[self._start:self._fill]
+            self._start = 0
+            self._fill = length
+
+        self.hops_since_resync += 1
+        if self.hops_since_resync >= self.resync_hops:
+            self._resync()
+
+    def _resync(self):
+        """Recompute the tracked bins exactly from the current window."""
+        np.matmul(self._buffer[self._start:self._start + self.window_length], self._full_dft, out=self._long)
+        self.hops_since_resync = 0
+
 
 class AudioAnalyzer:
 
@@ -14,6 +293,8 @@ class AudioAnalyzer:
     def __init__(self,numbands):
         self.numbands = numbands
         self.logarithmic_bands = self.calculate_logarithmic_bands(44100, numbands)
+        self._band_plan = None
+        self._sliding_plan = None
 
         print("Frequency Bands")
         print(self.logarithmic_bands)
@@ -81,6 +362,29 @@ class AudioAnalyzer:
     
 
 
+    def set_numbands(self, numbands):
+        """Change the number of logarithmic bands, invalidating the cached FFT plan."""
+        self.numbands = numbands
+        self.logarithmic_bands = self.calculate_logarithmic_bands(44100, numbands)
+        self._band_plan = None
+        self._sliding_plan = None
+
+    def get_band_plan(self, window_length, sample_rate, low_pass_cutoff):
+        """Return the cached BandEnergyPlan, rebuilding it only if its parameters changed."""
+        plan = self._band_plan
+        if plan is None or not plan.matches(window_length, sample_rate, low_pass_cutoff):
+            plan = BandEnergyPlan(window_length, sample_rate, low_pass_cutoff, self.logarithmic_bands)
+            self._band_plan = plan
+        return plan
+
+    def get_sliding_plan(self, sample_rate, low_pass_cutoff, window_length=4096, hop=256):
+        """Return the cached SlidingBandPlan, rebuilding it (and its history) only if its parameters changed."""
+        plan = self._sliding_plan
+        if plan is None or not plan.matches(sample_rate, low_pass_cutoff, window_length, hop):
+            plan = SlidingBandPlan(sample_rate, low_pass_cutoff, self.logarithmic_bands, window_length, hop)
+            self._sliding_plan = plan
+        return plan
+
     def get_fft_band_energies(self, samples, sample_rate, low_pass_cutoff):
         """
         Perform FFT on the input samples and return average magnitudes for
@@ -93,37 +397,43 @@ class AudioAnalyzer:
                                Frequencies above this value will be ignored.
 
         Returns:
-            list: Average magnitudes for each frequency band.
+            np.ndarray: Average magnitudes for each frequency band.
+        """
+        plan = self.get_band_plan(len(samples), sample_rate, low_pass_cutoff)
+        return plan.band_energies(samples)
+
+
+    def compute_band_energy_matrix(self, samples, sample_rate, low_pass_cutoff, hop_ms=20, block_frames=4096):
         """
-        bands = self.logarithmic_bands
+        Compute band energies for a whole track in one batched STFT pass.
 
-        # Perform FFT
-        samples = samples * np.hanning(len(samples))  # Apply a Hanning window
-        fft_result = np.fft.fft(samples)
-        magnitudes = np.abs(fft_result)
-        magnitudes = np.log1p(magnitudes)
-        freqs = np.fft.fftfreq(len(samples), d=1/sample_rate)
+        Uses the same windows as the realtime path: hop_ms long, non-overlapping,
+        starting at sample 0, so row i matches get_fft_band_energies on the window
+        starting at i * hop_ms.
 
-        # Use only the positive frequencies
-        half_n = len(samples) // 2
-        freqs = freqs[:half_n]
-        magnitudes = magnitudes[:half_n]
+        Args:
+            samples (np.ndarray): 1D array of the whole decoded track.
+            sample_rate (int): Sample rate of the audio in Hz.
+            low_pass_cutoff (float, optional): Frequencies above this are ignored.
+            hop_ms (float): Window and hop length in milliseconds.
+            block_frames (int): Windows transformed per FFT call, bounds peak memory.
 
-        # Apply low-pass filter if specified
-        if low_pass_cutoff is not None:
-            low_pass_mask = freqs <= low_pass_cutoff
-            freqs = freqs[low_pass_mask]
-            magnitudes = magnitudes[low_pass_mask]
+        Returns:
+            np.ndarray: (frames x bands) float32 energy matrix.
+        """
+        window_length = int(sample_rate * (hop_ms / 1000.0))
+        plan = self.get_band_plan(window_length, sample_rate, low_pass_cutoff)
 
-        # Compute average magnitudes for each band
-        band_energies = []
-        for low_freq, high_freq in bands:
-            band_mask = (freqs >= low_freq) & (freqs < high_freq)
-            avg_magnitude = np.mean(magnitudes[band_mask]) if np.any(band_mask) else 0
-            band_energies.append(avg_magnitude)
+        if len(samples) < window_length:
+            return np.zeros((0, self.numbands), dtype=np.float32)
 
-        return band_energies
+        frames = np.lib.stride_tricks.sliding_window_view(samples, window_length)[::window_length]
+        energies = np.empty((len(frames), self.numbands), dtype=np.float32)
+        for start in range(0, len(frames), block_frames):
+            block = frames[start:start + block_frames]
+            energies[start:start + len(block)] = plan.band_energies_batch(block)
 
+        return energies
 
     def EMA(self, newvals, emabuffer, alpha):
 
@@ -136,6 +446,7 @@ class AudioAnalyzer:
     def find_bpm_librosa(self, audiosamples, samplerate):
         """
         Estimate the BPM of an audio signal using librosa.
+        Live tracking uses StreamingTempoTracker; this is kept for offline verification.
 
         Args:
             audiosamples (np.ndarray): 1D array of audio samples.
@@ -146,5 +457,7 @@ class AudioAnalyzer:
         """
 
 
+        import librosa  # only needed for offline verification
+
         tempo, beat_frames = librosa.beat.beat_track(y=audiosamples, sr=samplerate)
         return tempo
@@ -0,0 +1,184 @@
+'''
+On-disk cache of decoded audio.
+
+Each track is stored as float32 .npy files next to a small JSON header. Entries are
+keyed by the source path, mtime and size, so editing or replacing a file
+invalidates its entry. Cached samples are opened with mmap, so a cache hit only
+maps the file and pages samples in as they are read.
+
+Several visualizer instances may share the cache directory: files can disappear
+under one instance while another evicts, and leftovers of an interrupted store
+are only swept once they are older than any store still in progress.
+'''
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "raveglow" / "decoded"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+STALE_AFTER_S = 600  # leftovers of an interrupted store older than this are swept
+
+
+class DecodedAudioCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def cache_key(self, file_path):
+        """Key for a source file, derived from its absolute path, mtime and size."""
+        stat = os.stat(file_path)
+        ident = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        return (self.cache_dir / f"{key}.json",
+                self.cache_dir / f"{key}.npy",
+                self.cache_dir / f"{key}.ch.npy")
+
+    def load(self, file_path, keep_channels=False):
+        """
+        Look up a decoded track.
+
+        Returns:
+            dict or None: header fields plus "samples" (mono memmap) and
+            "channel_samples" (memmap or None), or None on a miss.
+        """
+        header_path, mono_path, channels_path = self._paths(self.cache_key(file_path))
+        if not header_path.exists() or not mono_path.exists():
+            return None
+        if keep_channels and not channels_path.exists():
+            return None
+
+        try:
+            with open(header_path, "r") as f:
+                header = json.load(f)
+            header["samples"] = np.load(mono_path, mmap_mode="r")
+            header["channel_samples"] = np.load(channels_path, mmap_mode="r") if keep_channels else None
+        except (OSError, ValueError) as e:
+            print(f"[CACHE] Dropping unreadable entry for {file_path}: {e}")
+            self._remove(header_path, mono_path, channels_path)
+            return None
+
+        os.utime(header_path)  # mark as recently used
+        return header
+
+    def store(self, file_path, samples, sample_rate, num_channels, channel_samples=None):
+        """
+        Write a decoded track to the cache, then evict old entries if over budget.
+
+        A track that alone exceeds max_bytes is not cached: it would be the first
+        entry evicted and would flush every other track on the way.
+
+        Returns:
+            bool: True if the track was written.
+        """
+        size = np.asarray(samples).size * 4
+        if channel_samples is not None:
+            size += np.asarray(channel_samples).size * 4
+        if size > self.max_bytes:
+            print(f"[CACHE] Not caching {file_path}: {size} bytes is over the {self.max_bytes} byte budget")
+            return False
+
+        key = self.cache_key(file_path)
+        header_path, mono_path, channels_path = self._paths(key)
+
+        self._write_npy(mono_path, samples)
+        if channel_samples is not None:
+            self._write_npy(channels_path, channel_samples)
+
+        header = {
+            "source": os.path.abspath(file_path),
+            "sample_rate": sample_rate,
+            "num_channels": num_channels,
+            "num_frames": len(samples),
+        }
+        tmp_path = header_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, header_path)
+
+        self.evict(keep=key)
+        return True
+
+    def _write_npy(self, path, array):
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    def _remove(self, *paths):
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[CACHE] Could not delete {path}: {e}")
+
+    @staticmethod
+    def _stat(path):
+        """os.stat_result, or None if the file is gone (e.g. evicted by another instance)."""
+        try:
+            return path.stat()
+        except FileNotFoundError:
+            return None
+
+    def entries(self):
+        """List of (last_used, total_bytes, key) for every cached track."""
+        result = []
+        for header_path in self.cache_dir.glob("*.json"):
+            key = header_path.stem
+            header_stat = self._stat(header_path)
+            if header_stat is None:
+                continue
+            stats = [self._stat(p) for p in self._paths(key)[1:]]
+            size = header_stat.st_size + sum(st.st_size for st in stats if st is not None)
+            result.append((header_stat.st_mtime, size, key))
+        return result
+
+    def orphans(self, stale_after_s=STALE_AFTER_S):
+        """
+        Leftovers of interrupted stores: sample files with no JSON header and
+        .tmp files. Only files older than stale_after_s are listed, so a store
+        still running in another instance keeps its files.
+        """
+        indexed = {header_path.stem for header_path in self.cache_dir.glob("*.json")}
+        candidates = [path for path in self.cache_dir.glob("*.npy") if path.name.split(".")[0] not in indexed]
+        candidates += self.cache_dir.glob("*.tmp")
+        cutoff = time.time() - stale_after_s
+        result = []
+        for path in candidates:
+            stat = self._stat(path)
+            if stat is not None and stat.st_mtime < cutoff:
+                result.append(path)
+        return result
+
+    def evict(self, keep=None):
+        """
+        Delete stale leftovers, then least recently used entries until the cache fits in max_bytes.
+
+        Args:
+            keep (str, optional): Key that is never evicted, e.g. the track just stored.
+        """
+        self._remove(*self.orphans())
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._remove(*self._paths(key))
+            total -= size
+
+    def clear(self):
+        """Delete every cached track."""
+        for _, _, key in self.entries():
+            self._remove(*self._paths(key))
+        self._remove(*self.orphans(stale_after_s=0))
@@ -0,0 +1,328 @@
+'''
+Live line-in / microphone capture for analysing the DJ mixer feed.
+
+AudioCaptureStream is a drop-in audio source for AnalysisWorker: it has the same
+window API as AudioPlayerStream (sample_rate, window_size, current_position,
+is_loaded, get_latest_samples_window), but its samples come from an audio input
+callback instead of a decoded file.
+
+The callback downmixes each block straight into SampleRingBuffer, a preallocated
+single-producer / single-consumer ring. Nothing is allocated per callback and no
+lock is taken: the producer announces the block it is about to overwrite
+(`writing_to`), writes the samples and only then advances `written`; the reader
+copies the newest window and checks `writing_to` afterwards, so a window the
+producer lapped during the copy is detected, counted as an overrun and re-read.
+
+Samples are kept on the int16 scale, like the decoded files, so thresholds and the
+visualizer's full scale work the same for live input.
+
+sounddevice is optional; it is only needed for real hardware. WavInputStream is a
+fake input device that replays a WAV at real-time pace through the same callback,
+for testing without hardware (see measure_capture_latency.py).
+'''
+import threading
+import time
+import wave
+
+import numpy as np
+
+try:
+    import sounddevice
+except ImportError:  # only needed for real input devices
+    sounddevice = None
+
+
+class SampleRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.written = 0     # samples written so far (producer side)
+        self.writing_to = 0  # end of the block being written; samples below it may be in flux
+        self.overruns = 0    # reads that were lapped by the producer and retried
+
+    def write(self, block):
+        """
+        Producer: downmix a (frames, channels) block into the ring.
+
+        Args:
+            block (np.ndarray): Interleaved input block, as given to the audio callback.
+        """
+        frames = len(block)
+        if frames > self.capacity:
+            block = block[-self.capacity:]
+            frames = self.capacity
+        self.writing_to = self.written + frames  # announce before touching the samples
+        start = self.written % self.capacity
+        first = min(frames, self.capacity - start)
+        self._downmix(block[:first], self.data[start:start + first])
+        if first < frames:
+            self._downmix(block[first:], self.data[:frames - first])
+        self.written = self.writing_to  # publish only after the samples are in place
+
+    @staticmethod
+    def _downmix(block, out):
+        if block.shape[1] == 1:
+            out[:] = block[:, 0]
+        else:
+            np.mean(block, axis=1, dtype=np.float32, out=out)
+
+    def _copy(self, start, out):
+        """Copy samples [start, start + len(out)) into out; False if the producer lapped them."""
+        n = len(out)
+        pad = min(n, max(0, -start))  # before the first sample: silence
+        out[:pad] = 0
+        start += pad
+        available = n - pad
+        offset = start % self.capacity
+        first = min(available, self.capacity - offset)
+        out[pad:pad + first] = self.data[offset:offset + first]
+        out[pad + first:] = self.data[:available - first]
+        return self.writing_to - start <= self.capacity
+
+    def read_latest(self, out):
+        """
+        Consumer: copy the newest len(out) samples into out (zero padded at start-up).
+
+        Returns:
+            int: Value of `written` the window ends at.
+        """
+        while True:
+            end = self.written
+            if self._copy(end - len(out), out):
+                return end  # the producer has not reached any of the copied samples
+            self.overruns += 1
+
+    def read_range(self, start, out):
+        """
+        Consumer: copy the already written samples [start, start + len(out)) into out.
+
+        Returns:
+            bool: False (and counted as an overrun) if the producer overwrote them first.
+        """
+        if self._copy(start, out):
+            return True
+        self.overruns += 1
+        return False
+
+
+class AudioCaptureStream:
+    def __init__(self, device=None, sample_rate=44100, channels=2, blocksize=256, buffer_seconds=2.0, wav_file=None):
+        """
+        Args:
+            device: sounddevice input device (index or name substring), None for the default.
+            sample_rate (int): Capture rate; a wav_file uses its own rate.
+            channels (int): Input channels, downmixed to mono; a wav_file uses its own count.
+            blocksize (int): Frames per callback. Smaller blocks mean lower latency.
+            buffer_seconds (float): Ring buffer length.
+            wav_file (str, optional): Replay this WAV through WavInputStream instead of a real device.
+        """
+        self.device = device
+        self.blocksize = blocksize
+        self.wav_file = wav_file
+        if wav_file is not None:
+            with wave.open(wav_file, "rb") as wav:
+                sample_rate, channels = wav.getframerate(), wav.getnchannels()
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples_per_ms = sample_rate / 1000.0
+        self.audiowindow_duration_ms = 20
+        self.window_size = int(self.samples_per_ms * self.audiowindow_duration_ms)
+        self.current_position = 0  # ms of captured audio at the end of the last window
+        self.timeline = None  # live input has no precomputed EnergyTimeline
+
+        self.ring = SampleRingBuffer(int(sample_rate * buffer_seconds))
+        self._window = np.zeros(self.window_size, dtype=np.float32)  # reused by every read
+        self._new_samples = np.zeros(self.ring.capacity // 2, dtype=np.float32)  # for get_samples_since
+
+        # Capture timing: perf_counter time at which the newest sample reached the input
+        self.last_capture_time = None
+        self._time_offset = None  # stream clock -> perf_counter
+
+        self.callbacks = 0
+        self.input_overflows = 0  # blocks the driver reported as lost
+        self.stream = None
+
+    def start(self):
+        if self.stream is not None:
+            return
+        if self.wav_file is not None:
+            self.stream = WavInputStream(self.wav_file, self._callback, blocksize=self.blocksize)
+        elif sounddevice is None:
+            raise RuntimeError("sounddevice is not installed (pip install sounddevice), or pass wav_file")
+        else:
+            self.stream = sounddevice.InputStream(device=self.device, samplerate=self.sample_rate,
+                                                  channels=self.channels, dtype="int16",
+                                                  blocksize=self.blocksize, callback=self._callback)
+        self.stream.start()
+        print(f"[CAPTURE] {self.wav_file or self.device or 'default input'}: {self.sample_rate} Hz, "
+              f"{self.channels} ch, {self.blocksize} frames/block")
+
+    def stop(self):
+        if self.stream is None:
+            return
+        self.stream.stop()
+        self.stream.close()
+        self.stream = None
+        print(f"[CAPTURE] {self.stats()}")
+
+    def _callback(self, indata, frames, time_info, status):
+        """Audio thread: runs once per block, must not allocate or block."""
+        if status:
+            self.input_overflows += 1
+        self.ring.write(indata)
+        if self._time_offset is None:
+            self._time_offset = time.perf_counter() - time_info.currentTime
+        # inputBufferAdcTime is when the first frame of the block was captured
+        self.last_capture_time = time_info.inputBufferAdcTime + self._time_offset + frames / self.sample_rate
+        self.callbacks += 1
+
+    def is_loaded(self):
+        """True once capture is running."""
+        return self.stream is not None
+
+    def capture_time(self, position_ms):
+        """perf_counter time at which the sample at a captured position (ms) reached the input."""
+        if self.last_capture_time is None:
+            return None
+        newest_ms = self.ring.written / self.samples_per_ms
+        return self.last_capture_time - (newest_ms - position_ms) / 1000.0
+
+    def get_latest_samples_window(self):
+        """
+        Get the newest window_size captured samples.
+
+        Returns:
+            np.ndarray: A buffer reused on every call, valid until the next call. None if not capturing.
+        """
+        if not self.is_loaded():
+            return None
+        end = self.ring.read_latest(self._window)
+        self.current_position = end / self.samples_per_ms
+        return self._window
+
+    def get_samples_since(self, start_index, max_samples):
+        """
+        Captured samples from start_index up to the newest one, for incremental analysis.
+
+        Args:
+            start_index (int or None): End index of the previous call, None to start fresh.
+            max_samples (int): If more than this is pending, only the newest max_samples are returned.
+
+        Returns:
+            tuple: (samples, end_index). samples is a buffer reused on every call.
+        """
+        max_samples = min(max_samples, len(self._new_samples))
+        while True:
+            end = self.ring.written
+            if start_index is None or not 0 <= end - start_index <= max_samples:
+                start_index = max(0, end - max_samples)
+            out = self._new_samples[:end - start_index]
+            if self.ring.read_range(start_index, out):
+                break
+            start_index = None  # lapped: skip ahead to the newest samples
+        self.current_position = end / self.samples_per_ms
+        return out, end
+
+    def get_last_x_seconds(self, seconds):
+        """Copy of the last X seconds of captured audio (up to the ring length)."""
+        out = np.empty(min(int(seconds * self.sample_rate), self.ring.capacity), dtype=np.float32)
+        self.ring.read_latest(out)
+        return out
+
+    def stats(self):
+        return {
+            "callbacks": self.callbacks,
+            "captured_s": round(self.ring.written / self.sample_rate, 2),
+            "input_overflows": self.input_overflows,
+            "ring_overruns": self.ring.overruns,
+        }
+
+
+class _TimeInfo:
+    """Stand-in for the time struct sounddevice passes to callbacks (perf_counter timebase)."""
+
+    def __init__(self):
+        self.inputBufferAdcTime = 0.0
+        self.currentTime = 0.0
+
+
+class WavInputStream:
+    """
+    Fake input device: replays a WAV file at real-time pace through a sounddevice-style
+    callback(indata, frames, time_info, status), looping at the end.
+    """
+
+    def __init__(self, wav_file, callback, blocksize=256, loop=True):
+        with wave.open(wav_file, "rb") as wav:
+            self.sample_rate = wav.getframerate()
+            self.channels = wav.getnchannels()
+            width = wav.getsampwidth()
+            raw = wav.readframes(wav.getnframes())
+        self.frames = self._to_int16(raw, width).reshape(-1, self.channels)
+        self.callback = callback
+        self.blocksize = blocksize
+        self.loop = loop
+
+        self._wrap_block = np.empty((blocksize, self.channels), dtype=np.int16)  # block crossing the loop point
+        self._time_info = _TimeInfo()
+        self._running = False
+        self._thread = None
+
+    @staticmethod
+    def _to_int16(raw, width):
+        """Decode PCM once at load time, on the int16 scale the real stream is opened with."""
+        if width == 2:
+            return np.frombuffer(raw, dtype="<i2")
+        if width == 1:
+            return ((np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128) << 8)
+        if width == 3:
+            bytes3 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+            return (bytes3[:, 2].astype(np.int8).astype(np.int16) << 8) | bytes3[:, 1]
+        if width == 4:
+            return (np.frombuffer(raw, dtype="<i4") >> 16).astype(np.int16)
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="WavInputStream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+
+    def _run(self):
+        total = len(self.frames)
+        block_s = self.blocksize / self.sample_rate
+        position = 0
+        started = time.perf_counter()
+        block_index = 0
+        while self._running:
+            # Like a sound card, a block is delivered once its last frame has been captured
+            block_index += 1
+            due = started + block_index * block_s
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            end = position + self.blocksize
+            if end <= total:
+                block = self.frames[position:end]
+            elif self.loop:
+                head = total - position
+                self._wrap_block[:head] = self.frames[position:]
+                self._wrap_block[head:] = self.frames[:self.blocksize - head]
+                block = self._wrap_block
+            else:
+                return
+            position = end % total if self.loop else end
+
+            self._time_info.currentTime = time.perf_counter()
+            self._time_info.inputBufferAdcTime = due - block_s
+            self.callback(block, self.blocksize, self._time_info, None)
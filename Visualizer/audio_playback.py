@@ -1,9 +1,11 @@
 import pygame
 from pydub import AudioSegment
 import numpy as np
+import time
 from typing import Tuple
 from collections import deque
-import librosa
+
+from playback_clock import PlaybackClock
 
 
 
@@ -12,11 +14,15 @@ import librosa
 pygame.mixer.init()
 
 class AudioPlayerStream:
-    def __init__(self, sample_rate=44100, chunk_size=1024):
+    def __init__(self, sample_rate=44100, chunk_size=1024, cache=None, output_latency_ms=0.0):
         # Playback state
         self.current_file = None
-        self.current_position = 0
-        self.audio_segment = None
+        self.current_position = 0  # ms, audible position of the last window/pause
+
+        # Shared timebase for analysis and LED output, corrected against the mixer
+        self.clock = PlaybackClock(output_latency_ms=output_latency_ms)
+        self.mixer_sync_interval_s = 0.25
+        self._last_mixer_sync = 0.0
 
         # Audio Settings
         self.sample_rate = 44100
@@ -29,34 +35,123 @@ class AudioPlayerStream:
         #Storing audio info
         self.raw_samples = []
 
+        # Decoded track, filled once by load_audio
+        self.samples = np.zeros(0, dtype=np.float32)   # mono mix
+        self.channel_samples = None                      # (channels, frames), only if requested
+        self.num_channels = 0
+        self.window_size = int(self.samples_per_ms * self.audiowindow_duration_ms)
+        self._silence = np.zeros(self.window_size, dtype=np.float32)
+
+        # Optional DecodedAudioCache, skips the pydub decode on reloads
+        self.cache = cache
+
+        # Optional EnergyTimeline (energy_timeline.py) for the loaded track, set by the loader
+        self.timeline = None
+
     
 
     # --- Playback Methods ---
-    def load_audio(self, file_path):
-        """Load an audio file for playback and waveform access."""
+    def load_audio(self, file_path, keep_channels=False):
+        """
+        Load an audio file for playback and decode it once into NumPy buffers.
+
+        Args:
+            file_path (str): Path of the audio file.
+            keep_channels (bool): Also keep a per-channel buffer in channel_samples.
+        """
         self.current_file = file_path
+        self.timeline = None
         pygame.mixer.music.load(file_path)
-        self.audio_segment = AudioSegment.from_file(file_path)
+
+        if self.cache is not None:
+            cached = self.cache.load(file_path, keep_channels)
+            if cached is not None:
+                self._set_sample_rate(cached["sample_rate"])
+                self.num_channels = cached["num_channels"]
+                self.samples = cached["samples"]
+                self.channel_samples = cached["channel_samples"]
+                return
+
+        audio_segment = AudioSegment.from_file(file_path)
+        self.decode_segment(audio_segment, keep_channels)
+
+        if self.cache is not None:
+            self.cache.store(file_path, self.samples, self.sample_rate, self.num_channels, self.channel_samples)
+
+    def decode_segment(self, audio_segment, keep_channels=False):
+        """Copy an AudioSegment into preallocated float32 sample buffers."""
+        raw = audio_segment.get_array_of_samples()
+        interleaved = np.frombuffer(raw, dtype=raw.typecode)  # no copy
+        channels = audio_segment.channels
+        frames = interleaved.reshape((-1, channels))
+
+        self._set_sample_rate(audio_segment.frame_rate)
+        self.num_channels = channels
+
+        self.samples = np.empty(len(frames), dtype=np.float32)
+        if channels == 1:
+            self.samples[:] = frames[:, 0]
+        else:
+            np.mean(frames, axis=1, dtype=np.float32, out=self.samples)
+
+        if keep_channels:
+            # channel-major so each channel window is a contiguous view
+            self.channel_samples = np.empty((channels, len(frames)), dtype=np.float32)
+            self.channel_samples[:] = frames.T
+        else:
+            self.channel_samples = None
+
+    def _set_sample_rate(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.samples_per_ms = self.sample_rate / 1000.0
+        self.window_size = int(self.samples_per_ms * self.audiowindow_duration_ms)
+        self._silence = np.zeros(self.window_size, dtype=np.float32)
+
+    def is_loaded(self):
+        """True once a track has been decoded."""
+        return self.current_file is not None and len(self.samples) > 0
 
     def start_playing(self):
         """Start playback from the current position."""
         if self.current_file:
             pygame.mixer.music.play()
+            self.clock.start(0.0)
 
     def resume(self):
         """Resume playback from the last saved position."""
         pygame.mixer.music.unpause() 
+        self.clock.resume()
 
     def pause(self):
         """Pause playback and save current position."""
-        self.current_position = pygame.mixer.music.get_pos() / 1000.0
         pygame.mixer.music.pause()
+        self.clock.pause()
+        self.current_position = self.clock.position_ms()
 
     def stop(self):
         """Stop playback and reset position."""
         pygame.mixer.music.stop()
+        self.clock.stop()
         self.current_position = 0
 
+    def seek(self, seconds):
+        """Jump to a position in the track, keeping play/pause state."""
+        if not self.current_file:
+            return
+        paused = not self.clock.running
+        pygame.mixer.music.play(start=seconds)
+        if paused:
+            pygame.mixer.music.pause()
+        self.clock.seek(seconds * 1000.0)
+        self.current_position = self.clock.position_ms()
+
+    def sync_clock(self):
+        """Feed a mixer position sample to the clock, at most every mixer_sync_interval_s."""
+        now = time.perf_counter()
+        if now - self._last_mixer_sync >= self.mixer_sync_interval_s:
+            self._last_mixer_sync = now
+            self.clock.observe_mixer(pygame.mixer.music.get_pos())
+
     def extract_waveform_data(self,audio_segment):
         """Extract waveform data from the loaded audio file."""
         if audio_segment is None:
@@ -70,57 +165,72 @@ class AudioPlayerStream:
     
     def get_playback_position(self):
         """Get the current playback position in seconds."""
-        return pygame.mixer.music.get_pos() / 1000.0 if self.current_file else 0
+        return self.clock.position_ms() / 1000.0 if self.current_file else 0
 
 
-    def get_latest_samples_window(self, audio_segment, sample_rate):
-        """Get the latest window of raw audio samples (in sync with music playback)."""
-        if self.current_file is None or audio_segment is None:
-            return None
+    def ms_to_index(self, position_ms):
+        """Convert a playback position in milliseconds to a sample index."""
+        return int(position_ms * self.samples_per_ms)
 
-        windowduration_ms = self.audiowindow_duration_ms # how many milliseconds of audio to grab
+    def get_samples_window(self, start_index, num_samples, channel=None):
+        """
+        Return a view of num_samples decoded samples starting at start_index.
 
-        # Get current position from pygame in milliseconds
-        self.current_position = pygame.mixer.music.get_pos()
+        Args:
+            start_index (int): First sample of the window.
+            num_samples (int): Window length in samples.
+            channel (int, optional): Channel to read from channel_samples instead of the mono mix.
 
-        # Compute start and end times in milliseconds
-        start_time_ms = self.current_position
-        end_time_ms = self.current_position + windowduration_ms
+        Returns:
+            np.ndarray: View into the decoded buffer (not a copy), clipped to the
+            end of the track. Empty if start_index is past the end.
+        """
+        source = self.samples if channel is None else self.channel_samples[channel]
+        start_index = max(0, start_index)
+        return source[start_index:start_index + num_samples]
 
-        # Clip to available range
-        if end_time_ms > len(audio_segment):
-            end_time_ms = len(audio_segment)
-        if start_time_ms >= end_time_ms:
-            return np.zeros(int((windowduration_ms / 1000.0) * sample_rate))  # silence fallback
+    def get_latest_samples_window(self):
+        """Get the latest window of raw audio samples (in sync with music playback)."""
+        if not self.is_loaded():
+            return None
 
-        # Extract the audio segment for the window
-        window_segment = audio_segment[start_time_ms:end_time_ms]
+        # Audible position from the shared playback clock, in milliseconds
+        self.sync_clock()
+        self.current_position = self.clock.position_ms()
 
-        # Convert the audio segment to raw samples
-        samples = np.array(window_segment.get_array_of_samples())
-        if audio_segment.channels == 2:
-            samples = samples.reshape((-1, 2)).mean(axis=1)
+        window = self.get_samples_window(self.ms_to_index(self.current_position), self.window_size)
+        if len(window) == 0:
+            return self._silence  # silence fallback
 
-        return samples
+        return window
     
+    def get_samples_since(self, start_index, max_samples):
+        """
+        Decoded samples from start_index up to the audible position, for incremental analysis.
+
+        Args:
+            start_index (int or None): End index of the previous call, None to start fresh.
+            max_samples (int): After a seek (or a stall) only the newest max_samples are returned.
+
+        Returns:
+            tuple: (samples, end_index). samples is a view into the decoded buffer.
+        """
+        self.sync_clock()
+        self.current_position = self.clock.position_ms()
+        end = min(self.ms_to_index(self.current_position), len(self.samples))
+        if start_index is None or not 0 <= end - start_index <= max_samples:
+            start_index = max(0, end - max_samples)
+        return self.samples[start_index:end], end
+
     def get_last_x_seconds(self, seconds):
         """Get the last X seconds of audio samples."""
-        if self.current_file is None or self.audio_segment is None:
+        if not self.is_loaded():
             return None
 
-        total_length_ms = len(self.audio_segment)
-        start_time_ms = max(0, total_length_ms - (seconds * 1000))
-        end_time_ms = total_length_ms
-
-        # Extract the audio segment for the last X seconds
-        segment = self.audio_segment[start_time_ms:end_time_ms]
-
-        # Convert the audio segment to raw samples
-        samples = np.array(segment.get_array_of_samples())
-        if segment.channels == 2:
-            samples = samples.reshape((-1, 2)).mean(axis=1)
+        num_samples = int(seconds * self.sample_rate)
+        start_index = max(0, len(self.samples) - num_samples)
 
-        return samples 
+        return self.get_samples_window(start_index, num_samples)
 
 
     def def_addblank_startpadding(self,data, samplerate, seconds):
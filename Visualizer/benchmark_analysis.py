@@ -0,0 +1,343 @@
+'''
+Benchmark for the audio analysis hot path.
+
+Runs headless on synthetic signals (sine sweep, pink noise, click track at a known
+BPM) and times AudioAnalyzer.get_fft_band_energies, the overlapped
+SlidingBandPlan (against a full FFT per hop), EMA, downsample_data,
+split_into_ms_chunks and AudioPlayerStream.get_latest_samples_window across
+window sizes and band counts. For every case it reports the per-call latency
+distribution, the memory allocated per call (tracemalloc peak) and the frame-rate
+headroom against the window length, which is also the analysis period.
+
+Results are written as JSON; pass a previous file with --compare to see the
+change in p50 latency per case between commits.
+
+Usage:
+    python benchmark_analysis.py --output bench.json
+    python benchmark_analysis.py --quick --compare bench.json
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")  # no audio device needed for the player
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from audio_analysis import AudioAnalyzer, BandEnergyPlan, SlidingBandPlan
+
+
+SAMPLE_RATE = 44100
+SIGNAL_SECONDS = 10
+CLICK_BPM = 128
+WINDOW_SIZES_MS = (10, 20, 46)
+BAND_COUNTS = (8, 16, 32)
+
+
+### Synthetic signals ###
+
+def sine_sweep(seconds=SIGNAL_SECONDS, sample_rate=SAMPLE_RATE, f_start=20.0, f_end=20000.0):
+    """Exponential sine sweep across the audible range."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    k = np.log(f_end / f_start) / seconds
+    phase = 2 * np.pi * f_start * (np.exp(k * t) - 1) / k
+    return (0.5 * np.sin(phase) * 32767).astype(np.float32)
+
+
+def pink_noise(seconds=SIGNAL_SECONDS, sample_rate=SAMPLE_RATE, seed=0):
+    """1/f noise: white noise shaped in the frequency domain."""
+    n = int(seconds * sample_rate)
+    rng = np.random.default_rng(seed)
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    freqs = np.fft.rfftfreq(n, d=1 / sample_rate)
+    spectrum[1:] /= np.sqrt(freqs[1:])
+    spectrum[0] = 0
+    noise = np.fft.irfft(spectrum, n)
+    return (noise / np.abs(noise).max() * 0.5 * 32767).astype(np.float32)
+
+
+def click_track(seconds=SIGNAL_SECONDS, sample_rate=SAMPLE_RATE, bpm=CLICK_BPM):
+    """Decaying 60 Hz kick on every beat, plus a quiet hat on the off-beats."""
+    n = int(seconds * sample_rate)
+    signal = np.zeros(n, dtype=np.float32)
+    click_len = int(0.08 * sample_rate)
+    t = np.arange(click_len) / sample_rate
+    kick = np.sin(2 * np.pi * 60 * t) * np.exp(-t * 40)
+    hat = np.random.default_rng(1).standard_normal(click_len) * np.exp(-t * 200) * 0.2
+    beat = 60.0 / bpm * sample_rate
+    for i in range(int(n / beat)):
+        for start, click in ((int(i * beat), kick), (int((i + 0.5) * beat), hat)):
+            end = min(n, start + click_len)
+            signal[start:end] += click[:end - start]
+    return (signal * 0.5 * 32767).astype(np.float32)
+
+
+SIGNALS = {"sine_sweep": sine_sweep, "pink_noise": pink_noise, "click_track": click_track}
+
+
+### Measurement ###
+
+def measure(fn, iterations, warmup=20):
+    """
+    Time fn() per call, then measure its allocations in a separate traced pass
+    (tracemalloc slows calls down, so it never overlaps the timing).
+
+    Returns:
+        dict: Latency percentiles in microseconds and mean peak bytes allocated per call.
+    """
+    for _ in range(warmup):
+        fn()
+
+    durations = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        durations[i] = time.perf_counter_ns() - start
+    durations /= 1000.0
+
+    traced_calls = min(iterations, 200)
+    peaks = np.empty(traced_calls)
+    tracemalloc.start()
+    for i in range(traced_calls):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        peaks[i] = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "mean_us": round(float(durations.mean()), 3),
+        "p50_us": round(float(np.percentile(durations, 50)), 3),
+        "p90_us": round(float(np.percentile(durations, 90)), 3),
+        "p99_us": round(float(np.percentile(durations, 99)), 3),
+        "max_us": round(float(durations.max()), 3),
+        "alloc_bytes_per_call": int(peaks.mean()),
+    }
+
+
+def with_headroom(result, period_ms):
+    """Add how many times over the analysis period budget the p99 call fits, and CPU per second of audio."""
+    result["period_ms"] = period_ms
+    result["cpu_ms_per_audio_s"] = round(result["mean_us"] / period_ms, 3)
+    result["max_fps"] = round(1e6 / result["mean_us"], 1) if result["mean_us"] else None
+    result["headroom_x"] = round(period_ms * 1000 / result["p99_us"], 1) if result["p99_us"] else None
+    return result
+
+
+class WindowCycler:
+    """Hands out successive windows of a signal, like playback advancing."""
+
+    def __init__(self, signal, window_length):
+        self.windows = np.lib.stride_tricks.sliding_window_view(signal, window_length)[::window_length]
+        self.index = 0
+
+    def next(self):
+        window = self.windows[self.index]
+        self.index = (self.index + 1) % len(self.windows)
+        return window
+
+
+### Cases ###
+
+def bench_band_energies(signals, iterations, window_sizes, band_counts):
+    results = []
+    for bands in band_counts:
+        analyzer = AudioAnalyzer(bands)
+        for window_ms in window_sizes:
+            window_length = int(SAMPLE_RATE * window_ms / 1000)
+            for signal_name, signal in signals.items():
+                windows = WindowCycler(signal, window_length)
+                result = measure(lambda: analyzer.get_fft_band_energies(windows.next(), SAMPLE_RATE, 15000), iterations)
+                result.update(case="get_fft_band_energies", signal=signal_name, window_ms=window_ms, bands=bands)
+                results.append(with_headroom(result, window_ms))
+    return results
+
+
+def bench_sliding_bands(signals, iterations, band_counts, window_length=4096, hop=256):
+    """
+    Overlapped analysis: SlidingBandPlan.push of one hop, as the worker pushes it on
+    every wake-up, against a full window_length FFT for every hop. Compare its
+    cpu_ms_per_audio_s with get_fft_band_energies at 20 ms for the cost of the mode.
+    """
+    results = []
+    signal = signals["pink_noise"]
+    for bands in band_counts:
+        analyzer = AudioAnalyzer(bands)
+        plan = SlidingBandPlan(SAMPLE_RATE, 15000, analyzer.logarithmic_bands, window_length, hop)
+        chunks = WindowCycler(signal, hop)
+        result = measure(lambda: plan.push(chunks.next()), iterations)
+        result.update(case="sliding_band_energies", signal="pink_noise", bands=bands, window=window_length, hop=hop)
+        results.append(with_headroom(result, hop / SAMPLE_RATE * 1000))
+
+        full = BandEnergyPlan(window_length, SAMPLE_RATE, 15000, analyzer.logarithmic_bands)
+        windows = np.lib.stride_tricks.sliding_window_view(signal, window_length)[::hop]
+        index = [0]
+
+        def next_window():
+            index[0] = (index[0] + 1) % len(windows)
+            return full.band_energies(windows[index[0]])
+
+        result = measure(next_window, iterations)
+        result.update(case="full_fft_per_hop", signal="pink_noise", bands=bands, window=window_length, hop=hop)
+        results.append(with_headroom(result, hop / SAMPLE_RATE * 1000))
+    return results
+
+
+def bench_ema(iterations, band_counts):
+    results = []
+    analyzer = AudioAnalyzer(band_counts[0])
+    rng = np.random.default_rng(2)
+    for bands in band_counts:
+        values = rng.random(bands)
+        buffer = [0.0] * bands
+        result = measure(lambda: analyzer.EMA(values, buffer, 0.75), iterations)
+        result.update(case="EMA", bands=bands)
+        results.append(result)
+    return results
+
+
+def bench_waveform(signals, iterations):
+    """Whole-signal helpers used when drawing the waveform, so far fewer iterations."""
+    results = []
+    analyzer = AudioAnalyzer(8)
+    signal = signals["pink_noise"]
+    for bar_ms in (5, 20, 100):
+        result = measure(lambda: analyzer.downsample_data(signal, SAMPLE_RATE, bar_ms), iterations, warmup=2)
+        result.update(case="downsample_data", signal="pink_noise", bar_ms=bar_ms, seconds=SIGNAL_SECONDS)
+        results.append(result)
+        result = measure(lambda: analyzer.split_into_ms_chunks(signal, SAMPLE_RATE, bar_ms), iterations, warmup=2)
+        result.update(case="split_into_ms_chunks", signal="pink_noise", chunk_ms=bar_ms, seconds=SIGNAL_SECONDS)
+        results.append(result)
+    return results
+
+
+def bench_latest_window(signals, iterations, window_sizes):
+    """AudioPlayerStream.get_latest_samples_window on a synthetic track, mixer sync disabled."""
+    try:
+        from audio_playback import AudioPlayerStream
+    except Exception as e:  # pygame/pydub missing or no SDL dummy driver
+        return [{"case": "get_latest_samples_window", "skipped": f"{type(e).__name__}: {e}"}]
+
+    results = []
+    for window_ms in window_sizes:
+        player = AudioPlayerStream()
+        player.audiowindow_duration_ms = window_ms
+        player._set_sample_rate(SAMPLE_RATE)
+        player.samples = signals["click_track"]
+        player.num_channels = 1
+        player.current_file = "<synthetic>"
+        player.mixer_sync_interval_s = float("inf")  # nothing is playing through the mixer
+        player.clock.start(0.0)
+        result = measure(player.get_latest_samples_window, iterations)
+        result.update(case="get_latest_samples_window", window_ms=window_ms)
+        results.append(with_headroom(result, window_ms))
+    return results
+
+
+### Reporting ###
+
+def case_key(result):
+    return tuple(sorted((k, v) for k, v in result.items()
+                        if k in ("case", "signal", "window_ms", "bands", "bar_ms", "chunk_ms",
+                                 "window", "hop")))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50 changes against a previous run; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"] if "p50_us" in r}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (regression threshold {threshold:.0%}):")
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None or "p50_us" not in result:
+            continue
+        change = result["p50_us"] / old["p50_us"] - 1 if old["p50_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        label = " ".join(f"{k}={v}" for k, v in case_key(result) if k != "case")
+        print(f"  {result['case']:<26} {label:<40} {old['p50_us']:>10.1f} -> {result['p50_us']:>10.1f} us ({change:+.1%}){flag}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'case':<26} {'params':<40} {'p50 us':>9} {'p99 us':>9} {'alloc B':>9} {'headroom':>9} {'cpu ms/s':>9}")
+    for result in results:
+        label = " ".join(f"{k}={v}" for k, v in case_key(result) if k != "case")
+        if "skipped" in result:
+            print(f"{result['case']:<26} skipped: {result['skipped']}")
+            continue
+        headroom = result.get("headroom_x")
+        cpu = result.get("cpu_ms_per_audio_s")
+        print(f"{result['case']:<26} {label:<40} {result['p50_us']:>9.1f} {result['p99_us']:>9.1f} "
+              f"{result['alloc_bytes_per_call']:>9} {headroom if headroom is not None else '':>9} "
+              f"{cpu if cpu is not None else '':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audio analysis hot path on synthetic signals.")
+    parser.add_argument("--output", default="bench_analysis.json", help="JSON results path")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per realtime case")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, 20 ms windows and 8 bands only")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    iterations = 300 if args.quick else args.iterations
+    window_sizes = (20,) if args.quick else WINDOW_SIZES_MS
+    band_counts = (8,) if args.quick else BAND_COUNTS
+
+    signals = {name: make() for name, make in SIGNALS.items()}
+
+    results = []
+    results += bench_band_energies(signals, iterations, window_sizes, band_counts)
+    results += bench_sliding_bands(signals, iterations, band_counts)
+    results += bench_ema(iterations, band_counts)
+    results += bench_waveform(signals, max(5, iterations // 100))
+    results += bench_latest_window(signals, iterations, window_sizes)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "sample_rate": SAMPLE_RATE,
+            "signal_seconds": SIGNAL_SECONDS,
+            "click_bpm": CLICK_BPM,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_table(results)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+'''
+Precomputed band energies for a track (written by analyze_track.py).
+
+An EnergyTimeline saved next to a track as <name>.energies.npz is picked up when
+the track is loaded; the analysis worker then looks band energies up by playback
+position instead of running an FFT per frame.
+'''
+import os
+
+import numpy as np
+
+
+def timeline_path(track_path):
+    """Where the timeline for a track is looked for: next to it, as <name>.energies.npz."""
+    return os.path.splitext(track_path)[0] + ".energies.npz"
+
+
+class EnergyTimeline:
+    """Precomputed band energies, looked up by playback position instead of running FFTs."""
+
+    def __init__(self, energies, hop_ms, sample_rate, low_pass_cutoff):
+        self.energies = energies
+        self.hop_ms = hop_ms
+        self.sample_rate = sample_rate
+        self.low_pass_cutoff = low_pass_cutoff
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["energies"], float(data["hop_ms"]), int(data["sample_rate"]), float(data["low_pass_cutoff"]))
+
+    @classmethod
+    def load_for_track(cls, track_path, num_bands, sample_rate, hop_ms):
+        """
+        Load the timeline saved next to a track, if it fits the current analysis.
+
+        Returns:
+            EnergyTimeline or None: None if there is no timeline or it was computed
+            with a different band count, sample rate or window length.
+        """
+        path = timeline_path(track_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            timeline = cls.load(path)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[TIMELINE] Could not read {path}: {e}")
+            return None
+        if (timeline.energies.ndim != 2 or timeline.energies.shape[1] != num_bands
+                or timeline.sample_rate != sample_rate or timeline.hop_ms != hop_ms):
+            print(f"[TIMELINE] Ignoring {path}: computed for different analysis settings")
+            return None
+        print(f"[TIMELINE] Playing back {len(timeline.energies)} precomputed frames from {path}")
+        return timeline
+
+    def save(self, path):
+        np.savez(path, energies=self.energies, hop_ms=self.hop_ms, sample_rate=self.sample_rate,
+                 low_pass_cutoff=self.low_pass_cutoff)
+
+    def frame_at(self, position_ms):
+        """Band energies for the window containing position_ms (None past the end)."""
+        index = int(position_ms // self.hop_ms)
+        if index < 0 or index >= len(self.energies):
+            return None
+        return self.energies[index]
@@ -0,0 +1,67 @@
+'''
+Publishes analysis frames to the RaveControllerApp for audio-reactive streaming.
+
+Frames are sent as UDP datagrams to the controller's StreamRelay, using the same
+MSG_BAND_FRAME layout as RaveControllerApp/wire_protocol.py, so the relay can
+forward them to binary clients untouched. UDP keeps the analysis thread from ever
+blocking on the controller; if the controller is not running frames are just lost.
+'''
+import socket
+import struct
+
+import numpy as np
+
+
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 6001
+
+# Must match wire_protocol.py
+PROTOCOL_VERSION = 1
+MSG_BAND_FRAME = 0x02
+_HEADER = struct.Struct("<HBB")
+_BAND_FRAME = struct.Struct("<IIfBB")
+
+
+class FramePublisher:
+    def __init__(self, num_bands, host=STREAM_HOST, port=STREAM_PORT, full_scale=16.0):
+        """
+        Args:
+            num_bands (int): Bands per frame.
+            host, port: Address of the controller's StreamRelay.
+            full_scale (float): Band energy mapped to level 255 (same scale as the visualizer bars).
+        """
+        self.address = (host, port)
+        self.full_scale = full_scale
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+        body_size = _BAND_FRAME.size + num_bands
+        self._packet = bytearray(_HEADER.size + body_size)
+        _HEADER.pack_into(self._packet, 0, body_size + 2, PROTOCOL_VERSION, MSG_BAND_FRAME)
+        self._levels_offset = _HEADER.size + _BAND_FRAME.size
+        self._levels = np.empty(num_bands)
+        self._level_bytes = np.empty(num_bands, dtype=np.uint8)
+        self.num_bands = num_bands
+
+        self.sent = 0
+        self.send_errors = 0
+
+    def publish(self, frame):
+        """Quantise and send one AnalysisFrame (reuses a preallocated packet buffer)."""
+        np.multiply(frame.bands, 255.0 / self.full_scale, out=self._levels)
+        np.clip(self._levels, 0, 255, out=self._levels)
+
+        _BAND_FRAME.pack_into(self._packet, _HEADER.size, frame.seq & 0xFFFFFFFF,
+                              int(frame.position_ms) & 0xFFFFFFFF, float(frame.bpm),
+                              min(255, int(frame.beat_phase * 256)), self.num_bands)
+        np.copyto(self._level_bytes, self._levels, casting="unsafe")
+        self._packet[self._levels_offset:] = self._level_bytes.data
+
+        try:
+            self.sock.sendto(self._packet, self.address)
+            self.sent += 1
+        except OSError:
+            self.send_errors += 1  # controller not listening, or socket buffer full
+
+    def close(self):
+        self.sock.close()
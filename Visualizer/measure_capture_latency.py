@@ -0,0 +1,176 @@
+'''
+End-to-end latency of the live capture path, without audio hardware.
+
+A WAV is replayed through WavInputStream (real-time pace, like a sound card) into
+AudioCaptureStream, and the real AnalysisWorker analyses it exactly as it would
+live input. Two latencies are measured against the time each sample reached the
+(fake) input:
+
+    pipeline  newest sample in the analysed window -> analysis frame published
+    onset     a kick in the audio -> first published frame whose low bands react
+
+The default input is a generated click track (kicks on silence at --bpm), so the
+kick positions are known. With --wav only the pipeline latency is reported.
+Capture counters (callbacks, input overflows, ring overruns) and the worker's late
+frames are included, along with the process CPU time per second of audio (the fake
+input's share is the same in every mode), and results can be written as JSON.
+
+Usage:
+    python measure_capture_latency.py
+    python measure_capture_latency.py --seconds 20 --blocksize 128 --period-ms 10 --output capture.json
+    python measure_capture_latency.py --hop 256   # overlapped analysis, 4096 window
+    python measure_capture_latency.py --wav my_set.wav
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from analysis_pipeline import AnalysisWorker
+from audio_analysis import AudioAnalyzer
+from audio_capture import AudioCaptureStream
+from tempo_tracker import StreamingTempoTracker
+
+
+SAMPLE_RATE = 44100
+NUM_BANDS = 8
+
+
+def write_click_wav(path, bpm, beats=16, sample_rate=SAMPLE_RATE):
+    """Stereo 16-bit WAV of decaying 60 Hz kicks on silence, a whole number of beats long."""
+    beat = int(round(60.0 / bpm * sample_rate))
+    signal = np.zeros(beat * beats, dtype=np.float32)
+    t = np.arange(int(0.08 * sample_rate)) / sample_rate
+    kick = np.sin(2 * np.pi * 60 * t) * np.exp(-t * 40)
+    for i in range(beats):
+        signal[i * beat:i * beat + len(kick)] = kick
+    pcm = (signal * 0.5 * 32767).astype("<i2")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.repeat(pcm, 2).tobytes())
+    return beat / sample_rate * 1000.0  # kick period in ms
+
+
+class FrameRecorder:
+    """Stands in for the FramePublisher: records every published frame into preallocated arrays."""
+
+    def __init__(self, capture, capacity):
+        self.capture = capture
+        self.timestamps = np.zeros(capacity)
+        self.positions_ms = np.zeros(capacity)
+        self.low_energy = np.zeros(capacity)
+        self.pipeline_ms = np.zeros(capacity)
+        self.count = 0
+
+    def publish(self, frame):
+        i = self.count
+        if i >= len(self.timestamps):
+            return
+        self.timestamps[i] = frame.timestamp
+        self.positions_ms[i] = frame.position_ms
+        self.low_energy[i] = frame.bands[:2].sum()
+        self.pipeline_ms[i] = (frame.timestamp - self.capture.capture_time(frame.position_ms)) * 1000
+        self.count = i + 1
+
+
+def onset_latencies(recorder, capture, kick_period_ms, warmup_ms):
+    """Latency from every kick reaching the input to the first frame that reacts to it."""
+    n = recorder.count
+    positions = recorder.positions_ms[:n]
+    energy = recorder.low_energy[:n]
+    threshold = 0.5 * (np.median(energy) + energy.max())
+
+    latencies = []
+    missed = 0
+    kick_ms = np.ceil(warmup_ms / kick_period_ms) * kick_period_ms
+    while kick_ms + kick_period_ms < positions[-1]:
+        window = np.flatnonzero((positions >= kick_ms) & (positions < kick_ms + kick_period_ms / 2))
+        hits = window[energy[window] > threshold]
+        if len(hits):
+            latencies.append((recorder.timestamps[hits[0]] - capture.capture_time(kick_ms)) * 1000)
+        else:
+            missed += 1
+        kick_ms += kick_period_ms
+    return np.array(latencies), missed
+
+
+def pct(values, p):
+    return round(float(np.percentile(values, p)), 3) if len(values) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure live-capture analysis latency with a fake input device.")
+    parser.add_argument("--wav", help="WAV to replay (default: generated click track)")
+    parser.add_argument("--bpm", type=float, default=128, help="click track tempo")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--blocksize", type=int, default=256, help="frames per input callback")
+    parser.add_argument("--period-ms", type=float, default=20, help="analysis period")
+    parser.add_argument("--hop", type=int, help="overlapped analysis hop in samples (4096 sample window)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    kick_period_ms = None
+    wav_path = args.wav
+    if wav_path is None:
+        wav_path = os.path.join(tempfile.mkdtemp(), "clicks.wav")
+        kick_period_ms = write_click_wav(wav_path, args.bpm)
+
+    capture = AudioCaptureStream(blocksize=args.blocksize, wav_file=wav_path)
+    analyzer = AudioAnalyzer(numbands=NUM_BANDS)
+    frame_rate = capture.sample_rate / args.hop if args.hop else 1000 / args.period_ms
+    tracker = StreamingTempoTracker(NUM_BANDS, frame_rate_hz=frame_rate)
+    recorder = FrameRecorder(capture, int(args.seconds * frame_rate) + 100)
+    worker = AnalysisWorker(capture, analyzer, tracker, NUM_BANDS, period_ms=args.period_ms, publisher=recorder,
+                            hop_samples=args.hop)
+    worker.ema_alpha = 1.0  # no smoothing, so the onset latency is the pipeline's own
+
+    capture.start()
+    time.sleep(capture.window_size / capture.sample_rate)  # first full window
+    cpu_started = time.process_time()
+    worker.start()
+    time.sleep(args.seconds)
+    worker.stop()
+    cpu_s = time.process_time() - cpu_started
+    capture.stop()
+
+    n = recorder.count
+    pipeline = recorder.pipeline_ms[:n]
+    result = {
+        "wav": args.wav or f"click track @ {args.bpm} BPM",
+        "blocksize": args.blocksize,
+        "block_ms": round(args.blocksize / capture.sample_rate * 1000, 3),
+        "period_ms": args.period_ms,
+        "hop": args.hop,
+        "frames": n,
+        "pipeline_p50_ms": pct(pipeline, 50),
+        "pipeline_p99_ms": pct(pipeline, 99),
+        "pipeline_max_ms": round(float(pipeline.max()), 3) if n else None,
+        "process_cpu_ms_per_s": round(cpu_s * 1000 / args.seconds, 3),
+        **capture.stats(),
+        **worker.stats(),
+    }
+    if kick_period_ms is not None and n:
+        onsets, missed = onset_latencies(recorder, capture, kick_period_ms, warmup_ms=500)
+        result.update({
+            "kicks": len(onsets) + missed,
+            "kicks_missed": missed,
+            "onset_p50_ms": pct(onsets, 50),
+            "onset_p99_ms": pct(onsets, 99),
+            "onset_max_ms": round(float(onsets.max()), 3) if len(onsets) else None,
+        })
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
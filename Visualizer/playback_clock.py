@@ -0,0 +1,109 @@
+'''
+Monotonic playback clock shared by the analysis and LED output paths.
+
+pygame.mixer.music.get_pos() is coarse, only counts time since the last play()
+call and knows nothing about seeks. PlaybackClock instead extrapolates the track
+position from time.perf_counter() and uses periodic mixer samples only to correct
+drift: small errors are slewed out gradually, large ones cause a hard resync.
+
+Positions are in milliseconds of track time and refer to what is audible, i.e.
+the mixer position minus the configured output latency.
+'''
+import threading
+import time
+
+
+class PlaybackClock:
+    def __init__(self, output_latency_ms=0.0, correction_gain=0.1, resync_threshold_ms=100.0, clock=time.perf_counter):
+        """
+        Args:
+            output_latency_ms (float): Delay between the mixer consuming audio and it being heard.
+            correction_gain (float): Fraction of the measured drift removed per mixer sample.
+            resync_threshold_ms (float): Drift above which the clock jumps instead of slewing.
+            clock (callable): Monotonic time source in seconds.
+        """
+        self.output_latency_ms = output_latency_ms
+        self.correction_gain = correction_gain
+        self.resync_threshold_ms = resync_threshold_ms
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self.running = False
+        self._base_position_ms = 0.0   # mixer-side track position at _base_time
+        self._base_time = clock()
+        self._mixer_offset_ms = 0.0    # track position where the mixer's get_pos() counts from
+        self.last_drift_ms = 0.0
+
+    def _raw_position_ms(self, now):
+        if not self.running:
+            return self._base_position_ms
+        return self._base_position_ms + (now - self._base_time) * 1000.0
+
+    def position_ms(self, now=None):
+        """Audible track position in milliseconds."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            position = self._raw_position_ms(now) - self.output_latency_ms
+        return max(0.0, position)
+
+    def to_time(self, position_ms):
+        """perf_counter time at which a track position will be audible (if playing)."""
+        with self._lock:
+            now = self.clock()
+            return now + (position_ms - (self._raw_position_ms(now) - self.output_latency_ms)) / 1000.0
+
+    def start(self, position_ms=0.0):
+        """Playback (re)started at position_ms; the mixer's get_pos() restarts from 0."""
+        with self._lock:
+            self._base_position_ms = position_ms
+            self._base_time = self.clock()
+            self._mixer_offset_ms = position_ms
+            self.running = True
+
+    def seek(self, position_ms):
+        """Jump to position_ms, keeping the running/paused state."""
+        with self._lock:
+            self._base_position_ms = position_ms
+            self._base_time = self.clock()
+            self._mixer_offset_ms = position_ms
+
+    def pause(self):
+        with self._lock:
+            now = self.clock()
+            self._base_position_ms = self._raw_position_ms(now)
+            self._base_time = now
+            self.running = False
+
+    def resume(self):
+        with self._lock:
+            self._base_time = self.clock()
+            self.running = True
+
+    def stop(self):
+        with self._lock:
+            self._base_position_ms = 0.0
+            self._base_time = self.clock()
+            self._mixer_offset_ms = 0.0
+            self.running = False
+
+    def observe_mixer(self, mixer_pos_ms):
+        """
+        Correct drift against a mixer position sample (pygame get_pos(), ms since play()).
+
+        Returns:
+            float: Measured drift in ms (positive means the mixer is ahead of the clock).
+        """
+        if mixer_pos_ms < 0:
+            return 0.0  # mixer not playing
+
+        with self._lock:
+            if not self.running:
+                return 0.0
+            now = self.clock()
+            drift = (self._mixer_offset_ms + mixer_pos_ms) - self._raw_position_ms(now)
+            if abs(drift) > self.resync_threshold_ms:
+                self._base_position_ms += drift
+            else:
+                self._base_position_ms += self.correction_gain * drift
+            self.last_drift_ms = drift
+        return drift
@@ -0,0 +1,149 @@
+'''
+Streaming tempo and beat-phase estimation from per-frame band energies.
+
+Replaces re-running librosa.beat.beat_track on a 15 s buffer. Every analysis frame:
+    1. onset strength = weighted positive change of the band energies (spectral flux)
+    2. a leaky autocorrelation of the onset envelope is updated for every candidate
+       beat period, costing O(number of lags) no matter how much history it covers
+    3. the strongest lag (with a tempo prior and parabolic refinement) gives BPM
+    4. a phase-locked loop advances beat phase and nudges it towards onsets
+'''
+import numpy as np
+
+
+class StreamingTempoTracker:
+    def __init__(self, num_bands, frame_rate_hz=50, min_bpm=70, max_bpm=180,
+                 history_seconds=8.0, prior_bpm=120, band_weights=None):
+        """
+        Args:
+            num_bands (int): Number of band energies per frame.
+            frame_rate_hz (float): Frames per second fed to update().
+            min_bpm, max_bpm (float): Tempo search range.
+            history_seconds (float): Time constant of the autocorrelation memory.
+            prior_bpm (float): Centre of the tempo prior, resolves half/double tempo.
+            band_weights (array-like, optional): Per-band onset weights, defaults to
+                emphasising the lower half of the bands (kick/bass).
+        """
+        self.num_bands = num_bands
+        self.min_bpm = min_bpm
+        self.max_bpm = max_bpm
+        self.history_seconds = history_seconds
+        self.prior_bpm = prior_bpm
+
+        if band_weights is None:
+            band_weights = np.ones(num_bands)
+            band_weights[:max(1, num_bands // 2)] = 2.0
+        self.band_weights = np.asarray(band_weights, dtype=np.float64)
+
+        self.prev_bands = np.zeros(num_bands)
+        self._flux = np.zeros(num_bands)
+        self.frame_rate_hz = None
+        self.set_frame_rate(frame_rate_hz)
+
+    def set_frame_rate(self, frame_rate_hz):
+        """
+        Change the rate update() is fed at, e.g. when the source sample rate or the
+        analysis mode changes. All lags are in frames, so this also forgets the history.
+        """
+        if frame_rate_hz == self.frame_rate_hz:
+            return
+        self.frame_rate_hz = frame_rate_hz
+        min_bpm, max_bpm = self.min_bpm, self.max_bpm
+
+        # Candidate beat periods in frames
+        self.min_lag = max(1, int(np.floor(60.0 * frame_rate_hz / max_bpm)))
+        self.max_lag = int(np.ceil(60.0 * frame_rate_hz / min_bpm))
+        self.lags = np.arange(self.min_lag, self.max_lag + 1)
+
+        lag_bpm = 60.0 * frame_rate_hz / self.lags
+        self.prior = np.exp(-0.5 * (np.log2(lag_bpm / self.prior_bpm) / 0.5) ** 2)
+
+        # Onset envelope ring buffer, only needs to reach back max_lag frames
+        self.history_len = self.max_lag + 1
+        self.onsets = np.zeros(self.history_len)
+        self.write_index = 0
+        self._lag_indices = np.empty(len(self.lags), dtype=np.intp)
+
+        self.decay = np.exp(-1.0 / (self.history_seconds * frame_rate_hz))
+        self.acf = np.zeros(len(self.lags))
+        self._scores = np.zeros(len(self.lags))
+        self.reset()
+
+    def onset_strength(self, band_energies):
+        """Weighted half-wave rectified difference from the previous frame."""
+        np.subtract(band_energies, self.prev_bands, out=self._flux)
+        np.maximum(self._flux, 0.0, out=self._flux)
+        self.prev_bands[:] = band_energies
+        return float(self._flux @ self.band_weights)
+
+    def update(self, band_energies):
+        """
+        Feed one frame of band energies.
+
+        Returns:
+            tuple: (bpm, beat_phase) after this frame.
+        """
+        onset = self.onset_strength(band_energies)
+        if self.frames_seen == 0:
+            onset = 0.0  # first frame has no previous frame to diff against
+        self.frames_seen += 1
+
+        self.onsets[self.write_index] = onset
+        np.subtract(self.write_index, self.lags, out=self._lag_indices)
+        np.remainder(self._lag_indices, self.history_len, out=self._lag_indices)
+
+        self.acf *= self.decay
+        self.acf += onset * self.onsets[self._lag_indices]
+        self.write_index = (self.write_index + 1) % self.history_len
+
+        self.onset_mean = self.decay * self.onset_mean + (1 - self.decay) * onset
+
+        if self.frames_seen > self.max_lag:
+            self.bpm = self._estimate_bpm()
+        self._advance_phase(onset)
+
+        return self.bpm, self.beat_phase
+
+    def _estimate_bpm(self):
+        np.multiply(self.acf, self.prior, out=self._scores)
+        best = int(np.argmax(self._scores))
+        if self._scores[best] <= 0:
+            return self.bpm
+
+        # Parabolic interpolation between neighbouring lags for sub-frame period
+        offset = 0.0
+        if 0 < best < len(self._scores) - 1:
+            left, centre, right = self._scores[best - 1:best + 2]
+            denom = left - 2 * centre + right
+            if denom != 0:
+                offset = 0.5 * (left - right) / denom
+
+        period = self.lags[best] + offset
+        return 60.0 * self.frame_rate_hz / period
+
+    def _advance_phase(self, onset, gain=0.1):
+        self.is_beat = False
+        if self.bpm <= 0:
+            return
+
+        self.beat_phase += self.bpm / (60.0 * self.frame_rate_hz)
+        if self.beat_phase >= 1.0:
+            self.beat_phase -= 1.0
+            self.is_beat = True
+
+        # Pull the phase towards strong onsets: error is distance from the nearest beat
+        if self.onset_mean > 0 and onset > 2 * self.onset_mean:
+            error = self.beat_phase - round(self.beat_phase)
+            self.beat_phase = (self.beat_phase - gain * error) % 1.0
+
+    def reset(self):
+        """Forget all history, e.g. when a new track starts."""
+        self.onsets[:] = 0
+        self.acf[:] = 0
+        self.prev_bands[:] = 0
+        self.onset_mean = 0.0
+        self.write_index = 0
+        self.bpm = 0.0
+        self.beat_phase = 0.0   # 0 at the beat, increasing to 1 at the next one
+        self.is_beat = False    # True on the frame where a beat was crossed
+        self.frames_seen = 0
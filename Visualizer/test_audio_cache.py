@@ -0,0 +1,135 @@
+'''
+Tests for DecodedAudioCache storing, evicting and sweeping decoded tracks.
+
+    python -m pytest test_audio_cache.py
+'''
+import os
+import time
+
+import numpy as np
+
+from audio_cache import DecodedAudioCache
+
+
+def make_track(tmp_path, name, content=b"mp3"):
+    path = tmp_path / "tracks" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def make_cache(tmp_path, max_bytes=10_000):
+    return DecodedAudioCache(tmp_path / "cache", max_bytes=max_bytes)
+
+
+def age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_store_then_load_round_trips(tmp_path):
+    cache = make_cache(tmp_path)
+    track = make_track(tmp_path, "a.mp3")
+    samples = np.linspace(-1, 1, 100, dtype=np.float32)
+    channels = np.stack([samples, -samples], axis=1)
+
+    assert cache.store(track, samples, 44100, 2, channels)
+    entry = cache.load(track, keep_channels=True)
+
+    assert entry["sample_rate"] == 44100
+    assert entry["num_channels"] == 2
+    np.testing.assert_array_equal(entry["samples"], samples)
+    np.testing.assert_array_equal(entry["channel_samples"], channels)
+
+
+def test_editing_the_track_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    track = make_track(tmp_path, "a.mp3")
+    cache.store(track, np.zeros(10), 44100, 1)
+
+    track.write_bytes(b"a different mp3")
+
+    assert cache.load(track) is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=1500)  # two 100 sample entries fit, three do not
+    old, recent, new = (make_track(tmp_path, f"{name}.mp3") for name in ("old", "recent", "new"))
+    cache.store(old, np.zeros(100), 44100, 1)
+    cache.store(recent, np.zeros(100), 44100, 1)
+    age(cache._paths(cache.cache_key(old))[0], 60)
+
+    cache.store(new, np.zeros(100), 44100, 1)
+
+    assert cache.load(old) is None
+    assert cache.load(recent) is not None
+    assert cache.load(new) is not None
+
+
+def test_oversized_track_is_not_cached_and_keeps_the_rest(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    small, huge = make_track(tmp_path, "small.mp3"), make_track(tmp_path, "huge.mp3")
+    cache.store(small, np.zeros(100), 44100, 1)
+
+    assert not cache.store(huge, np.zeros(1000), 44100, 1)
+
+    assert cache.load(huge) is None
+    assert cache.load(small) is not None
+
+
+def test_just_stored_entry_is_never_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=400)  # the samples fit, samples plus headers do not
+    track = make_track(tmp_path, "a.mp3")
+
+    assert cache.store(track, np.zeros(100), 44100, 1)
+
+    assert cache.load(track) is not None
+
+
+def test_stale_leftovers_are_swept(tmp_path):
+    cache = make_cache(tmp_path)
+    leftovers = [cache.cache_dir / name for name in ("dead.npy", "dead.ch.npy", "dead.tmp", "dead.json.tmp")]
+    for path in leftovers:
+        path.write_bytes(b"partial")
+        age(path, 3600)
+
+    cache.store(make_track(tmp_path, "a.mp3"), np.zeros(10), 44100, 1)
+
+    assert not any(path.exists() for path in leftovers)
+
+
+def test_fresh_leftovers_of_a_running_store_are_kept(tmp_path):
+    cache = make_cache(tmp_path)
+    in_progress = [cache.cache_dir / "other.npy", cache.cache_dir / "other.json.tmp"]
+    for path in in_progress:
+        path.write_bytes(b"partial")
+
+    cache.store(make_track(tmp_path, "a.mp3"), np.zeros(10), 44100, 1)
+
+    assert all(path.exists() for path in in_progress)
+
+
+def test_entries_skip_files_deleted_by_another_instance(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    track = make_track(tmp_path, "a.mp3")
+    cache.store(track, np.zeros(10), 44100, 1)
+    key = cache.cache_key(track)
+    header_path, mono_path, _ = cache._paths(key)
+
+    # Another instance evicts the entry between the directory listing and the stat calls
+    listed = list(cache.cache_dir.glob("*.json"))
+    header_path.unlink()
+    mono_path.unlink()
+    monkeypatch.setattr(type(cache.cache_dir), "glob", lambda self, pattern: iter(listed))
+
+    assert cache.entries() == []
+
+
+def test_clear_removes_everything(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(make_track(tmp_path, "a.mp3"), np.zeros(10), 44100, 1)
+    (cache.cache_dir / "dead.tmp").write_bytes(b"partial")
+
+    cache.clear()
+
+    assert list(cache.cache_dir.iterdir()) == []
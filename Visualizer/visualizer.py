@@ -1,7 +1,13 @@
 import tkinter as tk
 from tkinter import filedialog
 from audio_playback import AudioPlayerStream 
+from audio_cache import DecodedAudioCache
+from audio_capture import AudioCaptureStream
 from audio_analysis import AudioAnalyzer
+from tempo_tracker import StreamingTempoTracker
+from analysis_pipeline import AnalysisWorker, AnalysisFrame
+from energy_timeline import EnergyTimeline
+from frame_publisher import FramePublisher
 import numpy as np
 
 from enum import Enum
@@ -31,19 +37,42 @@ class AudioVisualizerApp:
         self.max_height_bars = 15
 
         # Visualizer Processing Params
-        self.vis_EMA_buffer =[0 for _ in range(self.num_freq_bands)]
         self.EMA_alpha = 0.75
 
         self.low_pass_cutoff = 15000
 
-        self.audio_player = AudioPlayerStream()
+        # Delay from the mixer to the speakers, subtracted from the playback clock
+        self.output_latency_ms = 0
+
+        self.audio_player = AudioPlayerStream(cache=DecodedAudioCache(), output_latency_ms=self.output_latency_ms)
         self.audio_analyzer = AudioAnalyzer(numbands = self.num_freq_bands)
 
-        #BPM Analysis
+        # Overlapped analysis: a 4096 sample window every 256 samples (~172 frames/s, fine bass bins,
+        # roughly 3x the CPU). Off keeps one audiowindow_duration_ms window per frame; toggled from the UI.
+        self.overlapped_analysis = False
+        self.analysis_hop_samples = 256
+        self.analysis_window_samples = 4096
+
+        #BPM Analysis (the worker sets the frame rate from the source and analysis mode)
         self.bpm = 0
-        self.seconds_to_store = 15
-        self.numframes_store = int(self.seconds_to_store * (1000 / self.audio_player.audiowindow_duration_ms))
-        self.energy_frame_counter = 0
+        self.tempo_tracker = StreamingTempoTracker(self.num_freq_bands)
+        self.displayed_bpm = None
+        self.beat_box_lit = False
+
+        # Stream every analysis frame to the RaveControllerApp (audio-reactive lights)
+        self.stream_to_lights = True
+        self.frame_publisher = FramePublisher(self.num_freq_bands) if self.stream_to_lights else None
+
+        # Analysis runs on its own thread, the UI only draws the newest frame
+        self.analysis_worker = AnalysisWorker(self.audio_player, self.audio_analyzer, self.tempo_tracker,
+                                              self.num_freq_bands, period_ms=self.audio_player.audiowindow_duration_ms,
+                                              publisher=self.frame_publisher,
+                                              hop_samples=self.analysis_hop_samples if self.overlapped_analysis else None,
+                                              window_samples=self.analysis_window_samples)
+        self.latest_frame = AnalysisFrame(self.num_freq_bands)
+
+        # Live input (DJ mixer line-in / microphone), replaces the player as the analysis source
+        self.audio_capture = None
 
         self.create_widgets()
 
@@ -61,13 +90,16 @@ class AudioVisualizerApp:
         self.stop_button = tk.Button(self.root, text="Stop", command=self.stop_audio, state=tk.DISABLED)
         self.stop_button.pack(pady=10)
 
+        self.line_in_button = tk.Button(self.root, text="Line In", command=self.toggle_line_in)
+        self.line_in_button.pack(pady=10)
+
         # Create a canvas for the grid
         grid_canvas_width = self.num_freq_bands * self.bin_width
         grid_canvas_height = self.max_height_bars * self.bin_height
         self.grid_canvas = tk.Canvas(self.root, width=grid_canvas_width, height=grid_canvas_height, bg="black")
         self.grid_canvas.pack(pady=10)
 
-        self.DrawVisualizer(None)
+        self.BuildVisualizerGrid()
 
         #BPM Counter
         # --- BPM Counter ---
@@ -100,28 +132,41 @@ class AudioVisualizerApp:
         self.low_pass_slider.set(self.low_pass_cutoff)  # Default cutoff frequency
         self.low_pass_slider.pack(pady=5)
 
+        # --- Overlapped Analysis Toggle ---
+        self.overlapped_var = tk.BooleanVar(value=self.overlapped_analysis)
+        self.overlapped_check = tk.Checkbutton(self.root, text="Overlapped analysis (fine bass bins)",
+                                               variable=self.overlapped_var, command=self.toggle_overlapped_analysis)
+        self.overlapped_check.pack(pady=5)
+
+    def toggle_overlapped_analysis(self):
+        """Switch between one window per frame and a sliding window every analysis_hop_samples."""
+        self.overlapped_analysis = self.overlapped_var.get()
+        self.analysis_worker.set_overlapped(self.analysis_hop_samples if self.overlapped_analysis else None)
+
     def update_ema_alpha(self, value):
         self.ema_alpha = float(value)
     
-    def DrawVisualizer(self,bands=None):
-        """Draw the visualizer grid on a canvas."""
-
-        self.grid_canvas.delete("all")  # Clear previous grid
+    def BuildVisualizerGrid(self):
+        """Create every grid cell and line once; DrawVisualizer only toggles cells afterwards."""
+        self.grid_canvas.delete("all")
 
         grid_canvas_width = self.num_freq_bands * self.bin_width
-        grid_canvas_height = self.max_height_bars * self.bin_height        
-
-        if bands is not None:
-            for i, band_height in enumerate(bands):
-                x = i * self.bin_width
-                y = grid_canvas_height - (band_height * self.bin_height)
-                bar_height = band_height * self.bin_height
-                for j in range(band_height):
-                    color = self.findRectableColor((band_height-j), self.max_height_bars)
-                    self.grid_canvas.create_rectangle(x, y + j * self.bin_height, x + self.bin_width, y + (j + 1) * self.bin_height, fill=color)
-        
+        grid_canvas_height = self.max_height_bars * self.bin_height
 
-        # Draw the grid lines
+        # cell_ids[band][row], row 0 is the bottom cell. A cell's colour depends only on its row.
+        self.cell_ids = []
+        for i in range(self.num_freq_bands):
+            x = i * self.bin_width
+            column = []
+            for row in range(self.max_height_bars):
+                y = grid_canvas_height - (row + 1) * self.bin_height
+                color = self.findRectableColor(row + 1, self.max_height_bars)
+                column.append(self.grid_canvas.create_rectangle(x, y, x + self.bin_width, y + self.bin_height,
+                                                                fill=color, state=tk.HIDDEN))
+            self.cell_ids.append(column)
+        self.drawn_bar_heights = [0] * self.num_freq_bands
+
+        # Draw the grid lines (created last so they stay on top of the cells)
         for i in range(self.num_freq_bands + 1):  # Vertical lines
             x = i * self.bin_width
             self.grid_canvas.create_line(x, 0, x, grid_canvas_height, fill="white")
@@ -130,6 +175,26 @@ class AudioVisualizerApp:
             y = j * self.bin_height
             self.grid_canvas.create_line(0, y, grid_canvas_width, y, fill="white")
 
+    def DrawVisualizer(self,bands=None):
+        """Update the visualizer grid, only touching cells whose lit state changed."""
+        if bands is None:
+            bands = [0] * self.num_freq_bands
+
+        for i, band_height in enumerate(bands):
+            band_height = int(band_height)
+            previous_height = self.drawn_bar_heights[i]
+            if band_height == previous_height:
+                continue
+
+            column = self.cell_ids[i]
+            if band_height > previous_height:
+                for row in range(previous_height, band_height):
+                    self.grid_canvas.itemconfig(column[row], state=tk.NORMAL)
+            else:
+                for row in range(band_height, previous_height):
+                    self.grid_canvas.itemconfig(column[row], state=tk.HIDDEN)
+            self.drawn_bar_heights[i] = band_height
+
 
     def findRectableColor(self, value, max_value):
         if value >= 0.8 * max_value:
@@ -150,6 +215,10 @@ class AudioVisualizerApp:
 
         if file_path:
             self.audio_player.load_audio(file_path)  # Load the audio file
+            # Band energies precomputed with analyze_track.py, if any, replace the per-frame FFT
+            self.audio_player.timeline = EnergyTimeline.load_for_track(
+                file_path, self.num_freq_bands, self.audio_player.sample_rate,
+                self.audio_player.audiowindow_duration_ms)
             self.play_button.config(state=tk.NORMAL)
             self.play_button.config(text="Play")
             self.is_playing = False
@@ -173,8 +242,7 @@ class AudioVisualizerApp:
 
         elif self.PlaybackState == PlaybackState.PLAYING:
             self.play_button.config(text="Pause")
-            self.main_visualizer_canvas.delete("all")
-            self.visualizer_running = False
+            self.stop_visualizer_loop()
             self.audio_player.pause()
             self.PlaybackState = PlaybackState.PAUSED
 
@@ -185,14 +253,52 @@ class AudioVisualizerApp:
         self.audio_player.stop()
         self.play_button.config(text="Play")  # Reset play button text
         self.stop_button.config(state=tk.DISABLED)  # Disable Stop button when stopped
-        self.visualizer_running = False
+        self.stop_visualizer_loop()
         self.PlaybackState = PlaybackState.STOPPED
 
+    def toggle_line_in(self):
+        """Analyse the live audio input instead of the loaded file, or switch back."""
+        if self.audio_capture is None:
+            if self.PlaybackState != PlaybackState.STOPPED:
+                self.stop_audio()
+            capture = AudioCaptureStream()
+            try:
+                capture.start()
+            except Exception as e:  # missing sounddevice or a PortAudio device error
+                print(f"[CAPTURE] Could not open the audio input: {e}")
+                return
+            self.audio_capture = capture
+            self.analysis_worker.audio_player = capture
+            self.line_in_button.config(text="Stop Line In")
+            self.play_button.config(state=tk.DISABLED)
+            self.start_visualizer_loop()
+        else:
+            self.stop_visualizer_loop()
+            self.audio_capture.stop()
+            self.audio_capture = None
+            self.analysis_worker.audio_player = self.audio_player
+            self.line_in_button.config(text="Line In")
+            if self.audio_player.is_loaded():
+                self.play_button.config(state=tk.NORMAL)
+
     def start_visualizer_loop(self):
         """Start the update loop for the visualizer."""
         self.visualizer_running = True
+        self.sync_analysis_settings()
+        self.analysis_worker.start()
         self.update_visualizer()
 
+    def stop_visualizer_loop(self):
+        """Stop drawing and the analysis thread, and report frame drops."""
+        self.visualizer_running = False
+        self.analysis_worker.stop()
+        print(f"[ANALYSIS] {self.analysis_worker.stats()}")
+
+    def sync_analysis_settings(self):
+        """Hand the slider values to the analysis thread."""
+        self.analysis_worker.low_pass_cutoff = self.low_pass_cutoff
+        self.analysis_worker.ema_alpha = self.EMA_alpha
+
     def scale_bar_heights(self, mag):
         
         return [min(int(m), self.max_height_bars) for m in mag]
@@ -210,34 +316,34 @@ class AudioVisualizerApp:
         """Periodic update function called by Tkinter's main loop."""
         if not self.visualizer_running:
             return
-    
 
-        # Get audio samples
-        raw_window_data = self.audio_player.get_latest_samples_window(self.audio_player.audio_segment,self.audio_player.sample_rate)
-        if raw_window_data is None or len(raw_window_data) == 0:
-            self.root.after(20, self.update_visualizer) 
-            return
-        
-        
-        # Analyze the audio data
-        freq_bands = self.audio_analyzer.get_fft_band_energies(raw_window_data, self.audio_player.sample_rate, self.low_pass_cutoff)
-        self.vis_EMA_buffer = self.audio_analyzer.EMA(freq_bands, self.vis_EMA_buffer, self.EMA_alpha)
-        normalized_bands = self.scale_with_exponent(self.vis_EMA_buffer)
-    
-        #BPM
-        self.energy_frame_counter += 1
+        self.sync_analysis_settings()
+
+        # Only draw when the analysis thread has published something new
+        frame = self.latest_frame
+        if self.analysis_worker.frames.read_latest(frame):
+            normalized_bands = self.scale_with_exponent(frame.bands)
 
-        # Update every time we refill buffer
-        if self.energy_frame_counter >= self.numframes_store:
-            print("FINDING BPM")
-            self.bpm = self.audio_analyzer.find_bpm_librosa(self.audio_player.get_last_x_seconds(self.seconds_to_store), self.audio_player.sample_rate)
-            print(f"BPM: {self.bpm}")
-            self.energy_frame_counter = 0
+            #BPM
+            self.bpm = frame.bpm
+            self.update_bpm_display(frame.beat_phase)
 
-        self.DrawVisualizer(normalized_bands)
+            self.DrawVisualizer(normalized_bands)
 
         self.root.after(20, self.update_visualizer)
 
+    def update_bpm_display(self, beat_phase):
+        """Show the tracked BPM and flash the colour box on each beat (only touching Tk on change)."""
+        rounded_bpm = int(round(self.bpm))
+        if rounded_bpm != self.displayed_bpm:
+            self.bpm_value_label.config(text=str(rounded_bpm))
+            self.displayed_bpm = rounded_bpm
+
+        lit = self.bpm > 0 and beat_phase < 0.2
+        if lit != self.beat_box_lit:
+            self.bpm_color_box.config(bg="red" if lit else "grey")
+            self.beat_box_lit = lit
+
     def DrawCanvasDetails(self,canvas):
         # Draw a white vertical line through the middle of the canvas
         width = int(canvas['width'])